@@ -5,7 +5,6 @@ import traceback
 import xml.etree.ElementTree as ET
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
-from functools import lru_cache
 from threading import Lock, Thread
 
 import cx_Oracle
@@ -21,6 +20,7 @@ from ratelimit import limits, sleep_and_retry
 from tenacity import retry, stop_after_attempt, wait_exponential
 
 from config import MYSQL_CONFIG, ORACLE_PASSWORD, ORACLE_SERVICE_NAME, ORACLE_USER
+from modules.tracking_cache import TrackingCache
 
 load_dotenv()
 
@@ -943,10 +943,21 @@ def get_metrics():
 def gerenciamento():
     return render_template("gerenciamento.html")
     
-@lru_cache(maxsize=500)
+# Cache das consultas à API com TTL pelo status (substitui o lru_cache, que nunca expirava)
+tracking_cache = TrackingCache(
+    max_entries=500,
+    ttls={'ENTREGUE': 24 * 3600, 'TRANSITO': 300, 'NAO_EXPEDIDO': 1800},
+    default_ttl=600
+)
+
 def cached_fetch_tracking_data(chave_nfe):
     """Versão em cache da função de consulta à API"""
-    return fetch_tracking_data(chave_nfe)
+    dados = tracking_cache.get(chave_nfe)
+    if dados is None:
+        dados = fetch_tracking_data(chave_nfe)
+        if dados is not None:
+            tracking_cache.set(chave_nfe, dados, determinar_status(dados.get('items')))
+    return dados
 
 @app.route('/healthcheck')
 def healthcheck():
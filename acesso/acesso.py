@@ -5,7 +5,16 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from flask import Blueprint, render_template, request, Flask, jsonify, redirect, url_for
 from modules.database import get_mysql_connection
 from modules.logger_config import logger
+from modules.tracking_cache import TrackingCache
+from modules.protecao_acesso import FiltroBloom, LimitadorPorIp
+from modules.status import resolver_status, get_mapa_status
+from modules.http_cache import gerar_etag, nao_modificado, com_validadores, resposta_304
+from modules.sse import resposta_sse, get_sse_stats, GRUPO_PUBLICO
+from modules import notificacoes
 import mysql.connector
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
 
 acesso_blueprint = Blueprint('acesso', __name__, template_folder='templates', static_folder='static')
@@ -25,132 +34,403 @@ def index():
     logger.debug("Rota / acessada - renderizando página inicial.")
     return render_template("rastreio.html")
 
+# Página pública de rastreio em uma única ida ao banco: o cabeçalho (token ->
+# NUM_NF, dados da NF e última atualização) sai de subconsultas escalares e o
+# histórico vem do LEFT JOIN, uma linha por evento (ou uma linha só com o
+# cabeçalho se a NF ainda não tiver eventos). Índices em
+# nfe_tracking_logger.garantir_indices_consulta_publica.
+_RASTREAMENTO_QUERY = """
+    SELECT
+        c.NUM_NF,
+        c.destinatario,
+        c.peso,
+        c.volumes,
+        c.ultima_atualizacao,
+        nl.codigo_ocorrencia,
+        o.DESCRICAO AS descricao_ocorrencia,
+        nc.DESCRICAO AS categoria_ocorrencia,
+        nl.descricao_completa,
+        nl.data_hora,
+        nl.status,
+        nl.cidade_ocorrencia,
+        nl.uf,
+        nl.dominio,
+        nl.filial,
+        nl.nome_recebedor,
+        nl.documento_recebedor
+    FROM (
+        SELECT
+            t.NUM_NF,
+            (SELECT n.NOME FROM transporte.nfe n WHERE n.NUM_NF = t.NUM_NF LIMIT 1) AS destinatario,
+            (SELECT n.PESO_BRT FROM transporte.nfe n WHERE n.NUM_NF = t.NUM_NF LIMIT 1) AS peso,
+            (SELECT n.QTD_VOLUMES FROM transporte.nfe n WHERE n.NUM_NF = t.NUM_NF LIMIT 1) AS volumes,
+            (SELECT MAX(s.updated_at) FROM transporte.nfe_status s WHERE s.NUM_NF = t.NUM_NF) AS ultima_atualizacao
+        FROM transporte.nfe_tokens t
+        WHERE t.token = %s
+        LIMIT 1
+    ) c
+    LEFT JOIN (
+        transporte.nfe_logs nl
+        JOIN transporte.ocorrencias o ON nl.codigo_ocorrencia = o.CODIGO_SSW
+        LEFT JOIN transporte.nfe_categorias nc ON o.categoria_id = nc.id
+    ) ON nl.NUM_NF = c.NUM_NF
+    ORDER BY nl.data_hora DESC
+"""
+
+_CAMPOS_CABECALHO = ('NUM_NF', 'destinatario', 'peso', 'volumes', 'ultima_atualizacao')
+
+# Cache das páginas de rastreio já montadas, por NUM_NF (tokens da mesma NF
+# compartilham a entrada). A entrada é descartada quando o agendador ou a tela
+# de status gravam eventos ou status da NF (notificacoes.NFE_ATUALIZADA), e o
+# cache todo quando o cadastro de ocorrências/categorias muda
+# (notificacoes.OCORRENCIAS_ALTERADAS); o TTL é só uma rede de segurança para
+# alterações feitas fora da aplicação. A chave é sempre
+# str(NUM_NF): o banco e os eventos publicados podem trazer o número como int.
+CACHE_MAX_ENTRADAS = 2000
+CACHE_TTLS = {'ENTREGUE': 3600}
+CACHE_TTL_PADRAO = 300
+
+_cache_rastreamento = TrackingCache(CACHE_MAX_ENTRADAS, CACHE_TTLS, CACHE_TTL_PADRAO)
+_nf_por_token = OrderedDict()  # token -> NUM_NF (não muda); LRU com no máximo CACHE_MAX_ENTRADAS
+_nf_por_token_lock = threading.Lock()
+_invalidacoes = 0  # Muda a cada invalidação; leituras concorrentes com uma invalidação não são guardadas
+_versao_mapa_cache = None  # Versão do mapa de categorias (parte da ETag) das páginas em cache
+_cache_stats = {'tokens_desconhecidos': 0, 'invalidacoes': 0, 'descartadas_por_concorrencia': 0}
+
+
+def _nf_do_token(token):
+    with _nf_por_token_lock:
+        num_nf = _nf_por_token.get(token)
+        if num_nf is not None:
+            _nf_por_token.move_to_end(token)
+        return num_nf
+
+
+def _lembrar_token(token, num_nf):
+    with _nf_por_token_lock:
+        _nf_por_token[token] = str(num_nf)
+        _nf_por_token.move_to_end(token)
+        while len(_nf_por_token) > CACHE_MAX_ENTRADAS:
+            _nf_por_token.popitem(last=False)
+
+
+def _invalidar_rastreamento(dados):
+    """Assinante de NFE_ATUALIZADA: descarta a página em cache da NF."""
+    global _invalidacoes
+    _invalidacoes += 1
+    _cache_stats['invalidacoes'] += 1
+    _cache_rastreamento.invalidate(str(dados['NUM_NF']))
+
+
+def _invalidar_todo_rastreamento(dados):
+    """Assinante de OCORRENCIAS_ALTERADAS: descarta todas as páginas em cache."""
+    global _invalidacoes
+    _invalidacoes += 1
+    _cache_stats['invalidacoes'] += 1
+    _cache_rastreamento.clear()
+
+
+def _sincronizar_versao_mapa():
+    """
+    Descarta as páginas em cache se a versão do mapa de categorias mudou: a
+    versão entra na ETag, que deve corresponder ao corpo servido do cache.
+    """
+    global _versao_mapa_cache
+    versao = get_mapa_status()['versao']
+    if versao != _versao_mapa_cache:
+        _invalidar_todo_rastreamento({})
+        _versao_mapa_cache = versao
+
+
+notificacoes.assinar(notificacoes.NFE_ATUALIZADA, _invalidar_rastreamento)
+notificacoes.assinar(notificacoes.OCORRENCIAS_ALTERADAS, _invalidar_todo_rastreamento)
+
+
+def _obter_rastreamento(token):
+    """
+    Dados da página de rastreio do token, do cache ou do banco; None se o
+    token não existir (tokens inválidos conhecidos não chegam ao banco).
+    """
+    _sincronizar_versao_mapa()
+    num_nf = _nf_do_token(token)
+    if num_nf is not None:
+        response_data = _cache_rastreamento.get(num_nf)
+        if response_data is not None:
+            return response_data
+    else:
+        _cache_stats['tokens_desconhecidos'] += 1
+        if _token_rejeitado(token):
+            return None
+
+    invalidacoes_antes = _invalidacoes
+    conn = get_mysql_connection()
+    try:
+        response_data = _buscar_rastreamento(conn, token)
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
+    if response_data:
+        _lembrar_token(token, response_data['NUM_NF'])
+        if _invalidacoes == invalidacoes_antes:
+            historico = response_data['historico_rastreamento']
+            status = resolver_status(historico[0]['codigo_ocorrencia']) if historico else None
+            _cache_rastreamento.set(str(response_data['NUM_NF']), response_data, status)
+        else:
+            _cache_stats['descartadas_por_concorrencia'] += 1
+    else:
+        _protecao_stats['invalidos_no_banco'] += 1
+        _cache_negativo.set(token, {}, None)
+    return response_data
+
+
+# Versão da página de um token sem montá-la: NUM_NF e a última atualização da
+# NF em nfe_status (mesmo valor de `ultima_atualizacao` da página), ambos
+# lidos só dos índices criados por garantir_indices_consulta_publica.
+_VERSAO_RASTREAMENTO_QUERY = """
+    SELECT
+        t.NUM_NF,
+        (SELECT MAX(s.updated_at) FROM transporte.nfe_status s WHERE s.NUM_NF = t.NUM_NF) AS ultima_atualizacao
+    FROM transporte.nfe_tokens t
+    WHERE t.token = %s
+    LIMIT 1
+"""
+
+
+def _etag_rastreamento(num_nf, ultima_atualizacao):
+    # Mesma versão do mapa com que o cache foi validado em _sincronizar_versao_mapa
+    return gerar_etag('acesso', num_nf, ultima_atualizacao.isoformat() if ultima_atualizacao else None,
+                      _versao_mapa_cache)
+
+
+def _ultima_atualizacao(response_data):
+    valor = response_data.get('ultima_atualizacao')
+    return datetime.fromisoformat(valor) if valor else None
+
+
+def _versao_rastreamento(token):
+    """(NUM_NF, ultima_atualizacao) do token, do cache ou com uma consulta leve; None se o token não existir."""
+    _sincronizar_versao_mapa()
+    num_nf = _nf_do_token(token)
+    if num_nf is not None:
+        response_data = _cache_rastreamento.get(num_nf)
+        if response_data is not None:
+            return response_data['NUM_NF'], _ultima_atualizacao(response_data)
+    elif _token_rejeitado(token):
+        return None
+
+    conn = get_mysql_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(_VERSAO_RASTREAMENTO_QUERY, (token,))
+            linha = cursor.fetchone()
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+    return (linha[0], linha[1]) if linha else None
+
+
+def get_cache_rastreamento_stats():
+    return {**_cache_rastreamento.stats(), **_cache_stats, 'tokens_conhecidos': len(_nf_por_token)}
+
+# Proteção contra tokens inválidos (varreduras): tokens recém-recusados ficam
+# num cache negativo e, com o filtro de Bloom ativo, tokens fora do filtro
+# (reconstruído periodicamente a partir de nfe_tokens e alimentado por
+# notificacoes.TOKEN_CRIADO) são recusados sem ir ao banco. Cada IP pode errar
+# no máximo TOKENS_INVALIDOS_POR_IP vezes por janela; depois recebe 429.
+# O IP é o do cliente informado pelo proxy reverso (X-Forwarded-For, ver
+# app.configure_waitress); requisições que chegam com o endereço do próprio
+# proxy não identificam o cliente e ficam fora do limite, para que um único
+# cliente não bloqueie todos os outros.
+CACHE_NEGATIVO_MAX_ENTRADAS = 20000
+CACHE_NEGATIVO_TTL = 60
+TOKENS_INVALIDOS_POR_IP = 20
+JANELA_TOKENS_INVALIDOS_SEGUNDOS = 300
+ENDERECOS_DO_PROXY = {'127.0.0.1', '::1', ''}  # REMOTE_ADDR sem X-Forwarded-For
+FILTRO_BLOOM_ATIVO = True
+FILTRO_BLOOM_RECONSTRUCAO_SEGUNDOS = 600
+FILTRO_BLOOM_FOLGA = 1.5  # Capacidade extra para os tokens criados entre reconstruções
+
+_cache_negativo = TrackingCache(CACHE_NEGATIVO_MAX_ENTRADAS, {}, CACHE_NEGATIVO_TTL)
+_limitador_ip = LimitadorPorIp(TOKENS_INVALIDOS_POR_IP, JANELA_TOKENS_INVALIDOS_SEGUNDOS)
+_filtro_bloom = None  # FiltroBloom atual; None até a primeira construção
+_filtro_lock = threading.Lock()
+_reconstrucao_lock = threading.Lock()
+_proxima_reconstrucao = 0.0
+_tokens_durante_reconstrucao = None  # Tokens criados durante uma reconstrução em andamento
+_protecao_stats = {'rejeitados_cache_negativo': 0, 'rejeitados_filtro_bloom': 0,
+                   'invalidos_no_banco': 0, 'reconstrucoes_filtro': 0, 'sem_ip_cliente': 0}
+
+
+def _reconstruir_filtro():
+    global _filtro_bloom, _tokens_durante_reconstrucao, _proxima_reconstrucao
+    conn = None
+    try:
+        with _filtro_lock:
+            _tokens_durante_reconstrucao = []
+        inicio = time.monotonic()
+        conn = get_mysql_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM transporte.nfe_tokens")
+        total = cursor.fetchone()[0]
+        filtro = FiltroBloom(int(max(total, 1000) * FILTRO_BLOOM_FOLGA))
+        cursor.execute("SELECT token FROM transporte.nfe_tokens WHERE token IS NOT NULL")
+        while True:
+            linhas = cursor.fetchmany(5000)
+            if not linhas:
+                break
+            filtro.update(linha[0] for linha in linhas)
+        cursor.close()
+        with _filtro_lock:
+            filtro.update(_tokens_durante_reconstrucao)
+            _filtro_bloom = filtro
+            _tokens_durante_reconstrucao = None
+        _protecao_stats['reconstrucoes_filtro'] += 1
+        logger.info(f"Filtro de tokens reconstruído: {filtro.stats()} em {time.monotonic() - inicio:.2f}s.")
+    except Exception as e:
+        with _filtro_lock:
+            _tokens_durante_reconstrucao = None
+        _proxima_reconstrucao = time.monotonic() + 60
+        logger.error(f"Erro ao reconstruir o filtro de tokens: {e}")
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+        _reconstrucao_lock.release()
+
+
+def _agendar_reconstrucao_filtro():
+    """Dispara a reconstrução do filtro em segundo plano quando vencida (ou quando o filtro lotou)."""
+    global _proxima_reconstrucao
+    filtro = _filtro_bloom
+    if not FILTRO_BLOOM_ATIVO:
+        return
+    if time.monotonic() < _proxima_reconstrucao and not (filtro and filtro.elementos > filtro.capacidade):
+        return
+    if _reconstrucao_lock.acquire(blocking=False):
+        _proxima_reconstrucao = time.monotonic() + FILTRO_BLOOM_RECONSTRUCAO_SEGUNDOS
+        threading.Thread(target=_reconstruir_filtro, daemon=True, name="filtro-tokens").start()
+
+
+def _registrar_token_criado(dados):
+    """Assinante de TOKEN_CRIADO: o token passa a ser aceito imediatamente."""
+    with _filtro_lock:
+        if _filtro_bloom is not None:
+            _filtro_bloom.add(dados['token'])
+        if _tokens_durante_reconstrucao is not None:
+            _tokens_durante_reconstrucao.append(dados['token'])
+    _cache_negativo.invalidate(dados['token'])
+
+
+notificacoes.assinar(notificacoes.TOKEN_CRIADO, _registrar_token_criado)
+
+
+def _token_rejeitado(token):
+    """True se o token é certamente inválido sem consultar o banco."""
+    _agendar_reconstrucao_filtro()
+    if _cache_negativo.get(token) is not None:
+        _protecao_stats['rejeitados_cache_negativo'] += 1
+        return True
+    filtro = _filtro_bloom
+    if filtro is not None and token not in filtro:
+        _protecao_stats['rejeitados_filtro_bloom'] += 1
+        return True
+    return False
+
+
+def _ip_cliente():
+    """IP do cliente, ou None se a requisição só traz o endereço do proxy."""
+    ip = request.remote_addr or ''
+    if ip in ENDERECOS_DO_PROXY:
+        _protecao_stats['sem_ip_cliente'] += 1
+        return None
+    return ip
+
+
+def _segundos_bloqueado():
+    """Segundos que o IP da requisição ainda deve esperar (0 se pode continuar)."""
+    ip = _ip_cliente()
+    return _limitador_ip.segundos_bloqueado(ip) if ip is not None else 0.0
+
+
+def _registrar_token_invalido(token):
+    ip = _ip_cliente()
+    if ip is not None:
+        _limitador_ip.registrar(ip)
+    logger.warning(f"Token '{token}' não encontrado na base de dados.")
+
+
+def _resposta_bloqueada(espera):
+    return render_template("erro.html", mensagem="Muitas tentativas com tokens inválidos. Tente novamente mais tarde."), \
+        429, {"Retry-After": str(int(espera) + 1)}
+
+
+def get_protecao_stats():
+    filtro = _filtro_bloom
+    return {
+        **_protecao_stats,
+        'cache_negativo': _cache_negativo.stats(),
+        'limitador_ip': _limitador_ip.stats(),
+        'filtro_bloom': filtro.stats() if filtro else None,
+    }
+
+
+def _buscar_rastreamento(conn, token):
+    """
+    Monta os dados da página de rastreio do token com uma única consulta.
+
+    Returns:
+        Dicionário com NUM_NF, historico_rastreamento, status, destinatário,
+        peso, volumes e ultima_atualizacao; None se o token não existir.
+    """
+    with conn.cursor(dictionary=True) as cursor:
+        cursor.execute(_RASTREAMENTO_QUERY, (token,))
+        linhas = cursor.fetchall()
+    if not linhas:
+        return None
+
+    cabecalho = linhas[0]
+    response_data = {
+        'NUM_NF': cabecalho['NUM_NF'],
+        'destinatario': cabecalho['destinatario'],
+        'peso': cabecalho['peso'],
+        'volumes': cabecalho['volumes'],
+        'ultima_atualizacao': cabecalho['ultima_atualizacao'].isoformat() if cabecalho['ultima_atualizacao'] else None,
+    }
+
+    historico = []
+    for linha in linhas:
+        if linha['codigo_ocorrencia'] is None:
+            continue  # NF sem eventos: só a linha do cabeçalho
+        item = {campo: valor for campo, valor in linha.items() if campo not in _CAMPOS_CABECALHO}
+        if isinstance(item['data_hora'], datetime):
+            item['data_hora'] = item['data_hora'].strftime('%Y-%m-%dT%H:%M:%S')
+        historico.append(item)
+    response_data['historico_rastreamento'] = historico
+
+    # Determinar status da remessa de forma dinâmica
+    response_data['status_description'], response_data['status_class'] = determinar_status_dinamico(historico)
+    return response_data
+
 @acesso_blueprint.route("/acesso")
 def rastreio_token():
-    logger.info("Rota /acesso acessada.")
     token = request.args.get('chave')
-    logger.debug(f"Parâmetro recebido - chave: {token}")
 
     if not token:
         logger.warning("Requisição para /acesso sem o parâmetro 'chave'.")
         return render_template("erro.html", mensagem="URL inválida: parâmetro 'chave' não encontrado.")
 
-    conn = None
+    espera = _segundos_bloqueado()
+    if espera:
+        return _resposta_bloqueada(espera)
+
     try:
-        logger.info("Tentando conectar ao banco de dados...")
-        conn = get_mysql_connection()
-        logger.info("Conexão com o banco de dados estabelecida com sucesso.")
-        cursor = conn.cursor(dictionary=True)
+        response_data = _obter_rastreamento(token)
 
-        # Consulta para obter o NUM_NF
-        query_token = "SELECT NUM_NF FROM transporte.nfe_tokens WHERE token = %s"
-        params_token = (token,)
-        logger.debug(f"Executando query_token: {query_token} | Parâmetros: {params_token}")
-        try:
-            cursor.execute(query_token, params_token)
-            result_token = cursor.fetchone()
-            logger.debug(f"Resultado da query_token: {result_token}")
-        except mysql.connector.Error as err:
-            logger.error(f"Erro ao executar query (token): {err}")
-            raise
-
-        if result_token:
-            num_nf = result_token['NUM_NF']
-            logger.info(f"Token válido. NUM_NF encontrado: {num_nf}")
-            response_data = {'NUM_NF': num_nf}
-
-            # Histórico de rastreamento
-            with conn.cursor(dictionary=True) as cursor_logs:
-                query_logs = """
-                    SELECT
-                        nl.codigo_ocorrencia,
-                        o.DESCRICAO AS descricao_ocorrencia,
-                        nc.DESCRICAO AS categoria_ocorrencia,
-                        nl.descricao_completa,
-                        nl.data_hora,
-                        nl.status,
-                        nl.cidade_ocorrencia,
-                        nl.uf,
-                        nl.dominio,
-                        nl.filial,
-                        nl.nome_recebedor,
-                        nl.documento_recebedor
-                    FROM transporte.nfe_logs nl
-                    JOIN transporte.ocorrencias o ON nl.codigo_ocorrencia = o.CODIGO_SSW
-                    LEFT JOIN transporte.nfe_categorias nc ON o.categoria_id = nc.id
-                    WHERE nl.NUM_NF = %s
-                    ORDER BY nl.data_hora DESC
-                """
-                params_logs = (num_nf,)
-                logger.debug(f"Executando query_logs: {query_logs} | Parâmetros: {params_logs}")
-                try:
-                    cursor_logs.execute(query_logs, params_logs)
-                    historico = cursor_logs.fetchall()
-                    logger.debug(f"Resultado da query_logs: {historico}")
-                    for item in historico:
-                        if 'data_hora' in item and isinstance(item['data_hora'], datetime):
-                            item['data_hora'] = item['data_hora'].strftime('%Y-%m-%dT%H:%M:%S')
-                    response_data['historico_rastreamento'] = historico
-
-                except mysql.connector.Error as err:
-                    logger.error(f"Erro ao executar query (nfe_logs): {err}")
-                    raise
-
-            # Determinar status da remessa de forma dinâmica
-            status_description, status_class = determinar_status_dinamico(historico)
-            response_data['status_description'] = status_description
-            response_data['status_class'] = status_class
-
-            # Informações adicionais da NF
-            with conn.cursor(dictionary=True) as cursor_nfe:
-                query_nfe = """
-                    SELECT NOME, PESO_BRT, QTD_VOLUMES
-                    FROM transporte.nfe
-                    WHERE NUM_NF = %s
-                    LIMIT 1
-                """
-                params_nfe = (num_nf,)
-                logger.debug(f"Executando query_nfe: {query_nfe} | Parâmetros: {params_nfe}")
-                try:
-                    cursor_nfe.execute(query_nfe, params_nfe)
-                    nfe_info = cursor_nfe.fetchone()
-                    logger.debug(f"Resultado da query_nfe: {nfe_info}")
-                    if nfe_info:
-                        response_data['destinatario'] = nfe_info.get('NOME')
-                        response_data['peso'] = nfe_info.get('PESO_BRT')
-                        response_data['volumes'] = nfe_info.get('QTD_VOLUMES')
-                except mysql.connector.Error as err:
-                    logger.error(f"Erro ao executar query (nfe): {err}")
-                    raise
-            
-            # Obter a data e hora da última atualização da tabela nfe_status
-            with conn.cursor(dictionary=True) as cursor_status:
-                query_status = """
-                    SELECT updated_at
-                    FROM transporte.nfe_status
-                    WHERE NUM_NF = %s
-                    ORDER BY updated_at DESC
-                    LIMIT 1
-                """
-                params_status = (num_nf,)
-                logger.debug(f"Executando query_status: {query_status} | Parâmetros: {params_status}")
-                try:
-                    cursor_status.execute(query_status, params_status)
-                    status_info = cursor_status.fetchone()
-                    logger.debug(f"Resultado da query_status: {status_info}")
-                    if status_info and status_info.get('updated_at'):
-                        response_data['ultima_atualizacao'] = status_info['updated_at'].isoformat()
-                    else:
-                        response_data['ultima_atualizacao'] = None  # Ou algum valor padrão, se preferir
-                except mysql.connector.Error as err:
-                    logger.error(f"Erro ao executar query (nfe_status): {err}")
-                    raise
-
-            logger.info(f"Renderizando página de acesso para NUM_NF: {num_nf}")
+        if response_data:
+            logger.info(f"Renderizando página de acesso para NUM_NF: {response_data['NUM_NF']}")
             return render_template("rastreio.html", rastreamento_data=response_data, datetime=datetime)
-
         else:
-            logger.warning(f"Token '{token}' não encontrado na base de dados.")
+            _registrar_token_invalido(token)
             return render_template("erro.html", mensagem="Token de acesso inválido.")
 
     except mysql.connector.Error as err:
@@ -159,115 +439,40 @@ def rastreio_token():
     except Exception as e:
         logger.error(f"Ocorreu um erro inesperado: {e}")
         return render_template("erro.html", mensagem="Ocorreu um erro inesperado.")
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
-            logger.info("Conexão com o banco de dados encerrada.")
 
 # Nova rota API para enviar os dados de rastreamento para o front-end em formato JSON
 @acesso_blueprint.route("/api/acesso")
 def api_rastreio():
-    logger.info("Rota /api/acesso acessada.")
     token = request.args.get('chave')
-    logger.debug(f"Parâmetro recebido - chave: {token}")
 
     if not token:
         logger.warning("Requisição para /api/acesso sem o parâmetro 'chave'.")
         return jsonify({"erro": "URL inválida: parâmetro 'chave' não encontrado."}), 400
 
-    conn = None
-    try:
-        logger.info("Tentando conectar ao banco de dados...")
-        conn = get_mysql_connection()
-        logger.info("Conexão com o banco de dados estabelecida com sucesso.")
-        cursor = conn.cursor(dictionary=True)
-
-        # Consulta para obter o NUM_NF
-        query_token = "SELECT NUM_NF FROM transporte.nfe_tokens WHERE token = %s"
-        params_token = (token,)
-        logger.debug(f"Executando query_token: {query_token} | Parâmetros: {params_token}")
-        try:
-            cursor.execute(query_token, params_token)
-            result_token = cursor.fetchone()
-            logger.debug(f"Resultado da query_token: {result_token}")
-        except mysql.connector.Error as err:
-            logger.error(f"Erro ao executar query (token): {err}")
-            return jsonify({"erro": "Erro ao consultar token."}), 500
-
-        if result_token:
-            num_nf = result_token['NUM_NF']
-            logger.info(f"Token válido. NUM_NF encontrado: {num_nf}")
-            response_data = {'NUM_NF': num_nf}
-
-            # Histórico de rastreamento
-            with conn.cursor(dictionary=True) as cursor_logs:
-                query_logs = """
-                    SELECT
-                        nl.codigo_ocorrencia,
-                        o.DESCRICAO AS descricao_ocorrencia,
-                        nc.DESCRICAO AS categoria_ocorrencia,
-                        nl.descricao_completa,
-                        nl.data_hora,
-                        nl.status,
-                        nl.cidade_ocorrencia,
-                        nl.uf,
-                        nl.dominio,
-                        nl.filial,
-                        nl.nome_recebedor,
-                        nl.documento_recebedor
-                    FROM transporte.nfe_logs nl
-                    JOIN transporte.ocorrencias o ON nl.codigo_ocorrencia = o.CODIGO_SSW
-                    LEFT JOIN transporte.nfe_categorias nc ON o.categoria_id = nc.id
-                    WHERE nl.NUM_NF = %s
-                    ORDER BY nl.data_hora DESC
-                """
-                params_logs = (num_nf,)
-                logger.debug(f"Executando query_logs: {query_logs} | Parâmetros: {params_logs}")
-                try:
-                    cursor_logs.execute(query_logs, params_logs)
-                    historico = cursor_logs.fetchall()
-                    logger.debug(f"Resultado da query_logs: {historico}")
-                    for item in historico:
-                        if 'data_hora' in item and isinstance(item['data_hora'], datetime):
-                            item['data_hora'] = item['data_hora'].strftime('%Y-%m-%dT%H:%M:%S')
-                    response_data['historico_rastreamento'] = historico
-
-                    # Determinar status da remessa de forma dinâmica
-                    status_description, status_class = determinar_status_dinamico(historico)
-                    response_data['status_description'] = status_description
-                    response_data['status_class'] = status_class
-
-                except mysql.connector.Error as err:
-                    logger.error(f"Erro ao executar query (nfe_logs): {err}")
-                    return jsonify({"erro": "Erro ao consultar histórico de rastreamento."}), 500
-
-            # Informações adicionais da NF
-            with conn.cursor(dictionary=True) as cursor_nfe:
-                query_nfe = """
-                    SELECT NOME, PESO_BRT, QTD_VOLUMES
-                    FROM transporte.nfe
-                    WHERE NUM_NF = %s
-                    LIMIT 1
-                """
-                params_nfe = (num_nf,)
-                logger.debug(f"Executando query_nfe: {query_nfe} | Parâmetros: {params_nfe}")
-                try:
-                    cursor_nfe.execute(query_nfe, params_nfe)
-                    nfe_info = cursor_nfe.fetchone()
-                    logger.debug(f"Resultado da query_nfe: {nfe_info}")
-                    if nfe_info:
-                        response_data['destinatario'] = nfe_info.get('NOME')
-                        response_data['peso'] = nfe_info.get('PESO_BRT')
-                        response_data['volumes'] = nfe_info.get('QTD_VOLUMES')
-                except mysql.connector.Error as err:
-                    logger.error(f"Erro ao executar query (nfe): {err}")
-                    return jsonify({"erro": "Erro ao consultar informações da NF."}), 500
-
-            logger.info(f"Enviando dados de rastreamento para NUM_NF: {num_nf}")
-            return jsonify(response_data)
+    espera = _segundos_bloqueado()
+    if espera:
+        return jsonify({"erro": "Muitas tentativas com tokens inválidos. Tente novamente mais tarde."}), 429, \
+            {"Retry-After": str(int(espera) + 1)}
 
+    try:
+        # Requisição condicional: responde 304 antes de montar a página, se nada mudou
+        if request.if_none_match or request.if_modified_since:
+            versao = _versao_rastreamento(token)
+            if versao:
+                etag = _etag_rastreamento(*versao)
+                if nao_modificado(etag, versao[1]):
+                    return resposta_304(etag, versao[1])
+
+        response_data = _obter_rastreamento(token)
+
+        if response_data:
+            logger.info(f"Enviando dados de rastreamento para NUM_NF: {response_data['NUM_NF']}")
+            ultima_atualizacao = _ultima_atualizacao(response_data)
+            return com_validadores(jsonify(response_data),
+                                   _etag_rastreamento(response_data['NUM_NF'], ultima_atualizacao),
+                                   ultima_atualizacao)
         else:
-            logger.warning(f"Token '{token}' não encontrado na base de dados.")
+            _registrar_token_invalido(token)
             return jsonify({"erro": "Token de rastreio inválido."}), 404
 
     except mysql.connector.Error as err:
@@ -276,10 +481,43 @@ def api_rastreio():
     except Exception as e:
         logger.error(f"Ocorreu um erro inesperado: {e}")
         return jsonify({"erro": "Ocorreu um erro inesperado."}), 500
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
-            logger.info("Conexão com o banco de dados encerrada.")
+
+@acesso_blueprint.route("/api/acesso/eventos")
+def api_eventos():
+    """
+    Stream SSE da NF do token: um evento `nfe_atualizada` sempre que o
+    agendador gravar eventos ou status dela (a página então busca /api/acesso).
+    """
+    token = request.args.get('chave')
+    if not token:
+        return jsonify({"erro": "URL inválida: parâmetro 'chave' não encontrado."}), 400
+
+    espera = _segundos_bloqueado()
+    if espera:
+        return jsonify({"erro": "Muitas tentativas com tokens inválidos. Tente novamente mais tarde."}), 429, \
+            {"Retry-After": str(int(espera) + 1)}
+
+    try:
+        versao = _versao_rastreamento(token)
+    except mysql.connector.Error as err:
+        logger.critical(f"Erro ao conectar ou consultar o banco de dados (nível superior): {err}")
+        return jsonify({"erro": "Erro interno ao verificar o token."}), 500
+    if not versao:
+        _registrar_token_invalido(token)
+        return jsonify({"erro": "Token de rastreio inválido."}), 404
+
+    num_nf = str(versao[0])
+    return resposta_sse(notificacoes.NFE_ATUALIZADA, GRUPO_PUBLICO, lambda dados: str(dados['NUM_NF']) == num_nf)
+
+@acesso_blueprint.route("/api/acesso/metricas")
+def api_metricas():
+    """Métricas do cache de páginas de rastreio, da proteção contra tokens inválidos, do SSE e das notificações."""
+    return jsonify({
+        "cache": get_cache_rastreamento_stats(),
+        "protecao": get_protecao_stats(),
+        "sse": get_sse_stats(),
+        "notificacoes": notificacoes.get_notificacoes_stats(),
+    })
 
 @acesso_blueprint.route("/erro")
 def erro():
@@ -307,28 +545,23 @@ def verificar_token():
             logger.warning("Rota /verificar_token acessada sem o parâmetro 'token'.")
             return render_template("erro.html", mensagem="Por favor, insira um token.")
 
-        conn = None
+        espera = _segundos_bloqueado()
+        if espera:
+            return _resposta_bloqueada(espera)
+
         try:
-            conn = get_mysql_connection()
-            cursor = conn.cursor(dictionary=True)
-            query_token = "SELECT NUM_NF FROM transporte.nfe_tokens WHERE token = %s"
-            params_token = (token,)
-            cursor.execute(query_token, params_token)
-            result_token = cursor.fetchone()
-
-            if result_token:
+            # A consulta já deixa a página em cache para o redirecionamento
+            if _obter_rastreamento(token):
                 # Token válido, redireciona para a página de rastreio
                 return redirect(url_for('acesso.rastreio_token', chave=token))
             else:
                 # Token inválido, redireciona para a página de erro
+                _registrar_token_invalido(token)
                 return render_template("erro.html", mensagem="Token de acesso inválido.")
 
         except mysql.connector.Error as err:
             logger.error(f"Erro ao verificar token: {err}")
             return render_template("erro.html", mensagem="Erro ao verificar o token.")
-        finally:
-            if conn and conn.is_connected():
-                conn.close()
     else:  # Se for uma requisição GET
         return redirect(url_for('acesso.acesso_token'))  # Redireciona para o formulário
 
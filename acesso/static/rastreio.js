@@ -248,12 +248,16 @@ document.addEventListener("DOMContentLoaded", function () {
       });
     });
 
+  // Versão (ETag) dos dados exibidos, comparada pela consulta periódica
+  let versaoExibida = null;
+
   // Busca os dados dinamicamente através da API
    fetch(window.endpoints.rastreio + `?chave=${chave}`)
     .then((response) => {
       if (!response.ok) {
         throw new Error("Erro na requisição");
       }
+      versaoExibida = response.headers.get("ETag");
       return response.json();
     })
     .then((trackingData) => {
@@ -892,5 +896,70 @@ document.addEventListener("DOMContentLoaded", function () {
 
     return pdfContainer;
   }
+
+  // Atualizações em tempo real: quando o agendador grava eventos novos desta
+  // NF, a página é recarregada (a API responde do cache do servidor).
+  // Se o stream for recusado (503 quando as vagas do servidor estão ocupadas)
+  // ou não houver EventSource, consulta a API com intervalo crescente; o
+  // navegador revalida com If-None-Match e a resposta costuma ser um 304.
+  const INTERVALO_CONSULTA_MIN = 30000;
+  const INTERVALO_CONSULTA_MAX = 300000;
+
+  async function dadosAlterados() {
+    try {
+      const response = await fetch(
+        window.endpoints.rastreio + `?chave=${encodeURIComponent(chave)}`
+      );
+      const versao = response.headers.get("ETag");
+      return response.ok && versaoExibida !== null && versao !== versaoExibida;
+    } catch (error) {
+      console.error("Erro ao verificar atualizações:", error);
+      return false;
+    }
+  }
+
+  function consultarPeriodicamente(intervalo) {
+    setTimeout(async () => {
+      if (await dadosAlterados()) {
+        window.location.reload();
+        return;
+      }
+      const proximo = Math.min(intervalo * 2, INTERVALO_CONSULTA_MAX);
+      // Tenta o stream de novo; se ainda for recusado, volta a consultar com o novo intervalo
+      if (window.EventSource && window.endpoints.eventos) {
+        iniciarAtualizacoesTempoReal(proximo);
+      } else {
+        consultarPeriodicamente(proximo);
+      }
+    }, intervalo);
+  }
+
+  function iniciarAtualizacoesTempoReal(intervalo = INTERVALO_CONSULTA_MIN) {
+    if (!window.EventSource || !window.endpoints.eventos) {
+      consultarPeriodicamente(intervalo);
+      return;
+    }
+    const eventos = new EventSource(
+      window.endpoints.eventos + `?chave=${encodeURIComponent(chave)}`
+    );
+    let espera = intervalo;
+    eventos.onopen = () => {
+      espera = INTERVALO_CONSULTA_MIN; // Stream aceito: a próxima recusa recomeça do intervalo mínimo
+    };
+    eventos.addEventListener("nfe_atualizada", () => {
+      eventos.close();
+      window.location.reload();
+    });
+    eventos.onerror = () => {
+      // Conexão caída: o EventSource reconecta sozinho. Resposta não-200: fechado de vez
+      if (eventos.readyState === EventSource.CLOSED) {
+        consultarPeriodicamente(espera);
+      }
+    };
+  }
+
+  if (chave) {
+    iniciarAtualizacoesTempoReal();
+  }
   
 });
\ No newline at end of file
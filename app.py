@@ -6,6 +6,8 @@ from transportadoras.transportadoras import transportadoras_blueprint
 from acesso.acesso import acesso_blueprint
 from status.status import status_blueprint
 from modules.tasks import init_tasks, start_background_process
+from modules.static_assets import init_static_assets
+from modules.sse import init_sse, GRUPO_PAINEL, GRUPO_PUBLICO
 import logging
 import os
 from dotenv import load_dotenv
@@ -40,6 +42,9 @@ app.register_blueprint(transportadoras_blueprint, url_prefix='/transportadoras')
 app.register_blueprint(status_blueprint, url_prefix='/status')
 app.register_blueprint(acesso_blueprint, url_prefix='/acesso')
 
+# Arquivos estáticos pré-comprimidos em memória, com URLs versionadas pelo conteúdo
+init_static_assets(app)
+
 # Rota para favicon otimizada
 @app.route('/favicon.ico')
 def favicon():
@@ -50,6 +55,13 @@ def favicon():
     )
 
 # Configuração do Waitress otimizada
+def configure_sse():
+    """Vagas de streams SSE por grupo (cada uma prende uma thread do waitress enquanto aberta)."""
+    return {
+        GRUPO_PAINEL: int(os.environ.get('SSE_STREAMS_PAINEL', 4)),
+        GRUPO_PUBLICO: int(os.environ.get('SSE_STREAMS_PUBLICO', 16)),
+    }
+
 def configure_waitress():
     # Configurações baseadas no número de CPUs
     num_threads = int(os.environ.get('WAITRESS_THREADS', 4))  # Default 4 threads
@@ -58,14 +70,24 @@ def configure_waitress():
     return {
         'host': '127.0.0.1',  # Mais performático que '0.0.0.0'
         'port': 5000,
-        'threads': num_threads,
+        # Threads das requisições comuns + uma por vaga de stream SSE, que fica
+        # parada esperando eventos sem disputar as demais
+        'threads': num_threads + sum(configure_sse().values()),
         'channel_timeout': 60,
         'connection_limit': 1000,
         'asyncore_loop_timeout': 1,
-        'send_bytes': 4096,
+        # send_bytes fica no padrão (1): com um valor maior o waitress segura as
+        # saídas menores de uma resposta em andamento, e os eventos SSE (~150 B)
+        # só chegariam ao navegador quando o stream terminasse
         'outbuf_high_watermark': 16777216,  # 16MB
         #'inbuf_high_watermark': 16777216,   # 16MB
         'max_request_body_size': max_request_body_size,
+        # O waitress só escuta em loopback: toda requisição chega pelo proxy reverso
+        # local, que informa o IP do cliente em X-Forwarded-For (REMOTE_ADDR passa a
+        # ser o do cliente; usado, p.ex., pelo limite de tokens inválidos por IP)
+        'trusted_proxy': os.environ.get('WAITRESS_TRUSTED_PROXY', '127.0.0.1'),
+        'trusted_proxy_count': 1,
+        'trusted_proxy_headers': 'x-forwarded-for x-forwarded-proto',
         'clear_untrusted_proxy_headers': True
     }
 
@@ -84,6 +106,7 @@ def start_server():
     
     # Configura e inicia o Waitress
     waitress_config = configure_waitress()
+    init_sse(max_streams=configure_sse())
     logger.info(f"Iniciando Waitress com configuração: {waitress_config}")
     
     serve(app, **waitress_config)
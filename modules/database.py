@@ -3,8 +3,9 @@
 Este módulo fornece funcionalidades para estabelecer e gerenciar conexões
 com bancos de dados MySQL e Oracle.
 
-Ele inclui funções para inicializar as conexões, obter novas conexões
-com tratamento de retries para MySQL, e fechar as conexões de forma segura.
+Ele inclui funções para inicializar as conexões, obter conexões MySQL de um
+pool limitado (com tratamento de retries ao abrir conexões físicas), e fechar
+as conexões de forma segura.
 
 As configurações para os bancos de dados são carregadas a partir do módulo
 de configuração (config.py). O módulo também utiliza logging para registrar
@@ -13,7 +14,13 @@ informações sobre o status das conexões e quaisquer erros que ocorram.
 Funcionalidades principais:
 - Inicialização de conexões MySQL e Oracle.
 - Teste de conectividade durante a inicialização.
+- Pool de conexões MySQL com tamanho máximo, timeout de checkout, validação
+  no empréstimo, tempo de vida máximo e descarte de conexões ociosas.
+- Context manager `mysql_connection()` que devolve a conexão ao pool e faz
+  rollback automaticamente.
 - Obtenção de conexões MySQL com retry automático.
+- Pool de sessões Oracle (SessionPool homogêneo) com o schema definido uma
+  única vez por sessão física e estatísticas de uso.
 - Obtenção de conexões Oracle.
 - Fechamento seguro de conexões para ambos os tipos de banco de dados.
 - test_connections(): Testa as conexões com MySQL e/ou Oracle, conforme especificado.
@@ -26,11 +33,15 @@ pode ser usada para verificar a conectividade com bancos de dados específicos
 através de argumentos de linha de comando (-m para MySQL, -o para Oracle).
 Para ver a ajuda detalhada sobre o módulo, use o argumento -H ou --module-help.
 """
+import os
 import time
 import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
 import mysql.connector
 import cx_Oracle
-from typing import Optional, Union
+from typing import Optional, Union, Iterator
 from .config import MYSQL_CONFIG, ORACLE_PASSWORD, ORACLE_TNS_ALIAS, ORACLE_USER
 import argparse
 import sys
@@ -41,8 +52,270 @@ logger = logging.getLogger(__name__)
 _mysql_initialized = False
 _oracle_initialized = False
 
+# Configurações do pool de conexões MySQL (tempos em segundos)
+_config = {
+    'mysql_pool_size': 10,
+    'mysql_checkout_timeout': 10,
+    'mysql_max_lifetime': 1800,
+    'mysql_idle_timeout': 300,
+    'mysql_validation_interval': 30,
+    'mysql_reap_interval': 60,
+    'oracle_pool_min': 1,
+    'oracle_pool_max': 4,
+    'oracle_pool_increment': 1,
+    'oracle_pool_wait_timeout': 10000,  # milissegundos
+    'oracle_schema': 'FOCCO3I',
+}
+
+_mysql_pool = None
+_mysql_pool_lock = threading.Lock()
+
+_oracle_pool = None
+_oracle_pool_pid = None
+_oracle_pool_lock = threading.Lock()
+_oracle_stats = {
+    'aquisicoes': 0,
+    'esperas': 0,
+    'tempo_espera_total': 0.0,
+    'sessoes_inicializadas': 0,
+}
+
+
+class PooledMySQLConnection:
+    """
+    Conexão MySQL emprestada do pool.
+
+    Delega todos os atributos para a conexão física. `close()` não encerra a
+    conexão: faz rollback do que não foi commitado e a devolve ao pool, de
+    modo que o código existente (`conn.close()`, `close_connection(conn)`)
+    continua funcionando sem alterações.
+    """
+
+    def __init__(self, pool: "_MySQLPool", connection: mysql.connector.MySQLConnection, created_at: float):
+        self._pool = pool
+        self._cnx = connection
+        self._created_at = created_at
+        self._pid = os.getpid()
+
+    def __getattr__(self, name):
+        cnx = self.__dict__.get('_cnx')
+        if cnx is None:
+            raise mysql.connector.errors.OperationalError("Conexão MySQL já foi devolvida ao pool")
+        return getattr(cnx, name)
+
+    def is_connected(self) -> bool:
+        """
+        True enquanto a conexão não foi devolvida ao pool. Não consulta o
+        servidor: o padrão `if conn and conn.is_connected(): conn.close()`
+        precisa devolver ao pool também as conexões que caíram (o pool as
+        descarta em `release`).
+        """
+        return self._cnx is not None
+
+    def close(self):
+        """Devolve a conexão ao pool (idempotente)."""
+        cnx, self._cnx = self._cnx, None
+        if cnx is not None:
+            self._pool.release(cnx, self._created_at, self._pid)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class _MySQLPool:
+    """
+    Pool limitado de conexões MySQL.
+
+    - No máximo `pool_size` conexões físicas abertas (emprestadas + ociosas).
+    - `acquire()` espera até `checkout_timeout` segundos por uma conexão livre.
+    - Conexões ociosas há mais de `validation_interval` segundos são validadas
+      com ping antes de serem entregues.
+    - Conexões mais antigas que `max_lifetime` ou ociosas há mais de
+      `idle_timeout` são descartadas (verificação a cada `reap_interval`).
+    - Após um fork (o agendador roda em um `multiprocessing.Process`), as
+      conexões herdadas do processo pai são abandonadas sem serem fechadas,
+      pois o socket é compartilhado com o pai.
+    """
+
+    def __init__(self, pool_size: int, checkout_timeout: float, max_lifetime: float,
+                 idle_timeout: float, validation_interval: float, reap_interval: float):
+        self.pool_size = pool_size
+        self.checkout_timeout = checkout_timeout
+        self.max_lifetime = max_lifetime
+        self.idle_timeout = idle_timeout
+        self.validation_interval = validation_interval
+        self.reap_interval = reap_interval
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conexão, criada_em, devolvida_em); mais recente à direita
+        self._open = 0
+        self._pid = os.getpid()
+        self._inherited = []  # conexões herdadas num fork; mantidas para não serem fechadas pelo GC
+        self._last_reap = time.monotonic()
+        self._stats = {
+            'checkouts': 0,
+            'conexoes_criadas': 0,
+            'conexoes_descartadas': 0,
+            'validacoes_falhas': 0,
+            'esperas': 0,
+            'timeouts': 0,
+        }
+
+    def acquire(self, max_retries: int = 3, retry_delay: int = 1) -> PooledMySQLConnection:
+        deadline = time.monotonic() + self.checkout_timeout
+        waited = False
+        while True:
+            with self._cond:
+                self._check_fork()
+                self._reap_if_due()
+                if self._idle:
+                    candidate = self._idle.pop()
+                elif self._open < self.pool_size:
+                    self._open += 1
+                    candidate = None  # vaga reservada para uma nova conexão física
+                else:
+                    if not waited:
+                        waited = True
+                        self._stats['esperas'] += 1
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise RuntimeError(
+                            f"Timeout de {self.checkout_timeout}s aguardando conexão livre no pool MySQL "
+                            f"({self._open}/{self.pool_size} em uso)"
+                        )
+                    self._cond.wait(remaining)
+                    continue
+
+            if candidate is None:
+                try:
+                    cnx = _connect_mysql(max_retries, retry_delay)
+                except Exception:
+                    with self._cond:
+                        self._open -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._stats['conexoes_criadas'] += 1
+                    self._stats['checkouts'] += 1
+                return PooledMySQLConnection(self, cnx, time.monotonic())
+
+            cnx, created_at, returned_at = candidate
+            now = time.monotonic()
+            if now - created_at > self.max_lifetime:
+                self._discard(cnx)
+                continue
+            if now - returned_at > self.validation_interval and not self._validate(cnx):
+                with self._cond:
+                    self._stats['validacoes_falhas'] += 1
+                self._discard(cnx)
+                continue
+            with self._cond:
+                self._stats['checkouts'] += 1
+            return PooledMySQLConnection(self, cnx, created_at)
+
+    def release(self, cnx: mysql.connector.MySQLConnection, created_at: float, owner_pid: int):
+        if owner_pid != os.getpid():
+            # Conexão emprestada antes do fork; o socket pertence ao processo pai
+            return
+        try:
+            if cnx.unread_result:
+                cnx.consume_results()
+            # Sempre encerra a transação implícita: com autocommit=False uma
+            # conexão reaproveitada manteria o snapshot REPEATABLE READ antigo.
+            # O rollback (ou o ping, sem transação aberta) também confirma que a
+            # conexão está viva; as que caíram são descartadas, liberando a vaga.
+            if cnx.in_transaction:
+                cnx.rollback()
+            elif not self._validate(cnx):
+                raise mysql.connector.errors.OperationalError("conexão perdida")
+        except Exception as e:
+            logger.warning(f"Descartando conexão MySQL ao devolver ao pool: {str(e)}")
+            self._discard(cnx)
+            return
+
+        if time.monotonic() - created_at > self.max_lifetime:
+            self._discard(cnx)
+            return
+
+        with self._cond:
+            self._idle.append((cnx, created_at, time.monotonic()))
+            self._cond.notify()
+
+    def reap(self):
+        """Fecha conexões ociosas que excederam `idle_timeout` ou `max_lifetime`."""
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            self._check_fork()
+            keep = deque()
+            for item in self._idle:
+                cnx, created_at, returned_at = item
+                if now - returned_at > self.idle_timeout or now - created_at > self.max_lifetime:
+                    expired.append(cnx)
+                else:
+                    keep.append(item)
+            self._idle = keep
+            self._last_reap = now
+        for cnx in expired:
+            self._discard(cnx)
+        if expired:
+            logger.debug(f"{len(expired)} conexões MySQL ociosas removidas do pool")
+
+    def close_all(self):
+        with self._cond:
+            idle = [item[0] for item in self._idle]
+            self._idle.clear()
+        for cnx in idle:
+            self._discard(cnx)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'tamanho_maximo': self.pool_size,
+                'abertas': self._open,
+                'ociosas': len(self._idle),
+                'em_uso': self._open - len(self._idle),
+                **self._stats,
+            }
+
+    def _reap_if_due(self):
+        # Chamado com o lock adquirido; a remoção em si acontece fora do lock
+        if time.monotonic() - self._last_reap >= self.reap_interval:
+            self._last_reap = time.monotonic()
+            threading.Thread(target=self.reap, daemon=True).start()
+
+    def _check_fork(self):
+        # Chamado com o lock adquirido
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._inherited.extend(item[0] for item in self._idle)
+            self._idle.clear()
+            self._open = 0
+
+    def _validate(self, cnx: mysql.connector.MySQLConnection) -> bool:
+        try:
+            cnx.ping(reconnect=False)
+            return True
+        except mysql.connector.Error:
+            return False
+
+    def _discard(self, cnx: mysql.connector.MySQLConnection):
+        try:
+            cnx.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._open -= 1
+            self._stats['conexoes_descartadas'] += 1
+            self._cond.notify()
+
+
 # Tipo personalizado para conexões
-DBConnection = Union[mysql.connector.MySQLConnection, cx_Oracle.Connection]
+DBConnection = Union[mysql.connector.MySQLConnection, PooledMySQLConnection, cx_Oracle.Connection]
 
 def init_databases():
     """Inicializa e testa todas as conexões com bancos de dados"""
@@ -50,7 +323,7 @@ def init_databases():
     init_oracle()
 
 def init_mysql():
-    """Inicializa e testa a conexão com MySQL"""
+    """Inicializa o pool MySQL e testa a conexão (a conexão de teste fica ociosa no pool)"""
     global _mysql_initialized
 
     if _mysql_initialized:
@@ -59,15 +332,11 @@ def init_mysql():
     logger.info("🔧 Verificando conexão com MySQL...")
 
     try:
-        connection = mysql.connector.connect(
-            **MYSQL_CONFIG,
-            autocommit=False,
-            connect_timeout=5
-        )
+        connection = get_mysql_connection()
 
-        if connection.is_connected():
+        if connection and connection.is_connected():
             close_connection(connection)
-            logger.info("✅ Conexão com MySQL estabelecida!")
+            logger.info(f"✅ Conexão com MySQL estabelecida! Pool: {get_mysql_pool_stats()}")
             _mysql_initialized = True  # Definir como inicializado apenas se a conexão for bem-sucedida
         else:
             logger.error("❌ Falha na conexão com MySQL!")
@@ -77,6 +346,72 @@ def init_mysql():
         logger.error(f"Erro ao conectar ao MySQL: {str(e)}")
         raise RuntimeError(f"Não foi possível conectar ao MySQL: {str(e)}")
 
+def init_mysql_pool(pool_size: Optional[int] = None,
+                    checkout_timeout: Optional[float] = None,
+                    max_lifetime: Optional[float] = None,
+                    idle_timeout: Optional[float] = None,
+                    validation_interval: Optional[float] = None,
+                    reap_interval: Optional[float] = None):
+    """
+    Configura o pool de conexões MySQL. Deve ser chamada antes do primeiro uso;
+    se o pool já existir, as conexões ociosas são fechadas e ele é recriado.
+
+    Args:
+        pool_size: Número máximo de conexões físicas abertas.
+        checkout_timeout: Segundos aguardando uma conexão livre antes de RuntimeError.
+        max_lifetime: Idade máxima (s) de uma conexão física antes de ser reciclada.
+        idle_timeout: Tempo máximo (s) que uma conexão pode ficar ociosa no pool.
+        validation_interval: Conexões ociosas há mais tempo que isso (s) recebem
+                             ping antes de serem emprestadas (0 = sempre).
+        reap_interval: Intervalo mínimo (s) entre varreduras de conexões ociosas.
+    """
+    global _mysql_pool
+
+    options = {
+        'mysql_pool_size': pool_size,
+        'mysql_checkout_timeout': checkout_timeout,
+        'mysql_max_lifetime': max_lifetime,
+        'mysql_idle_timeout': idle_timeout,
+        'mysql_validation_interval': validation_interval,
+        'mysql_reap_interval': reap_interval,
+    }
+    for key, value in options.items():
+        if value is not None:
+            _config[key] = value
+
+    with _mysql_pool_lock:
+        old_pool, _mysql_pool = _mysql_pool, _create_mysql_pool()
+    if old_pool:
+        old_pool.close_all()
+    logger.info(f"Pool MySQL configurado: {_config}")
+
+def _create_mysql_pool() -> _MySQLPool:
+    return _MySQLPool(
+        pool_size=_config['mysql_pool_size'],
+        checkout_timeout=_config['mysql_checkout_timeout'],
+        max_lifetime=_config['mysql_max_lifetime'],
+        idle_timeout=_config['mysql_idle_timeout'],
+        validation_interval=_config['mysql_validation_interval'],
+        reap_interval=_config['mysql_reap_interval'],
+    )
+
+def _get_mysql_pool() -> _MySQLPool:
+    global _mysql_pool
+    if _mysql_pool is None:
+        with _mysql_pool_lock:
+            if _mysql_pool is None:
+                _mysql_pool = _create_mysql_pool()
+    return _mysql_pool
+
+def get_mysql_pool_stats() -> dict:
+    """Retorna contadores do pool MySQL (abertas, ociosas, em uso, esperas, timeouts...)"""
+    return _get_mysql_pool().stats()
+
+def close_mysql_pool():
+    """Fecha todas as conexões ociosas do pool MySQL"""
+    if _mysql_pool:
+        _mysql_pool.close_all()
+
 def init_oracle():
     """Inicializa e testa a conexão com Oracle"""
     global _oracle_initialized
@@ -88,14 +423,45 @@ def init_oracle():
     conn = get_oracle_connection()
     if conn:
         close_connection(conn)
-        logger.info("✅ Conexão com Oracle estabelecida!")
+        logger.info(f"✅ Conexão com Oracle estabelecida! Pool: {get_oracle_pool_stats()}")
         _oracle_initialized = True
     else:
         logger.error("❌ Falha na conexão com Oracle!")
         raise RuntimeError("Não foi possível conectar ao Oracle")
 
-def get_mysql_connection(max_retries: int = 3, retry_delay: int = 1) -> Optional[mysql.connector.MySQLConnection]:
-    """Estabelece conexão com MySQL com retry automático"""
+def get_mysql_connection(max_retries: int = 3, retry_delay: int = 1) -> Optional[PooledMySQLConnection]:
+    """
+    Empresta uma conexão do pool MySQL.
+
+    Uma nova conexão física só é aberta (com retry automático) quando não há
+    conexão ociosa e o pool ainda não atingiu o tamanho máximo. Chamar
+    `close()` na conexão retornada a devolve ao pool com rollback.
+    Prefira o context manager `mysql_connection()`.
+    """
+    return _get_mysql_pool().acquire(max_retries, retry_delay)
+
+@contextmanager
+def mysql_connection(max_retries: int = 3, retry_delay: int = 1) -> Iterator[PooledMySQLConnection]:
+    """
+    Context manager que empresta uma conexão do pool e a devolve ao final.
+
+    O que não for commitado dentro do bloco sofre rollback ao devolver a
+    conexão, inclusive quando o bloco termina com exceção.
+
+    Uso:
+        with mysql_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(...)
+            conn.commit()
+    """
+    conn = get_mysql_connection(max_retries, retry_delay)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+def _connect_mysql(max_retries: int = 3, retry_delay: int = 1) -> mysql.connector.MySQLConnection:
+    """Abre uma conexão física com MySQL com retry automático"""
 
     for attempt in range(max_retries):
         try:
@@ -114,29 +480,114 @@ def get_mysql_connection(max_retries: int = 3, retry_delay: int = 1) -> Optional
                 raise RuntimeError(f"Erro crítico: não foi possível conectar ao MySQL após {max_retries} tentativas. Último erro: {str(e)}")
             time.sleep(retry_delay)
 
-    return None
+    raise RuntimeError("Não foi possível conectar ao MySQL")
+
+def init_oracle_pool(min_sessions: Optional[int] = None,
+                     max_sessions: Optional[int] = None,
+                     increment: Optional[int] = None,
+                     wait_timeout: Optional[int] = None):
+    """
+    Configura o pool de sessões Oracle. Se o pool já existir, ele é fechado
+    e recriado com os novos parâmetros.
+
+    Args:
+        min_sessions: Sessões abertas na criação do pool (logon antecipado).
+        max_sessions: Máximo de sessões simultâneas.
+        increment: Quantas sessões abrir de uma vez quando o pool cresce.
+        wait_timeout: Tempo máximo (ms) aguardando uma sessão livre.
+    """
+    global _oracle_pool
+
+    options = {
+        'oracle_pool_min': min_sessions,
+        'oracle_pool_max': max_sessions,
+        'oracle_pool_increment': increment,
+        'oracle_pool_wait_timeout': wait_timeout,
+    }
+    for key, value in options.items():
+        if value is not None:
+            _config[key] = value
+
+    with _oracle_pool_lock:
+        old_pool, _oracle_pool = _oracle_pool, None
+    if old_pool and _oracle_pool_pid == os.getpid():
+        try:
+            old_pool.close(force=True)
+        except cx_Oracle.Error as e:
+            logger.warning(f"Erro ao fechar pool Oracle: {str(e)}")
+    logger.info(f"Pool Oracle configurado: min={_config['oracle_pool_min']}, "
+                f"max={_config['oracle_pool_max']}, increment={_config['oracle_pool_increment']}")
+
+def _init_oracle_session(connection: cx_Oracle.Connection, requested_tag: Optional[str]):
+    """Callback do SessionPool: executado apenas quando uma sessão física é criada"""
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER SESSION SET CURRENT_SCHEMA = {_config['oracle_schema']}")
+    with _oracle_pool_lock:
+        _oracle_stats['sessoes_inicializadas'] += 1
+
+def _get_oracle_pool() -> cx_Oracle.SessionPool:
+    global _oracle_pool, _oracle_pool_pid
+    with _oracle_pool_lock:
+        # Um pool criado antes de um fork não pode ser usado pelo processo filho
+        if _oracle_pool is None or _oracle_pool_pid != os.getpid():
+            _oracle_pool = cx_Oracle.SessionPool(
+                user=ORACLE_USER,
+                password=ORACLE_PASSWORD,
+                dsn=ORACLE_TNS_ALIAS,
+                min=_config['oracle_pool_min'],
+                max=_config['oracle_pool_max'],
+                increment=_config['oracle_pool_increment'],
+                homogeneous=True,
+                threaded=True,
+                getmode=cx_Oracle.SPOOL_ATTRVAL_TIMEDWAIT,
+                wait_timeout=_config['oracle_pool_wait_timeout'],
+                session_callback=_init_oracle_session,
+            )
+            _oracle_pool_pid = os.getpid()
+            logger.info("Pool de sessões Oracle criado")
+        return _oracle_pool
+
+def get_oracle_pool_stats() -> dict:
+    """Retorna estatísticas do pool Oracle (ocupadas/abertas/esperas) para dimensionamento"""
+    with _oracle_pool_lock:
+        pool = _oracle_pool if _oracle_pool_pid == os.getpid() else None
+        stats = dict(_oracle_stats)
+    stats.update({
+        'min': _config['oracle_pool_min'],
+        'max': _config['oracle_pool_max'],
+        'increment': _config['oracle_pool_increment'],
+        'ocupadas': pool.busy if pool else 0,
+        'abertas': pool.opened if pool else 0,
+    })
+    return stats
 
 def get_oracle_connection() -> Optional[cx_Oracle.Connection]:
-    """Estabelece conexão com Oracle Database"""
+    """
+    Obtém uma sessão Oracle do pool.
+
+    O `ALTER SESSION SET CURRENT_SCHEMA` é feito pelo callback do pool apenas
+    quando uma sessão física nova é aberta. `close_connection(conn)` devolve a
+    sessão ao pool.
+    """
     connection = None
     try:
-        connection = cx_Oracle.connect(
-            user=ORACLE_USER,
-            password=ORACLE_PASSWORD,
-            dsn=ORACLE_TNS_ALIAS
-        )
-        with connection.cursor() as cursor:
-            cursor.execute("ALTER SESSION SET CURRENT_SCHEMA = FOCCO3I")
-
-        logger.info("Conexão Oracle estabelecida")
+        pool = _get_oracle_pool()
+        busy_before = pool.busy
+        start = time.monotonic()
+        connection = pool.acquire()
+        elapsed = time.monotonic() - start
+        with _oracle_pool_lock:
+            _oracle_stats['aquisicoes'] += 1
+            if busy_before >= pool.max:
+                _oracle_stats['esperas'] += 1
+                _oracle_stats['tempo_espera_total'] += elapsed
+
+        logger.debug("Sessão Oracle obtida do pool")
         return connection
     except cx_Oracle.Error as e:
         logger.error(f"Erro ao conectar ao Oracle: {str(e)}")
     except Exception as e:
         logger.error(f"Erro inesperado ao conectar ao Oracle: {str(e)}")
-    finally:
-        if connection:
-            pass
     return connection
 
 def close_connection(connection: Optional[DBConnection]):
@@ -145,12 +596,16 @@ def close_connection(connection: Optional[DBConnection]):
         return
 
     try:
-        if isinstance(connection, mysql.connector.MySQLConnection) and connection.is_connected():
+        if isinstance(connection, PooledMySQLConnection):
+            connection.close()
+            logger.debug("Conexão MySQL devolvida ao pool")
+        elif isinstance(connection, mysql.connector.MySQLConnection) and connection.is_connected():
             connection.close()
             logger.debug("Conexão MySQL fechada com sucesso")
         elif isinstance(connection, cx_Oracle.Connection) and connection:
+            # Para sessões obtidas do pool, close() as devolve ao pool
             connection.close()
-            logger.debug("Conexão Oracle fechada com sucesso")
+            logger.debug("Conexão Oracle devolvida ao pool")
     except cx_Oracle.DatabaseError as e:
         logger.warning(f"Erro ao fechar conexão Oracle: {str(e)}")
     except mysql.connector.Error as e:
@@ -158,6 +613,62 @@ def close_connection(connection: Optional[DBConnection]):
     except Exception as e:
         logger.error(f"Erro inesperado ao fechar conexão: {str(e)}")
 
+def ensure_index(cursor, table: str, index_name: str, columns: str) -> bool:
+    """
+    Cria um índice caso a tabela ainda não tenha um índice com esse nome ou
+    um índice cujas colunas iniciais sejam as mesmas.
+
+    Args:
+        cursor: Cursor MySQL ativo.
+        table: Nome da tabela.
+        index_name: Nome do índice a criar.
+        columns: Colunas do índice, separadas por vírgula (ex.: "updated_at, chave_nfe").
+
+    Returns:
+        True se o índice foi criado, False se já existia um equivalente.
+    """
+    wanted = [c.strip().lower() for c in columns.split(",")]
+    cursor.execute("""
+        SELECT index_name, GROUP_CONCAT(column_name ORDER BY seq_in_index)
+        FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s
+        GROUP BY index_name
+    """, (table,))
+    for name, index_columns in cursor.fetchall():
+        if isinstance(index_columns, (bytes, bytearray)):
+            index_columns = index_columns.decode()
+        existing = [c.lower() for c in str(index_columns).split(",")]
+        if str(name).lower() == index_name.lower() or existing[:len(wanted)] == wanted:
+            return False
+
+    cursor.execute(f"CREATE INDEX {index_name} ON {table} ({columns})")
+    logger.info(f"Índice {index_name} criado em {table}({columns})")
+    return True
+
+def ensure_column(cursor, table: str, column: str, definition: str) -> bool:
+    """
+    Adiciona uma coluna caso a tabela ainda não a tenha.
+
+    Args:
+        cursor: Cursor MySQL ativo.
+        table: Nome da tabela.
+        column: Nome da coluna.
+        definition: Tipo e atributos da coluna (ex.: "DATETIME NULL").
+
+    Returns:
+        True se a coluna foi criada, False se já existia.
+    """
+    cursor.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+    """, (table, column))
+    if cursor.fetchall():
+        return False
+
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    logger.info(f"Coluna {column} criada em {table}")
+    return True
+
 def help_database_module():
     """Exibe informações de ajuda sobre o módulo database."""
     import inspect
@@ -177,9 +688,16 @@ def help_database_module():
         database.init_databases,
         database.init_mysql,
         database.init_oracle,
+        database.init_mysql_pool,
         database.get_mysql_connection,
+        database.mysql_connection,
+        database.get_mysql_pool_stats,
+        database.init_oracle_pool,
         database.get_oracle_connection,
+        database.get_oracle_pool_stats,
         database.close_connection,
+        database.ensure_index,
+        database.ensure_column,
         database.test_connections, # Adicionando a nova função à lista de ajuda
     ]
 
@@ -199,7 +717,8 @@ def help_database_module():
     print("- As configurações de conexão são carregadas do módulo 'config'.")
     print("- Utilize a função 'init_databases()' para inicializar as conexões.")
     print("- Utilize 'get_mysql_connection()' e 'get_oracle_connection()' para obter conexões.")
-    print("- Não se esqueça de fechar as conexões utilizando 'close_connection()'.")
+    print("- Conexões MySQL vêm de um pool: 'close_connection()' ou 'conn.close()' as devolvem ao pool.")
+    print("- Prefira 'with mysql_connection() as conn:' para devolução e rollback automáticos.")
     print("- A função 'test_connections()' permite testar a conectividade com bancos de dados específicos.")
     print("=" * 40)
 
@@ -239,6 +758,7 @@ def test_connections(test_mysql: bool = True, test_oracle: bool = True):
         if mysql_conn:
             print("✅ Conexão MySQL OK")
             close_connection(mysql_conn)
+            print(f"Pool MySQL: {get_mysql_pool_stats()}")
         else:
             print("❌ Falha na conexão MySQL")
 
@@ -248,6 +768,7 @@ def test_connections(test_mysql: bool = True, test_oracle: bool = True):
         if oracle_conn:
             print("✅ Conexão Oracle OK")
             close_connection(oracle_conn)
+            print(f"Pool Oracle: {get_oracle_pool_stats()}")
         else:
             print("⚠️ Conexão Oracle não configurada ou falhou")
 
@@ -0,0 +1,51 @@
+# modules/http_cache.py
+import hashlib
+from datetime import datetime, timezone
+from typing import Optional
+from flask import request, Response
+
+# Respostas condicionais (ETag / Last-Modified) para os endpoints JSON
+# consultados periodicamente. O fluxo típico numa rota:
+#
+#     etag = gerar_etag(num_nf, versao)
+#     if nao_modificado(etag, ultima_modificacao):
+#         return resposta_304(etag, ultima_modificacao)
+#     ...consulta pesada...
+#     return com_validadores(jsonify(dados), etag, ultima_modificacao)
+#
+# `Cache-Control: no-cache` faz o navegador revalidar a cada uso; o fetch()
+# envia If-None-Match sozinho e entrega o corpo guardado quando recebe 304.
+
+
+def gerar_etag(*partes) -> str:
+    """ETag a partir dos valores que identificam a versão do recurso."""
+    return hashlib.sha1(repr(partes).encode()).hexdigest()[:20]
+
+
+def _utc(momento: datetime) -> datetime:
+    # Datas do MySQL chegam sem fuso; são tratadas como UTC dos dois lados da comparação
+    if momento.tzinfo is None:
+        momento = momento.replace(tzinfo=timezone.utc)
+    return momento.replace(microsecond=0)
+
+
+def nao_modificado(etag: str, ultima_modificacao: Optional[datetime] = None) -> bool:
+    """True se o cliente já tem esta versão (If-None-Match, ou If-Modified-Since na ausência dele)."""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if ultima_modificacao is not None and request.if_modified_since is not None:
+        return _utc(ultima_modificacao) <= _utc(request.if_modified_since)
+    return False
+
+
+def com_validadores(resposta: Response, etag: str, ultima_modificacao: Optional[datetime] = None) -> Response:
+    """Adiciona ETag, Last-Modified e Cache-Control: no-cache à resposta."""
+    resposta.set_etag(etag)
+    if ultima_modificacao is not None:
+        resposta.last_modified = _utc(ultima_modificacao)
+    resposta.headers['Cache-Control'] = 'no-cache'
+    return resposta
+
+
+def resposta_304(etag: str, ultima_modificacao: Optional[datetime] = None) -> Response:
+    return com_validadores(Response(status=304), etag, ultima_modificacao)
@@ -1,42 +1,80 @@
 # modules/import_nfes.py
 import logging
+import time
+import argparse
 import cx_Oracle
 import mysql.connector
 from modules.database import get_mysql_connection, get_oracle_connection, close_connection
-from typing import Optional
+from modules.nfe_status_sync import notificar_novas_nfes
+from datetime import datetime
+from typing import Optional, Dict, List, Tuple
 
 logger = logging.getLogger(__name__)
 
 # Configurações do módulo
 _config = {
     'data_limite_oracle': '2025-01-01 00:00:00.000',
+    'batch_size': 1000,  # Linhas por fetchmany no Oracle e por INSERT multi-linha no MySQL
     'log_level': logging.INFO,  # Adicionando nível de log como configuração
     'log_format': '%(asctime)s - %(levelname)s - %(message)s', # Adicionando formato de log
     # Adicione outras configurações conforme necessário
 }
 
-def importar_nfes_oracle_mysql():
+_COLUNAS_NFE = (
+    "NUM_NF", "DT_SAIDA", "CLI_ID", "NOME", "CNPJ_CPF_CLI", "CIDADE", "UF", "VLR_TOTAL",
+    "PESO_BRT", "QTD_VOLUMES", "FORN_ID", "NOME_TRP", "CNPJ_CPF_TRP", "FORN_ID_RDP",
+    "NOME_TRP_RDP", "CUBAGEM", "CHAVE_ACESSO_NFEL", "OBS_CONF",
+)
+
+_IDX_CHAVE_ACESSO = _COLUNAS_NFE.index("CHAVE_ACESSO_NFEL")
+
+_INSERT_NFE_QUERY = f"""
+    INSERT INTO nfe ({", ".join(_COLUNAS_NFE)})
+    VALUES ({", ".join(["%s"] * len(_COLUNAS_NFE))})
+"""
+
+_CONTROLE_NOME = 'nfe_oracle'
+
+def importar_nfes_oracle_mysql(batch_size: Optional[int] = None,
+                               full_resync: bool = False) -> Dict[str, int]:
     """
     Importa dados da tabela TNFS_SAIDA do banco de dados Oracle para a tabela nfe
     do banco de dados MySQL, aplicando filtros e verificando a existência de registros
     com base na coluna NUM_NF.
 
+    A importação é incremental: a última posição importada (DT_EMIS, NUM_NF) fica
+    registrada na tabela de controle `nfe_sync_controle` do MySQL e cada execução
+    lê do Oracle apenas as notas posteriores a essa marca.
+
     A função realiza as seguintes etapas:
     1. Estabelece conexão com os bancos de dados Oracle e MySQL utilizando as funções
        definidas no módulo `modules.database`.
-    2. Executa uma query no Oracle para selecionar os dados da tabela `TNFS_SAIDA`,
-       aplicando os seguintes filtros:
+    2. Lê a marca d'água da tabela `nfe_sync_controle` (criada se não existir).
+    3. Executa uma query no Oracle para selecionar os dados da tabela `TNFS_SAIDA`,
+       ordenados por (DT_EMIS, NUM_NF), aplicando os seguintes filtros:
        - `SIT_NF = 'I'` (Situação da Nota Fiscal igual a 'I')
        - `DT_EMIS > '2025-01-01 00:00:00.000'` (Data de Emissão maior que a data limite configurada)
        - `TP_FRETE = 'C'` (Tipo do Frete igual a 'C')
-    3. Para cada registro retornado do Oracle, verifica se já existe um registro com o
-       mesmo valor na coluna `NUM_NF` na tabela `nfe` do MySQL.
-    4. Se o registro não existir no MySQL, ele é inserido na tabela `nfe`.
-    5. Registra informações sobre o número de registros encontrados, inseridos e ignorados
-       (por já existirem) utilizando o logger.
-    6. Em caso de erros durante a conexão com os bancos de dados ou durante a execução
+       - (DT_EMIS, NUM_NF) posterior à marca d'água, exceto em `full_resync`
+    4. Lê o resultado em lotes de `batch_size` linhas (`arraysize` + `fetchmany`),
+       sem carregar a tabela inteira em memória.
+    5. Para cada lote, consulta de uma vez quais NUM_NF já existem na tabela `nfe`
+       do MySQL (`WHERE NUM_NF IN (...)`).
+    6. Insere os registros novos do lote com um único INSERT multi-linha
+       (`executemany`), avança a marca d'água e faz commit do lote (inserção e
+       marca d'água na mesma transação, permitindo retomar após falhas) e publica
+       as chaves inseridas para que `nfe_status` seja semeada imediatamente.
+    7. Registra a vazão de cada lote e o total de registros lidos, inseridos e
+       ignorados (por já existirem) utilizando o logger.
+    8. Em caso de erros durante a conexão com os bancos de dados ou durante a execução
        das queries, registra as informações de erro no logger.
-    7. Garante o fechamento das conexões com os bancos de dados na seção `finally`.
+    9. Garante o fechamento das conexões com os bancos de dados na seção `finally`.
+
+    Args:
+        batch_size: Tamanho do lote (opcional). Se omitido, usa `_config['batch_size']`.
+        full_resync: Se True, ignora a marca d'água e relê tudo desde
+                     `data_limite_oracle` (reparo de notas que ficaram para trás,
+                     por exemplo notas antigas que só depois passaram a SIT_NF = 'I').
 
     Raises:
         cx_Oracle.Error: Se ocorrer algum erro ao conectar ou executar query no Oracle.
@@ -44,71 +82,117 @@ def importar_nfes_oracle_mysql():
         Exception: Se ocorrer qualquer outro erro inesperado durante o processo.
 
     Returns:
-        None
+        Dicionário com os contadores da execução: `lidos` (linhas varridas no
+        Oracle), `inseridos`, `existentes`, `falhas` e `lotes`. Se alguma linha
+        falhar, a marca d'água fica logo antes da primeira falha, para que ela
+        seja tentada de novo na próxima execução.
     """
+    batch_size = batch_size or _config['batch_size']
+    metricas = {'lidos': 0, 'inseridos': 0, 'existentes': 0, 'falhas': 0, 'lotes': 0}
     oracle_conn = None
     mysql_conn = None
     oracle_cursor = None
     mysql_cursor = None
     try:
+        # Conectar ao banco de dados MySQL usando a função do database.py
+        mysql_conn = get_mysql_connection()
+        if not mysql_conn:
+            logger.error("Falha ao obter conexão com o banco de dados MySQL.")
+            return metricas
+
+        mysql_cursor = mysql_conn.cursor()
+        _garantir_tabela_controle(mysql_cursor)
+        ultimo_dt_emis, ultimo_num_nf = (None, None) if full_resync else _ler_watermark(mysql_cursor)
+        mysql_conn.commit()
+
+        if full_resync:
+            logger.info(f"Resincronização completa solicitada: lendo desde {_config['data_limite_oracle']}.")
+        elif ultimo_dt_emis is not None:
+            logger.info(f"Importação incremental a partir de DT_EMIS={ultimo_dt_emis}, NUM_NF={ultimo_num_nf}.")
+
         # Conectar ao banco de dados Oracle usando a função do database.py
         oracle_conn = get_oracle_connection()
         if not oracle_conn:
             logger.error("Falha ao obter conexão com o banco de dados Oracle.")
-            return
+            return metricas
         oracle_cursor = oracle_conn.cursor()
+        oracle_cursor.arraysize = batch_size
         logger.info("Conexão com o banco de dados Oracle estabelecida com sucesso.")
 
         # Executar a query para selecionar os dados da tabela TNFS_SAIDA com filtros
-        oracle_cursor.execute("""
-            SELECT NUM_NF, DT_SAIDA, CLI_ID, NOME, CNPJ_CPF_CLI, CIDADE, UF, VLR_TOTAL,
-                   PESO_BRT, QTD_VOLUMES, FORN_ID, NOME_TRP, CNPJ_CPF_TRP, FORN_ID_RDP,
-                   NOME_TRP_RDP, CUBAGEM, CHAVE_ACESSO_NFEL, OBS_CONF
+        filtro_watermark = ""
+        params = {'data_limite': _config['data_limite_oracle']}  # Usando a configuração
+        if ultimo_dt_emis is not None:
+            filtro_watermark = """
+              AND (DT_EMIS > :ultimo_dt_emis
+                   OR (DT_EMIS = :ultimo_dt_emis AND NUM_NF > :ultimo_num_nf))
+            """
+            params.update(ultimo_dt_emis=ultimo_dt_emis, ultimo_num_nf=ultimo_num_nf)
+
+        oracle_cursor.execute(f"""
+            SELECT {", ".join(_COLUNAS_NFE)}, DT_EMIS
             FROM TNFS_SAIDA
             WHERE SIT_NF = 'I'
               AND DT_EMIS > TO_TIMESTAMP(:data_limite, 'YYYY-MM-DD HH24:MI:SS.FF3')
               AND TP_FRETE = 'C'
-        """, data_limite=_config['data_limite_oracle'])  # Usando a configuração
-        oracle_data = oracle_cursor.fetchall()
-        logger.info(f"{len(oracle_data)} registros encontrados na tabela TNFS_SAIDA do Oracle após aplicar os filtros.")
+              {filtro_watermark}
+            ORDER BY DT_EMIS, NUM_NF
+        """, params)
 
-        # Conectar ao banco de dados MySQL usando a função do database.py
-        mysql_conn = get_mysql_connection()
-        if not mysql_conn:
-            logger.error("Falha ao obter conexão com o banco de dados MySQL.")
-            return
+        inicio = time.monotonic()
+        marca_congelada = False  # Após uma falha, a marca d'água não avança mais nesta execução
+        while True:
+            inicio_lote = time.monotonic()
+            rows = oracle_cursor.fetchmany(batch_size)
+            if not rows:
+                break
 
-        mysql_cursor = mysql_conn.cursor()
+            # A última coluna (DT_EMIS) só serve para a marca d'água
+            linhas = [row[:-1] for row in rows]
+            novos, existentes, falhas = _importar_lote(mysql_cursor, linhas)
+            inseridos = len(novos)
+            if falhas and not marca_congelada:
+                # A marca para logo antes da primeira linha que falhou: ela e as
+                # seguintes são relidas na próxima execução (as já importadas são
+                # reconhecidas como existentes)
+                marca_congelada = True
+                ids_falhas = {id(linha) for linha in falhas}
+                primeira_falha = next(i for i, linha in enumerate(linhas) if id(linha) in ids_falhas)
+                if primeira_falha > 0:
+                    ultimo_dt_emis, ultimo_num_nf = rows[primeira_falha - 1][-1], rows[primeira_falha - 1][0]
+                    _salvar_watermark(mysql_cursor, ultimo_dt_emis, ultimo_num_nf)
+                logger.warning(f"{len(falhas)} registro(s) não importado(s); marca d'água mantida em "
+                               f"DT_EMIS={ultimo_dt_emis}, NUM_NF={ultimo_num_nf} para nova tentativa.")
+            elif not marca_congelada:
+                ultimo_dt_emis, ultimo_num_nf = rows[-1][-1], rows[-1][0]
+                _salvar_watermark(mysql_cursor, ultimo_dt_emis, ultimo_num_nf)
+            mysql_conn.commit()
+
+            # Semeia nfe_status imediatamente, sem esperar a reconciliação periódica
+            notificar_novas_nfes(row[_IDX_CHAVE_ACESSO] for row in novos)
 
-        # Preparar a query de verificação de existência no MySQL
-        check_existence_query = "SELECT COUNT(*) FROM nfe WHERE NUM_NF = %s"
-
-        # Preparar a query de inserção para a tabela nfe do MySQL
-        insert_query = """
-            INSERT INTO nfe (NUM_NF, DT_SAIDA, CLI_ID, NOME, CNPJ_CPF_CLI, CIDADE, UF,
-                             VLR_TOTAL, PESO_BRT, QTD_VOLUMES, FORN_ID, NOME_TRP, CNPJ_CPF_TRP,
-                             FORN_ID_RDP, NOME_TRP_RDP, CUBAGEM, CHAVE_ACESSO_NFEL, OBS_CONF)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
-
-        # Inserir os dados no MySQL, verificando a existência previamente
-        registros_inseridos = 0
-        registros_existentes = 0
-        for row in oracle_data:
-            num_nf = row[0]  # Assumindo que NUM_NF é a primeira coluna
-            mysql_cursor.execute(check_existence_query, (num_nf,))
-            if mysql_cursor.fetchone()[0] == 0:
-                try:
-                    mysql_cursor.execute(insert_query, row)
-                    registros_inseridos += 1
-                except mysql.connector.Error as err:
-                    logger.error(f"Erro ao inserir registro no MySQL: {err} - Dados: {row}")
-            else:
-                registros_existentes += 1
+            metricas['lotes'] += 1
+            metricas['lidos'] += len(rows)
+            metricas['inseridos'] += inseridos
+            metricas['existentes'] += existentes
+            metricas['falhas'] += len(falhas)
 
+            duracao = time.monotonic() - inicio_lote
+            logger.info(
+                f"Lote {metricas['lotes']}: {len(rows)} lidos, {inseridos} inseridos, "
+                f"{existentes} existentes em {duracao:.2f}s "
+                f"({len(rows) / duracao if duracao else float(len(rows)):.0f} registros/s)"
+            )
+
+        duracao_total = time.monotonic() - inicio
+        _salvar_metricas_execucao(mysql_cursor, metricas)
         mysql_conn.commit()
-        logger.info(f"{registros_inseridos} registros inseridos na tabela nfe do MySQL.")
-        logger.info(f"{registros_existentes} registros já existiam na tabela nfe do MySQL e foram ignorados.")
+
+        logger.info(f"{metricas['lidos']} registros encontrados na tabela TNFS_SAIDA do Oracle após aplicar os filtros "
+                    f"({metricas['lotes']} lotes em {duracao_total:.2f}s).")
+        logger.info(f"{metricas['inseridos']} registros inseridos na tabela nfe do MySQL.")
+        logger.info(f"{metricas['existentes']} registros já existiam na tabela nfe do MySQL e foram ignorados.")
+        logger.info(f"Marca d'água atual: DT_EMIS={ultimo_dt_emis}, NUM_NF={ultimo_num_nf}.")
 
     except cx_Oracle.Error as error:
         logger.error(f"Erro ao conectar ou executar query no Oracle: {error}")
@@ -126,10 +210,106 @@ def importar_nfes_oracle_mysql():
         if mysql_conn:
             close_connection(mysql_conn)
             logger.info("Conexão com o banco de dados MySQL fechada.")
+    return metricas
+
+def _garantir_tabela_controle(mysql_cursor):
+    """Cria a tabela de controle da importação incremental, se necessário."""
+    mysql_cursor.execute("SET sql_notes = 0")
+    mysql_cursor.execute("""
+        CREATE TABLE IF NOT EXISTS nfe_sync_controle (
+            nome VARCHAR(50) NOT NULL,
+            ultimo_dt_emis DATETIME(3) NULL,
+            ultimo_num_nf BIGINT NULL,
+            linhas_lidas INT NOT NULL DEFAULT 0,
+            linhas_importadas INT NOT NULL DEFAULT 0,
+            atualizado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (nome)
+        )
+    """)
+    mysql_cursor.execute("SET sql_notes = 1")
+
+def _ler_watermark(mysql_cursor) -> Tuple[Optional[datetime], Optional[int]]:
+    """Retorna (ultimo_dt_emis, ultimo_num_nf) importados, ou (None, None) na primeira execução."""
+    mysql_cursor.execute(
+        "SELECT ultimo_dt_emis, ultimo_num_nf FROM nfe_sync_controle WHERE nome = %s",
+        (_CONTROLE_NOME,)
+    )
+    row = mysql_cursor.fetchone()
+    if not row or row[0] is None:
+        return None, None
+    return row[0], row[1]
+
+def _salvar_watermark(mysql_cursor, ultimo_dt_emis: datetime, ultimo_num_nf):
+    mysql_cursor.execute("""
+        INSERT INTO nfe_sync_controle (nome, ultimo_dt_emis, ultimo_num_nf)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            ultimo_dt_emis = VALUES(ultimo_dt_emis),
+            ultimo_num_nf = VALUES(ultimo_num_nf)
+    """, (_CONTROLE_NOME, ultimo_dt_emis, ultimo_num_nf))
+
+def _salvar_metricas_execucao(mysql_cursor, metricas: Dict[str, int]):
+    """Registra linhas varridas x importadas da última execução na tabela de controle."""
+    mysql_cursor.execute("""
+        INSERT INTO nfe_sync_controle (nome, linhas_lidas, linhas_importadas)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            linhas_lidas = VALUES(linhas_lidas),
+            linhas_importadas = VALUES(linhas_importadas)
+    """, (_CONTROLE_NOME, metricas['lidos'], metricas['inseridos']))
+
+def _importar_lote(mysql_cursor, rows: List[tuple]) -> Tuple[List[tuple], int, List[tuple]]:
+    """
+    Insere no MySQL as linhas do lote cujo NUM_NF ainda não existe na tabela nfe.
+
+    Faz uma única consulta de existência para o lote inteiro e um único INSERT
+    multi-linha. Se o INSERT em lote falhar, refaz linha a linha para isolar e
+    registrar apenas os registros com problema.
+
+    Returns:
+        Tupla (linhas inseridas, quantidade de existentes, linhas que falharam).
+    """
+    # NUM_NF é comparado como texto: o Oracle devolve número e o MySQL pode devolver string
+    num_nfs = list(dict.fromkeys(row[0] for row in rows))
+    placeholders = ", ".join(["%s"] * len(num_nfs))
+    mysql_cursor.execute(f"SELECT NUM_NF FROM nfe WHERE NUM_NF IN ({placeholders})", num_nfs)
+    ja_importadas = {str(row[0]) for row in mysql_cursor.fetchall()}
+
+    novos = []
+    existentes = 0
+    for row in rows:
+        num_nf = str(row[0])
+        if num_nf in ja_importadas:
+            existentes += 1
+            continue
+        ja_importadas.add(num_nf)
+        novos.append(row)
+
+    if not novos:
+        return [], existentes, []
+
+    try:
+        mysql_cursor.executemany(_INSERT_NFE_QUERY, novos)
+        return novos, existentes, []
+    except mysql.connector.Error as err:
+        logger.warning(f"Falha no INSERT em lote ({err}); inserindo registros individualmente.")
+
+    inseridos = []
+    falhas = []
+    for row in novos:
+        try:
+            mysql_cursor.execute(_INSERT_NFE_QUERY, row)
+            inseridos.append(row)
+        except mysql.connector.Error as err:
+            falhas.append(row)
+            logger.error(f"Erro ao inserir registro no MySQL: {err} - Dados: {row}")
+    return inseridos, existentes, falhas
 
 def init_sync(data_limite_oracle: Optional[str] = None,
                        log_level: Optional[int] = None,
-                       log_format: Optional[str] = None):
+                       log_format: Optional[str] = None,
+                       batch_size: Optional[int] = None,
+                       full_resync: bool = False):
     """
     Inicializa o módulo de sincronização de NF-es do Oracle para o MySQL com configurações personalizadas.
 
@@ -150,6 +330,10 @@ def init_sync(data_limite_oracle: Optional[str] = None,
         log_format: Formato da mensagem de log (opcional). O formato padrão é
                     '%(asctime)s - %(levelname)s - %(message)s'. Consulte a
                     documentação do módulo `logging` do Python para mais opções.
+        batch_size: Quantidade de registros lidos do Oracle e inseridos no MySQL
+                    por lote (opcional, padrão 1000).
+        full_resync: Se True, ignora a marca d'água da importação incremental e
+                     relê todas as notas desde `data_limite_oracle`.
 
     Returns:
         None
@@ -160,11 +344,18 @@ def init_sync(data_limite_oracle: Optional[str] = None,
         _config['log_format'] = log_format
     if data_limite_oracle is not None:
         _config['data_limite_oracle'] = data_limite_oracle
+    if batch_size is not None:
+        _config['batch_size'] = batch_size
 
     logging.basicConfig(level=_config['log_level'], format=_config['log_format'])
     logger.info(f"Módulo de sincronização de NF-es inicializado com configuração: {_config}")
-    importar_nfes_oracle_mysql()
-    logger.info("Processo de sincronização de NF-es concluído.")
+    metricas = importar_nfes_oracle_mysql(full_resync=full_resync)
+    logger.info(f"Processo de sincronização de NF-es concluído: {metricas['lidos']} linhas varridas, "
+                f"{metricas['inseridos']} importadas.")
 
 if __name__ == "__main__":
-    init_sync()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Importa NF-es do Oracle para o MySQL.")
+    parser.add_argument("--full-resync", action="store_true",
+                        help="Ignora a marca d'água e relê todas as notas desde a data limite.")
+    args = parser.parse_args()
+    init_sync(full_resync=args.full_resync)
\ No newline at end of file
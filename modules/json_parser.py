@@ -1,8 +1,7 @@
 # modules/json_parser.py
 import logging
 from typing import Dict, List, Any, Optional
-from modules.status import determinar_status, init_status  # Import init_status as well
-from modules.database import get_mysql_connection, close_connection
+from modules.status import resolver_status
 import re
 
 logger = logging.getLogger(__name__)
@@ -49,7 +48,6 @@ def parse_json(json_data: Dict[str, Any]) -> Dict[str, Any]:
         - mensagem: Status message
         - items: List of tracking events
     """
-    conn = None
     try:
         logger.debug("Iniciando parse do JSON (first %d chars): %s...",
                      _config['max_json_log_length'],
@@ -85,18 +83,12 @@ def parse_json(json_data: Dict[str, Any]) -> Dict[str, Any]:
         tracking_items = documento.get('tracking', [])
         items = _process_items(tracking_items)
 
-        conn = get_mysql_connection()
-        if not conn:
-            logger.error("Falha ao obter conexão com o banco de dados para determinar o status.")
-            status_entrega = _config['default_status']
+        if items:
+            ultimo_evento = items[-1]
+            codigo_ocorrencia = ultimo_evento.get("codigo_ocorrencia")
+            status_entrega = resolver_status(codigo_ocorrencia)
         else:
-            init_status(conn)  # Ensure status module is initialized
-            if items:
-                ultimo_evento = items[-1]
-                codigo_ocorrencia = ultimo_evento.get("codigo_ocorrencia")
-                status_entrega = determinar_status(conn, codigo_ocorrencia)
-            else:
-                status_entrega = _config['default_status']
+            status_entrega = _config['default_status']
 
         return {
             "status": "SUCESSO",
@@ -115,9 +107,6 @@ def parse_json(json_data: Dict[str, Any]) -> Dict[str, Any]:
             "mensagem": f"Erro inesperado: {str(e)}",
             "items": []
         }
-    finally:
-        if conn:
-            close_connection(conn)
 
 def _process_items(items: List[Dict[str, str]]) -> List[Dict[str, str]]:
     """Processa eventos de rastreamento extraindo TODOS os campos."""
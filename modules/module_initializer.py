@@ -3,6 +3,7 @@ from .database import init_databases, get_mysql_connection  # Importe get_mysql_
 from .tasks import init_tasks
 from .json_parser import init_json_parser
 from .status import init_status
+from .status_contadores import init_status_contadores
 from .nfe_tracking_logger import init_logger  # Garanta que esta linha esteja presente
 from .nfe_status_sync import sync_nfe_to_nfe_status_periodically
 
@@ -25,6 +26,7 @@ def initialize_modules():
     conn = get_mysql_connection()
     if conn:
         init_status(conn)
+        init_status_contadores(conn)
         conn.close()
         logger.info("Status module initialized with database connection.")
     else:
@@ -1,79 +1,241 @@
 # modules/nfe_status_sync.py
 import logging
-from modules.database import get_mysql_connection, close_connection
+from modules.database import get_mysql_connection, close_connection, ensure_index, mysql_connection
+from modules.status_contadores import agendar_reconciliacao
 import mysql.connector
+import os
+import queue
 import time
-import threading
+from typing import Iterable, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
 _running = True
-NFE_STATUS_SYNC_INTERVAL_SECONDS = 600  # Executa a sincronização a cada 10 minutos (600 segundos)
+# As NF-es novas chegam por evento (notificar_novas_nfes); a reconciliação completa
+# é apenas uma rede de segurança para eventos perdidos ou importações externas.
+NFE_STATUS_SYNC_INTERVAL_SECONDS = 3600  # Reconciliação completa a cada 1 hora
+NFE_STATUS_SYNC_CHUNK_SIZE = 1000  # Máximo de linhas inseridas por INSERT ... SELECT
+
+# Fila de eventos "NF-e importada": cada item é uma lista de chaves de acesso
+# (None acorda o loop para encerrar). Só é usada no processo em que o loop de
+# sincronização está rodando: um processo filho criado por fork (o agendador)
+# herda a fila, mas não a thread que a consome.
+_fila_novas_nfes: "queue.Queue[List[str] | None]" = queue.Queue()
+_consumidor_pid: Optional[int] = None  # PID do processo com o loop de sincronização ativo
+
+# Anti-join executado no servidor: chaves de acesso da tabela nfe que ainda não
+# estão em nfe_status, em ordem de chave a partir da última chave vista
+# (paginação por chave, para que linhas recusadas não travem as passadas seguintes).
+_CHAVES_AUSENTES_QUERY = """
+    SELECT DISTINCT n.CHAVE_ACESSO_NFEL
+    FROM nfe n
+    LEFT JOIN nfe_status ns ON ns.chave_nfe = n.CHAVE_ACESSO_NFEL
+    WHERE ns.chave_nfe IS NULL
+      AND n.CHAVE_ACESSO_NFEL > %s
+    ORDER BY n.CHAVE_ACESSO_NFEL
+    LIMIT %s
+"""
+
+# INSERT IGNORE: uma linha duplicada ou inválida vira aviso e é pulada, em vez
+# de abortar o bloco inteiro; as chaves puladas são registradas no log.
+_INSERT_NFES_POR_CHAVE_QUERY = """
+    INSERT IGNORE INTO nfe_status (chave_nfe, NUM_NF, ultimo_evento, tipo_ocorrencia, data_hora, status, transportadora, cidade, uf, dt_saida, tentativas, last_processed_at, COD_INTERNO, categoria_status)
+    SELECT DISTINCT n.CHAVE_ACESSO_NFEL, n.NUM_NF, '', ' PENDENTE', NOW(), 'PENDENTE', n.NOME_TRP, n.CIDADE, n.UF, n.DT_SAIDA, 0, NULL, NULL, 'NAO_ENCONTRADO'
+    FROM nfe n
+    LEFT JOIN nfe_status ns ON ns.chave_nfe = n.CHAVE_ACESSO_NFEL
+    WHERE ns.chave_nfe IS NULL
+      AND n.CHAVE_ACESSO_NFEL IN ({placeholders})
+"""
+
+_CHAVES_SEMEADAS_QUERY = "SELECT chave_nfe FROM nfe_status WHERE chave_nfe IN ({placeholders})"
 
 def stop_sync():
     """Sets the flag to stop the synchronization loop."""
     global _running
     _running = False
+    _fila_novas_nfes.put(None)
 
-def sync_nfe_to_nfe_status_periodically():
+def notificar_novas_nfes(chaves: Iterable[str]):
+    """
+    Publica o evento "NF-e importada" para as chaves de acesso informadas.
+
+    Se o loop de sincronização estiver rodando neste processo, as chaves são
+    enfileiradas e semeadas em nfe_status por ele. Caso contrário (importação
+    executada como script, processo do agendador), a semeadura é feita
+    imediatamente aqui.
+    """
+    chaves = [chave for chave in chaves if chave]
+    if not chaves:
+        return
+    if _consumidor_pid == os.getpid():
+        _fila_novas_nfes.put(chaves)
+        return
+    try:
+        with mysql_connection() as conn:
+            inseridas, duracao = semear_nfe_status(conn, chaves)
+        logger.info(f"{inseridas} NF-es semeadas em nfe_status com status 'PENDENTE' em {duracao:.2f}s.")
+    except (mysql.connector.Error, RuntimeError) as error:
+        logger.error(f"Erro ao semear nfe_status ({len(chaves)} chaves); a reconciliação periódica tratará: {error}")
+
+def _inserir_bloco(conn, cursor, bloco: List[str]) -> int:
+    """
+    Semeia em nfe_status as chaves do bloco (um commit) e registra no log as
+    que foram puladas pelo INSERT IGNORE. Retorna o número de linhas inseridas.
+    """
+    placeholders = ", ".join(["%s"] * len(bloco))
+    cursor.execute(_INSERT_NFES_POR_CHAVE_QUERY.format(placeholders=placeholders), bloco)
+    inseridas = cursor.rowcount
+    avisos = []
+    if inseridas < len(bloco):
+        cursor.execute("SHOW WARNINGS LIMIT 5")
+        avisos = [aviso[2] for aviso in cursor.fetchall()]
+    conn.commit()
+    if inseridas < len(bloco):
+        cursor.execute(_CHAVES_SEMEADAS_QUERY.format(placeholders=placeholders), bloco)
+        semeadas = {linha[0] for linha in cursor.fetchall()}
+        puladas = [chave for chave in bloco if chave not in semeadas]
+        if puladas:
+            logger.warning(f"{len(puladas)} NF-es não foram semeadas em nfe_status e foram puladas: "
+                           f"{', '.join(puladas[:10])}{' ...' if len(puladas) > 10 else ''}"
+                           f"{f' (avisos: {avisos})' if avisos else ''}")
+    return inseridas
+
+def semear_nfe_status(conn, chaves: List[str]) -> Tuple[int, float]:
     """
-    Verifica periodicamente se existem NUM_NF na tabela nfe que não estão na tabela nfe_status
-    e importa os dados necessários para a tabela nfe_status.
+    Insere em nfe_status, com status 'PENDENTE', as NF-es informadas que ainda
+    não estão lá, em blocos de NFE_STATUS_SYNC_CHUNK_SIZE chaves (um commit por bloco).
+    Se houver inserções, os contadores do rastro são reconciliados em seguida.
+
+    Returns:
+        Tupla (linhas inseridas, duração em segundos).
+    """
+    inicio = time.monotonic()
+    total = 0
+    cursor = conn.cursor()
+    try:
+        for i in range(0, len(chaves), NFE_STATUS_SYNC_CHUNK_SIZE):
+            total += _inserir_bloco(conn, cursor, chaves[i:i + NFE_STATUS_SYNC_CHUNK_SIZE])
+    finally:
+        cursor.close()
+    if total:
+        agendar_reconciliacao()
+    return total, time.monotonic() - inicio
+
+def _garantir_indices(cursor):
+    """Garante os índices usados pelo anti-join entre nfe e nfe_status."""
+    ensure_index(cursor, "nfe", "idx_nfe_chave_acesso", "CHAVE_ACESSO_NFEL")
+    ensure_index(cursor, "nfe_status", "idx_nfe_status_chave", "chave_nfe")
+
+def sincronizar_nfe_status(conn) -> Tuple[int, float]:
     """
-    while _running:
-        conn = None
-        cursor = None
+    Executa uma passada de reconciliação nfe → nfe_status.
+
+    As chaves das NF-es ausentes em nfe_status são lidas por um anti-join no
+    servidor, em blocos de NFE_STATUS_SYNC_CHUNK_SIZE paginados pela própria
+    chave, e inseridas com status 'PENDENTE' (um commit por bloco). Linhas
+    duplicadas ou inválidas são puladas e registradas, sem abortar a passada.
+
+    Returns:
+        Tupla (linhas inseridas, duração em segundos).
+    """
+    inicio = time.monotonic()
+    total = 0
+    cursor = conn.cursor()
+    try:
+        ultima_chave = ''
+        while True:
+            cursor.execute(_CHAVES_AUSENTES_QUERY, (ultima_chave, NFE_STATUS_SYNC_CHUNK_SIZE))
+            bloco = [linha[0] for linha in cursor.fetchall()]
+            if not bloco:
+                break
+            total += _inserir_bloco(conn, cursor, bloco)
+            if len(bloco) < NFE_STATUS_SYNC_CHUNK_SIZE:
+                break
+            ultima_chave = bloco[-1]
+    finally:
+        cursor.close()
+    if total:
+        agendar_reconciliacao()
+    return total, time.monotonic() - inicio
+
+def _executar_reconciliacao(garantir_indices: bool) -> bool:
+    """Executa uma reconciliação completa. Retorna True se concluída."""
+    conn = None
+    try:
+        conn = get_mysql_connection()
+        if not conn:
+            logger.error("Falha ao obter conexão com o banco de dados MySQL.")
+            return False
+
+        if garantir_indices:
+            with conn.cursor() as cursor:
+                _garantir_indices(cursor)
+
+        inseridas, duracao = sincronizar_nfe_status(conn)
+        if inseridas:
+            logger.info(f"{inseridas} novas NF-es importadas para a tabela nfe_status com status 'PENDENTE' em {duracao:.2f}s.")
+        else:
+            logger.info(f"Não foram encontradas novas NF-es na tabela nfe para sincronizar com nfe_status ({duracao:.2f}s).")
+        return True
+
+    except (mysql.connector.Error, RuntimeError) as error:
+        logger.error(f"Erro ao sincronizar nfe com nfe_status: {error}")
+        return False
+    finally:
+        if conn:
+            close_connection(conn)
+
+def _semear_eventos(chaves: List[str]):
+    """Agrupa os eventos já enfileirados com `chaves` e semeia tudo de uma vez."""
+    lote = list(chaves)
+    while len(lote) < NFE_STATUS_SYNC_CHUNK_SIZE:
         try:
-            conn = get_mysql_connection()
-            if not conn:
-                logger.error("Falha ao obter conexão com o banco de dados MySQL.")
-                time.sleep(NFE_STATUS_SYNC_INTERVAL_SECONDS)
-                continue
+            mais = _fila_novas_nfes.get_nowait()
+        except queue.Empty:
+            break
+        if mais is None:
+            break
+        lote.extend(mais)
+
+    conn = None
+    try:
+        conn = get_mysql_connection()
+        inseridas, duracao = semear_nfe_status(conn, list(dict.fromkeys(lote)))
+        logger.info(f"Evento de importação: {inseridas} NF-es semeadas em nfe_status com status 'PENDENTE' em {duracao:.2f}s.")
+    except (mysql.connector.Error, RuntimeError) as error:
+        logger.error(f"Erro ao semear nfe_status a partir de eventos ({len(lote)} chaves); a reconciliação periódica tratará: {error}")
+    finally:
+        if conn:
+            close_connection(conn)
 
-            cursor = conn.cursor()
-
-            # Buscar todos os NUM_NF da tabela nfe
-            cursor.execute("SELECT NUM_NF FROM nfe")
-            nfe_nums = {row[0] for row in cursor.fetchall()}
-
-            # Buscar todos os NUM_NF da tabela nfe_status
-            cursor.execute("SELECT NUM_NF FROM nfe_status")
-            nfe_status_nums = {row[0] for row in cursor.fetchall()}
-
-            # Identificar os NUM_NF que estão em nfe mas não em nfe_status
-            novas_nfs = nfe_nums - nfe_status_nums
-
-            if novas_nfs:
-                logger.info(f"Encontradas {len(novas_nfs)} novas NF-es na tabela nfe para adicionar à nfe_status.")
-                insert_query = """
-                    INSERT INTO nfe_status (chave_nfe, NUM_NF, ultimo_evento, tipo_ocorrencia, data_hora, status, transportadora, cidade, uf, dt_saida, tentativas, last_processed_at, COD_INTERNO)
-                    SELECT n.CHAVE_ACESSO_NFEL, n.NUM_NF, '', ' PENDENTE', NOW(), 'PENDENTE', n.NOME_TRP, n.CIDADE, n.UF, n.DT_SAIDA, 0, NULL, NULL
-                    FROM nfe n
-                    WHERE n.NUM_NF = %s
-                      AND NOT EXISTS (SELECT 1 FROM nfe_status ns WHERE ns.chave_nfe = n.CHAVE_ACESSO_NFEL)
-                """
-                for num_nf in novas_nfs:
-                    try:
-                        cursor.execute(insert_query, (num_nf,))
-                    except mysql.connector.Error as err:
-                        logger.error(f"Erro ao inserir dados da NF {num_nf} na nfe_status: {err}")
-                conn.commit()
-                logger.info("Novas NF-es importadas para a tabela nfe_status com status 'PENDENTE'.")
-            else:
-                logger.info("Não foram encontradas novas NF-es na tabela nfe para sincronizar com nfe_status.")
-
-        except mysql.connector.Error as error:
-            logger.error(f"Erro ao sincronizar nfe com nfe_status: {error}")
-        finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                close_connection(conn)
-
-        time.sleep(NFE_STATUS_SYNC_INTERVAL_SECONDS)
+def sync_nfe_to_nfe_status_periodically():
+    """
+    Consome os eventos de NF-es importadas, semeando nfe_status imediatamente, e
+    a cada NFE_STATUS_SYNC_INTERVAL_SECONDS executa uma reconciliação completa
+    para as NF-es da tabela nfe que ainda não estão na tabela nfe_status.
+    """
+    global _consumidor_pid
+    _consumidor_pid = os.getpid()
+    indices_verificados = False
+    proxima_reconciliacao = 0.0
+    try:
+        while _running:
+            if time.monotonic() >= proxima_reconciliacao:
+                concluida = _executar_reconciliacao(garantir_indices=not indices_verificados)
+                indices_verificados = indices_verificados or concluida
+                proxima_reconciliacao = time.monotonic() + NFE_STATUS_SYNC_INTERVAL_SECONDS
+
+            try:
+                chaves = _fila_novas_nfes.get(timeout=max(0.0, proxima_reconciliacao - time.monotonic()))
+            except queue.Empty:
+                continue
+            if chaves:
+                _semear_eventos(chaves)
+    finally:
+        _consumidor_pid = None
 
 if __name__ == "__main__":
     import logging
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     # This will run the sync only once if called directly
-    sync_nfe_to_nfe_status_periodically()
\ No newline at end of file
+    sync_nfe_to_nfe_status_periodically()
@@ -1,17 +1,248 @@
 # modules/nfe_tracking_logger.py
 import logging
+import threading
+import time
+from typing import Optional, Dict, List, Tuple, Iterable, Any
 import mysql.connector
 import re  # Importa o módulo de expressões regulares  # noqa: F401
-from modules.database import get_mysql_connection, close_connection
+from modules.database import get_mysql_connection, close_connection, ensure_column, ensure_index
+from modules.status import resolver_status, get_mapa_status, invalidar_mapa_categorias
+from modules.status_contadores import aplicar_delta
 
 logger = logging.getLogger(__name__)
 
+# Configurações do módulo
+_config = {
+    'indice_ttl': 300,  # Segundos até recarregar o índice descrição -> código em segundo plano
+}
 
-def init_logger():
-    """Inicializa o logger para este módulo."""
-    # A inicialização básica do logger já está feita fora da função.
-    # Podemos adicionar configurações mais específicas aqui no futuro, se necessário.
-    pass
+CODIGO_NAO_CADASTRADO = "999"
+
+# Índice DESCRICAO -> CODIGO_SSW da tabela `ocorrencias`, usado quando o evento
+# não traz codigo_ocorrencia. O dicionário é substituído inteiro a cada recarga,
+# então leituras não precisam de lock.
+_indice_ocorrencias: Dict[str, str] = {}
+_indice_carregado_em: Optional[float] = None
+# Versão de status_mapa_versao vista pelo mapa de categorias quando o índice foi
+# carregado: cadastros em `ocorrencias` incrementam essa versão (ver
+# `invalidar_indice_ocorrencias`) e o índice é recarregado quando ela muda.
+_indice_versao: Optional[int] = None
+_indice_recarga_lock = threading.Lock()
+# Descrições sem código já avisadas no log deste processo (um aviso por descrição
+# a cada carga do índice). As pendentes ficam em nfe_logs com o código "999" e são
+# listadas em /status/api/ocorrencias/pendentes.
+_descricoes_avisadas = set()
+
+
+def init_logger(indice_ttl: Optional[int] = None):
+    """
+    Inicializa o módulo, pré-carregando o índice de descrições de ocorrência.
+
+    Args:
+        indice_ttl: Segundos até o índice ser recarregado em segundo plano.
+    """
+    if indice_ttl is not None:
+        _config['indice_ttl'] = indice_ttl
+    carregar_indice_ocorrencias()
+
+    conn = get_mysql_connection()
+    if not conn:
+        logger.error("Falha ao obter conexão com o banco de dados para preparar a tabela nfe_status.")
+        return
+    try:
+        with conn.cursor() as cursor:
+            garantir_colunas_ultimo_evento(cursor)
+            garantir_indices_consulta_publica(cursor)
+        conn.commit()
+    except mysql.connector.Error as e:
+        logger.error(f"Erro ao preparar colunas do último evento e índices de consulta: {e}")
+    finally:
+        close_connection(conn)
+
+
+def garantir_indices_consulta_publica(cursor):
+    """
+    Garante os índices da consulta da página pública de rastreio
+    (acesso._RASTREAMENTO_QUERY): token -> NUM_NF coberto pelo índice e o
+    histórico da NF lido já na ordem de data_hora.
+    """
+    ensure_index(cursor, "nfe_tokens", "idx_nfe_tokens_token_num_nf", "token, NUM_NF")
+    ensure_index(cursor, "nfe_logs", "idx_nfe_logs_num_nf_data_hora", "NUM_NF, data_hora")
+    ensure_index(cursor, "nfe", "idx_nfe_num_nf", "NUM_NF")
+    ensure_index(cursor, "nfe_status", "idx_nfe_status_num_nf_updated", "NUM_NF, updated_at")
+
+
+def garantir_colunas_ultimo_evento(cursor):
+    """
+    Garante as colunas com o último evento gravado de cada NF-e (data_hora e
+    código), usadas por `tasks.processar_nfe` para gravar só os eventos novos.
+    Ao criá-las, preenche a partir dos eventos já existentes em nfe_logs.
+    """
+    criada = ensure_column(cursor, "nfe_status", "ultimo_evento_data_hora", "DATETIME NULL")
+    criada |= ensure_column(cursor, "nfe_status", "ultimo_evento_codigo", "VARCHAR(10) NULL")
+    if not criada:
+        return
+    cursor.execute("""
+        UPDATE nfe_status s
+        JOIN (SELECT chave_nfe, MAX(data_hora) AS data_hora FROM nfe_logs GROUP BY chave_nfe) l
+            ON l.chave_nfe = s.chave_nfe
+        SET s.ultimo_evento_data_hora = l.data_hora,
+            s.ultimo_evento_codigo = (
+                SELECT x.codigo_ocorrencia FROM nfe_logs x
+                WHERE x.chave_nfe = s.chave_nfe AND x.data_hora = l.data_hora
+                ORDER BY x.id DESC LIMIT 1
+            )
+        WHERE s.ultimo_evento_data_hora IS NULL
+    """)
+    logger.info(f"Último evento preenchido para {cursor.rowcount} NF-es a partir de nfe_logs.")
+
+
+def _chave_descricao(descricao: Optional[str]) -> str:
+    # Aproxima a comparação do MySQL (collation *_ci, espaços à direita ignorados)
+    return (descricao or "").strip().casefold()
+
+
+def carregar_indice_ocorrencias() -> bool:
+    """Recarrega o índice descrição -> código a partir da tabela `ocorrencias`."""
+    global _indice_ocorrencias, _indice_carregado_em, _indice_versao
+    versao = get_mapa_status()['versao']
+    conn = None
+    cursor = None
+    try:
+        conn = get_mysql_connection()
+        if not conn:
+            logger.error("Falha ao obter conexão com o banco de dados para carregar o índice de ocorrências.")
+            return False
+        cursor = conn.cursor()
+        cursor.execute("SELECT DESCRICAO, CODIGO_SSW FROM ocorrencias ORDER BY CODIGO_SSW")
+        indice = {}
+        for descricao, codigo in cursor.fetchall():
+            indice.setdefault(_chave_descricao(descricao), str(codigo))
+        _indice_ocorrencias = indice
+        _indice_carregado_em = time.monotonic()
+        _indice_versao = versao
+        _descricoes_avisadas.clear()
+        logger.info(f"Índice de ocorrências carregado: {len(indice)} descrições.")
+        return True
+    except mysql.connector.Error as e:
+        logger.error(f"Erro ao carregar índice de ocorrências: {e}")
+        return False
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            close_connection(conn)
+
+
+def invalidar_indice_ocorrencias(cursor=None):
+    """
+    Marca o índice como desatualizado (ex.: após cadastrar ou editar ocorrências);
+    a próxima consulta dispara a recarga em segundo plano.
+
+    Com `cursor`, incrementa também a versão em `status_mapa_versao` na
+    transação de quem chamou (faça o commit junto com a alteração): os demais
+    processos (ex.: agendador) recarregam o índice assim que o mapa de
+    categorias passar a essa versão. Sem `cursor`, vale só para este processo.
+    """
+    global _indice_carregado_em
+    if cursor is not None:
+        invalidar_mapa_categorias(cursor)
+    if _indice_carregado_em is not None:
+        _indice_carregado_em = float("-inf")
+
+
+def _marcar_indice_carregado():
+    global _indice_carregado_em
+    _indice_carregado_em = time.monotonic()
+
+
+def _recarregar_em_segundo_plano():
+    try:
+        if not carregar_indice_ocorrencias():
+            _marcar_indice_carregado()  # Mantém o índice atual e tenta de novo após o TTL
+    finally:
+        _indice_recarga_lock.release()
+
+
+def _indice_atual() -> Dict[str, str]:
+    if _indice_carregado_em is None:
+        # Primeiro uso no processo sem init_logger: carga síncrona, uma única vez
+        with _indice_recarga_lock:
+            if _indice_carregado_em is None and not carregar_indice_ocorrencias():
+                # Sem banco: evita nova tentativa a cada evento; a recarga segue o TTL
+                _marcar_indice_carregado()
+    elif (time.monotonic() - _indice_carregado_em > _config['indice_ttl']
+          or get_mapa_status()['versao'] != _indice_versao):
+        if _indice_recarga_lock.acquire(blocking=False):
+            threading.Thread(target=_recarregar_em_segundo_plano, daemon=True,
+                             name="indice-ocorrencias").start()
+    return _indice_ocorrencias
+
+
+def codigo_por_descricao(descricao: Optional[str], registrar_falta: bool = True) -> str:
+    """
+    Retorna o CODIGO_SSW da ocorrência com esta descrição, sem acessar o banco.
+
+    Descrições sem código cadastrado retornam "999" e, com `registrar_falta`,
+    geram um aviso no log (uma vez por descrição a cada carga do índice).
+    """
+    codigo = _indice_atual().get(_chave_descricao(descricao))
+    if codigo is not None:
+        return codigo
+    if registrar_falta and descricao not in _descricoes_avisadas:
+        _descricoes_avisadas.add(descricao)
+        logger.warning(f"Ocorrência sem código cadastrado: '{descricao}' (gravada como {CODIGO_NAO_CADASTRADO}).")
+    return CODIGO_NAO_CADASTRADO
+
+
+_INSERT_EVENTO_QUERY = """
+    INSERT INTO nfe_logs
+    (chave_nfe, NUM_NF, codigo_ocorrencia, tipo_ocorrencia, cidade_ocorrencia,
+     dominio, filial, nome_recebedor, documento_recebedor, descricao_completa,
+     data_hora, status, transportadora, cidade, uf)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        descricao_completa = VALUES(descricao_completa),
+        status = VALUES(status),
+        tipo_ocorrencia = VALUES(tipo_ocorrencia),
+        cidade_ocorrencia = VALUES(cidade_ocorrencia)
+"""
+
+
+def codigo_do_evento(evento: Dict[str, Any]) -> str:
+    """Código de ocorrência com que o evento é (ou seria) gravado em nfe_logs."""
+    return evento.get("codigo_ocorrencia") or codigo_por_descricao(
+        evento.get("ocorrencia", "").strip(), registrar_falta=False
+    )
+
+
+def _parametros_evento(chave_nfe, num_nf, evento, status, transportadora, cidade, uf) -> Tuple:
+    """Monta a linha de `nfe_logs` para um evento da API."""
+    descricao_completa = evento.get("descricao", "")
+    codigo_ocorrencia = evento.get("codigo_ocorrencia", "")
+    tipo_ocorrencia = evento.get("ocorrencia", "").strip()
+
+    # Fallback para código de ocorrência se não encontrado no texto pelo json_parser
+    if not codigo_ocorrencia:
+        codigo_ocorrencia = codigo_por_descricao(tipo_ocorrencia)
+
+    return (
+        chave_nfe,
+        num_nf,
+        codigo_ocorrencia,
+        tipo_ocorrencia,
+        evento.get("cidade", ""),
+        evento.get("dominio", ""),
+        evento.get("filial", ""),
+        evento.get("nome_recebedor", ""),
+        evento.get("nro_doc_recebedor", ""),
+        descricao_completa,
+        evento.get("data_hora"),
+        status,
+        transportadora,
+        cidade,
+        uf,
+    )
 
 
 def insert_evento(
@@ -19,76 +250,140 @@ def insert_evento(
 ):
     """Função auxiliar para inserir um evento no banco"""
     try:
-        # Prepara os dados para inserção
-        descricao_completa = evento.get("descricao", "")
-        codigo_ocorrencia = evento.get("codigo_ocorrencia", "")
-        tipo_ocorrencia = evento.get("ocorrencia", "").strip()
-
-        # Fallback para código de ocorrência se não encontrado no texto pelo json_parser
-        if not codigo_ocorrencia:
-            conn_fallback = None
-            cursor_fallback = None
-            try:
-                conn_fallback = get_mysql_connection()
-                if conn_fallback:
-                    cursor_fallback = conn_fallback.cursor()
-                    cursor_fallback.execute(
-                        "SELECT CODIGO_SSW FROM ocorrencias WHERE DESCRICAO = %s",
-                        (tipo_ocorrencia,),
-                    )
-                    resultado = cursor_fallback.fetchone()
-                    if resultado:
-                        codigo_ocorrencia = resultado[0]
-                    else:
-                        codigo_ocorrencia = "999"
-                else:
-                    logger.error(
-                        "Falha ao obter conexão com o banco de dados para fallback de código de ocorrência."
-                    )
-                    codigo_ocorrencia = (
-                        "999"  # Define como 999 em caso de falha na conexão
-                    )
-            finally:
-                if cursor_fallback:
-                    cursor_fallback.close()
-                if conn_fallback:
-                    close_connection(conn_fallback)
-
         cursor_main.execute(
-            """
-            INSERT INTO nfe_logs
-            (chave_nfe, NUM_NF, codigo_ocorrencia, tipo_ocorrencia, cidade_ocorrencia,
-             dominio, filial, nome_recebedor, documento_recebedor, descricao_completa,
-             data_hora, status, transportadora, cidade, uf)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ON DUPLICATE KEY UPDATE
-                descricao_completa = VALUES(descricao_completa),
-                status = VALUES(status),
-                tipo_ocorrencia = VALUES(tipo_ocorrencia),
-                cidade_ocorrencia = VALUES(cidade_ocorrencia)
-            """,
-            (
-                chave_nfe,
-                num_nf,
-                codigo_ocorrencia,
-                tipo_ocorrencia,
-                evento.get("cidade", ""),
-                evento.get("dominio", ""),
-                evento.get("filial", ""),
-                evento.get("nome_recebedor", ""),
-                evento.get("nro_doc_recebedor", ""),
-                descricao_completa,
-                evento.get("data_hora"),
-                status,
-                transportadora,
-                cidade,
-                uf,
-            ),
+            _INSERT_EVENTO_QUERY,
+            _parametros_evento(chave_nfe, num_nf, evento, status, transportadora, cidade, uf),
         )
     except mysql.connector.Error as e:
-        logger.warning(
-            f"Evento já existe para NF-e {num_nf}, atualizando dados: {str(e)}"
-        )
+        logger.error(f"Erro ao gravar evento da NF-e {num_nf}: {str(e)}")
+
+
+# Recua a marca d'água da NF-e para antes de um evento que não foi gravado, para
+# que a próxima consulta o envie de novo (ver `tasks._eventos_novos`). Só recua:
+# uma marca já anterior ao evento é mantida. Sem data_hora legível, volta para
+# 1970-01-01 (tasks.MARCA_SEM_DATA) e todos os eventos da resposta são reenviados.
+_RECUAR_MARCA_QUERY = """
+    UPDATE nfe_status
+    SET ultimo_evento_data_hora = COALESCE(CAST(%s AS DATETIME) - INTERVAL 1 SECOND, '1970-01-01'),
+        ultimo_evento_codigo = NULL
+    WHERE chave_nfe = %s
+      AND ultimo_evento_data_hora >= COALESCE(CAST(%s AS DATETIME) - INTERVAL 1 SECOND, '1970-01-01')
+"""
+
+
+def _recuar_marcas(cursor, linhas_com_falha: List[Tuple]):
+    """Recua a marca d'água de cada NF-e para antes do primeiro evento não gravado dela."""
+    primeira_falha = {}
+    for linha in linhas_com_falha:
+        primeira_falha.setdefault(linha[0], linha[10] or None)
+    for chave_nfe, data_hora in primeira_falha.items():
+        cursor.execute(_RECUAR_MARCA_QUERY, (data_hora, chave_nfe, data_hora))
+
+
+def _gravar_linhas(cursor, linhas: List[Tuple]) -> int:
+    """
+    Grava as linhas com um único INSERT multi-linha (o executemany do
+    mysql.connector reescreve o VALUES). Se o lote violar uma restrição do
+    banco, grava linha a linha para não perder os demais eventos; as linhas
+    recusadas ficam de fora e a marca d'água da NF-e é recuada para antes
+    delas. Outros erros são propagados.
+
+    A marca d'água (`_update_nfe_status`) deve ser gravada antes, na mesma
+    transação.
+    """
+    if not linhas:
+        return 0
+    try:
+        cursor.executemany(_INSERT_EVENTO_QUERY, linhas)
+        return len(linhas)
+    except mysql.connector.IntegrityError as e:
+        logger.warning(f"Falha ao gravar lote de {len(linhas)} eventos, gravando individualmente: {e}")
+    gravadas = 0
+    recusadas = []
+    for linha in linhas:
+        try:
+            cursor.execute(_INSERT_EVENTO_QUERY, linha)
+            gravadas += 1
+        except mysql.connector.IntegrityError as e:
+            logger.error(f"Evento da NF-e {linha[1]} ({linha[10]}) recusado pelo banco e não gravado: {e}")
+            recusadas.append(linha)
+    if recusadas:
+        _recuar_marcas(cursor, recusadas)
+    return gravadas
+
+
+def insert_eventos_bulk(
+    cursor, chave_nfe, num_nf, eventos: Iterable[Dict[str, Any]], status, transportadora, cidade, uf
+) -> int:
+    """
+    Insere todos os eventos de uma NF-e em um único comando.
+
+    Returns:
+        Quantidade de eventos gravados.
+    """
+    linhas = [
+        _parametros_evento(chave_nfe, num_nf, evento, status, transportadora, cidade, uf)
+        for evento in eventos
+    ]
+    return _gravar_linhas(cursor, linhas)
+
+
+class EventoBuffer:
+    """
+    Acumula eventos de várias NF-es e os grava em lote pelo mesmo cursor.
+
+    O lote é gravado ao atingir `max_eventos` ou quando o evento mais antigo
+    pendente passa de `max_intervalo_ms` (verificado em `adicionar` e
+    `flush_se_vencido`). Quem chama deve fazer o commit só com o buffer vazio
+    (`pendentes == 0`) e chamar `flush()` ao final.
+    """
+
+    def __init__(self, cursor, max_eventos: int = 500, max_intervalo_ms: int = 500):
+        self.cursor = cursor
+        self.max_eventos = max(max_eventos, 1)
+        self.max_intervalo_ms = max_intervalo_ms
+        self._linhas: List[Tuple] = []
+        self._primeiro_em: Optional[float] = None
+        self.gravados = 0
+        self.lotes = 0
+
+    @property
+    def pendentes(self) -> int:
+        return len(self._linhas)
+
+    def adicionar(self, chave_nfe, num_nf, eventos: Iterable[Dict[str, Any]], status, transportadora, cidade, uf):
+        for evento in eventos:
+            self._linhas.append(_parametros_evento(chave_nfe, num_nf, evento, status, transportadora, cidade, uf))
+        if self._linhas and self._primeiro_em is None:
+            self._primeiro_em = time.monotonic()
+        if len(self._linhas) >= self.max_eventos:
+            self.flush()
+        else:
+            self.flush_se_vencido()
+
+    def flush_se_vencido(self) -> int:
+        if self._primeiro_em is not None and \
+                (time.monotonic() - self._primeiro_em) * 1000 >= self.max_intervalo_ms:
+            return self.flush()
+        return 0
+
+    def flush(self) -> int:
+        linhas, self._linhas = self._linhas, []
+        self._primeiro_em = None
+        if not linhas:
+            return 0
+        gravadas = _gravar_linhas(self.cursor, linhas)
+        self.gravados += gravadas
+        self.lotes += 1
+        return gravadas
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        return False
 
 
 def insert_default_status(
@@ -112,8 +407,9 @@ def insert_default_status(
         cursor.execute(
             """
             INSERT INTO nfe_status
-            (chave_nfe, NUM_NF, ultimo_evento, data_hora, status, transportadora, cidade, uf, dt_saida, tipo_ocorrencia)
-            VALUES (%s, %s, %s, NOW(), %s, %s, %s, %s, %s, %s)
+            (chave_nfe, NUM_NF, ultimo_evento, data_hora, status, transportadora, cidade, uf, dt_saida, tipo_ocorrencia,
+             categoria_status)
+            VALUES (%s, %s, %s, NOW(), %s, %s, %s, %s, %s, %s, %s)
             """,
             (
                 chave_nfe,
@@ -125,8 +421,11 @@ def insert_default_status(
                 uf,
                 dt_saida,
                 tipo_ocorrencia,
+                resolver_status(ultimo_evento),
             ),
         )
+        if num_nf:
+            aplicar_delta(cursor, transportadora, None, resolver_status(ultimo_evento))
     else:
         logger.info(
             f"NF-e {chave_nfe} já existe na tabela `nfe_status`, ignorando inserção."
@@ -147,15 +446,34 @@ def _update_last_processed(cursor, chave_nfe):
         logger.error(f"Erro ao atualizar last_processed_at para {chave_nfe}: {e}")
 
 
-def _update_nfe_status(cursor, chave_nfe, status, ultimo_codigo_ocorrencia, tipo_ocorrencia):
+def _update_nfe_status(cursor, chave_nfe, status, ultimo_codigo_ocorrencia, tipo_ocorrencia,
+                       ultimo_evento_data_hora=None, ultimo_evento_codigo=None):
+    """
+    Atualiza o status da NF-e e a categoria materializada (`categoria_status`)
+    do novo último evento. `ultimo_evento_data_hora`/`ultimo_evento_codigo`
+    identificam o último evento gravado em nfe_logs; se omitidos, são mantidos.
+    Se a categoria mudar, os contadores do rastro são ajustados na mesma transação.
+    """
+    categoria = resolver_status(ultimo_codigo_ocorrencia)
     try:
+        cursor.execute(
+            "SELECT categoria_status, transportadora, NUM_NF FROM nfe_status WHERE chave_nfe = %s FOR UPDATE",
+            (chave_nfe,),
+        )
+        anterior = cursor.fetchall()
         cursor.execute(
             """
             UPDATE nfe_status
-            SET status = %s, ultimo_evento = %s, tipo_ocorrencia = %s, updated_at = NOW()
+            SET status = %s, ultimo_evento = %s, tipo_ocorrencia = %s, updated_at = NOW(),
+                categoria_status = %s,
+                ultimo_evento_data_hora = COALESCE(%s, ultimo_evento_data_hora),
+                ultimo_evento_codigo = COALESCE(%s, ultimo_evento_codigo)
             WHERE chave_nfe = %s
             """,
-            (status, ultimo_codigo_ocorrencia, tipo_ocorrencia, chave_nfe),
+            (status, ultimo_codigo_ocorrencia, tipo_ocorrencia, categoria,
+             ultimo_evento_data_hora, ultimo_evento_codigo, chave_nfe),
         )
+        if anterior and anterior[0][2]:
+            aplicar_delta(cursor, anterior[0][1], anterior[0][0], categoria)
     except mysql.connector.Error as e:
         logger.error(f"Erro ao atualizar nfe_status para {chave_nfe}: {e}")
\ No newline at end of file
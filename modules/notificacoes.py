@@ -0,0 +1,103 @@
+# modules/notificacoes.py
+import logging
+import multiprocessing
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Publicação/assinatura de eventos entre módulos.
+#
+# Os assinantes são chamados na thread de quem publica, então devem ser
+# rápidos (invalidar um cache, enfileirar uma mensagem). O agendador de
+# tarefas roda em outro processo (tasks.start_background_process): lá,
+# `publicar` também encaminha o evento por uma multiprocessing.Queue
+# ("ponte") ao processo do servidor web, onde uma thread o entrega aos
+# assinantes locais.
+
+# Tópicos publicados pela aplicação
+NFE_ATUALIZADA = "nfe_atualizada"  # dados: {'chave_nfe', 'NUM_NF', 'status'}
+TOKEN_CRIADO = "token_criado"  # dados: {'token', 'NUM_NF'}
+# Cadastro de ocorrências/categorias alterado: descrições e categorias exibidas
+# mudam para qualquer NF-e (dados: {})
+OCORRENCIAS_ALTERADAS = "ocorrencias_alteradas"
+
+_assinantes: Dict[str, List[Callable[[Dict[str, Any]], None]]] = {}
+_lock = threading.Lock()
+_ponte_saida: Optional["multiprocessing.Queue"] = None  # definida no processo do agendador
+_stats = {'publicados': 0, 'entregues': 0, 'falhas_assinantes': 0,
+          'enviados_ponte': 0, 'recebidos_ponte': 0}
+
+
+def assinar(topico: str, callback: Callable[[Dict[str, Any]], None]) -> Callable[[], None]:
+    """
+    Registra `callback(dados)` para o tópico.
+
+    Returns:
+        Função que cancela a assinatura.
+    """
+    with _lock:
+        _assinantes[topico] = _assinantes.get(topico, []) + [callback]
+
+    def cancelar():
+        with _lock:
+            _assinantes[topico] = [c for c in _assinantes.get(topico, []) if c is not callback]
+    return cancelar
+
+
+def publicar(topico: str, dados: Dict[str, Any]):
+    """Entrega o evento aos assinantes deste processo e, se houver ponte, ao servidor web."""
+    _stats['publicados'] += 1
+    _entregar(topico, dados)
+    if _ponte_saida is not None:
+        try:
+            _ponte_saida.put_nowait((topico, dados))
+            _stats['enviados_ponte'] += 1
+        except Exception as e:
+            logger.warning(f"Falha ao encaminhar evento '{topico}' ao processo principal: {e}")
+
+
+def _entregar(topico: str, dados: Dict[str, Any]):
+    # Lista copiada na assinatura: leitura sem lock
+    for callback in _assinantes.get(topico, ()):
+        try:
+            callback(dados)
+            _stats['entregues'] += 1
+        except Exception as e:
+            _stats['falhas_assinantes'] += 1
+            logger.error(f"Erro no assinante de '{topico}': {e}", exc_info=True)
+
+
+def criar_ponte() -> "multiprocessing.Queue":
+    """
+    Cria a fila que recebe os eventos de um processo filho e inicia, neste
+    processo, a thread que os entrega aos assinantes. Passe a fila ao filho,
+    que deve chamar `usar_ponte`.
+    """
+    fila = multiprocessing.Queue()
+
+    def _receber():
+        while True:
+            try:
+                topico, dados = fila.get()
+            except (EOFError, OSError):
+                logger.warning("Ponte de notificações encerrada.")
+                return
+            _stats['recebidos_ponte'] += 1
+            _entregar(topico, dados)
+
+    threading.Thread(target=_receber, daemon=True, name="notificacoes-ponte").start()
+    return fila
+
+
+def usar_ponte(fila: Optional["multiprocessing.Queue"]):
+    """No processo filho: passa a encaminhar os eventos publicados para `fila`."""
+    global _ponte_saida
+    _ponte_saida = fila
+
+
+def get_notificacoes_stats() -> Dict[str, Any]:
+    return {
+        **_stats,
+        'assinantes': {topico: len(callbacks) for topico, callbacks in _assinantes.items() if callbacks},
+    }
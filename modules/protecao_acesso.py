@@ -0,0 +1,103 @@
+# modules/protecao_acesso.py
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Iterable, Optional
+
+
+class FiltroBloom:
+    """
+    Conjunto probabilístico de strings: `in` nunca dá falso negativo e dá
+    falso positivo com probabilidade ~`taxa_falso_positivo` enquanto o número
+    de elementos não passar de `capacidade`.
+    """
+
+    def __init__(self, capacidade: int, taxa_falso_positivo: float = 0.01):
+        capacidade = max(capacidade, 1)
+        self.num_bits = max(int(-capacidade * math.log(taxa_falso_positivo) / math.log(2) ** 2), 8)
+        self.num_hashes = max(int(round(self.num_bits / capacidade * math.log(2))), 1)
+        self.capacidade = capacidade
+        self.elementos = 0
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _posicoes(self, valor: str):
+        digest = hashlib.blake2b(valor.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, valor: str):
+        for posicao in self._posicoes(valor):
+            self._bits[posicao >> 3] |= 1 << (posicao & 7)
+        self.elementos += 1
+
+    def update(self, valores: Iterable[str]):
+        for valor in valores:
+            self.add(valor)
+
+    def __contains__(self, valor: str) -> bool:
+        return all(self._bits[posicao >> 3] & (1 << (posicao & 7)) for posicao in self._posicoes(valor))
+
+    def stats(self) -> Dict[str, int]:
+        return {'elementos': self.elementos, 'capacidade': self.capacidade,
+                'bits': self.num_bits, 'hashes': self.num_hashes}
+
+
+class LimitadorPorIp:
+    """
+    Janela deslizante por IP: no máximo `max_eventos` eventos (ex.: tokens
+    inválidos) em `janela_segundos`. Guarda no máximo `max_ips` IPs,
+    descartando os menos recentes.
+    """
+
+    def __init__(self, max_eventos: int, janela_segundos: float, max_ips: int = 10000):
+        self.max_eventos = max_eventos
+        self.janela_segundos = janela_segundos
+        self.max_ips = max_ips
+        self._lock = threading.Lock()
+        self._eventos: "OrderedDict[str, deque]" = OrderedDict()
+        self._stats = {'eventos': 0, 'bloqueios': 0, 'ips_descartados': 0}
+
+    def _janela(self, ip: str, agora: float) -> Optional[deque]:
+        # Chamado com o lock adquirido; remove os eventos fora da janela
+        eventos = self._eventos.get(ip)
+        if eventos is None:
+            return None
+        limite = agora - self.janela_segundos
+        while eventos and eventos[0] <= limite:
+            eventos.popleft()
+        if not eventos:
+            del self._eventos[ip]
+            return None
+        return eventos
+
+    def registrar(self, ip: str):
+        agora = time.monotonic()
+        with self._lock:
+            eventos = self._janela(ip, agora)
+            if eventos is None:
+                eventos = self._eventos[ip] = deque(maxlen=self.max_eventos)
+            eventos.append(agora)
+            self._eventos.move_to_end(ip)
+            self._stats['eventos'] += 1
+            while len(self._eventos) > self.max_ips:
+                self._eventos.popitem(last=False)
+                self._stats['ips_descartados'] += 1
+
+    def segundos_bloqueado(self, ip: str) -> float:
+        """0 se o IP pode continuar; senão, segundos até o evento mais antigo sair da janela."""
+        agora = time.monotonic()
+        with self._lock:
+            eventos = self._janela(ip, agora)
+            if eventos is None or len(eventos) < self.max_eventos:
+                return 0.0
+            self._stats['bloqueios'] += 1
+            return max(eventos[0] + self.janela_segundos - agora, 0.0)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'ips': len(self._eventos), 'max_eventos': self.max_eventos,
+                    'janela_segundos': self.janela_segundos, **self._stats}
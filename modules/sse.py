@@ -0,0 +1,137 @@
+# modules/sse.py
+import json
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from flask import Response
+from modules import notificacoes
+
+logger = logging.getLogger(__name__)
+
+# Server-Sent Events alimentados por `notificacoes`: cada stream assina o
+# tópico, filtra os eventos que interessam ao cliente e os envia assim que
+# o agendador confirma a gravação. Cada stream aberto ocupa uma thread do
+# waitress, por isso:
+# - no máximo `max_streams[grupo]` abertos por processo em cada grupo
+#   (painel do rastro e página pública), para que um grupo não ocupe as
+#   vagas do outro; os demais recebem 503 e o cliente consulta a API
+#   periodicamente. O waitress recebe threads extras para essas vagas
+#   (ver app.configure_waitress);
+# - heartbeat a cada `heartbeat_segundos` (detecta clientes que sumiram);
+# - o stream termina após `duracao_maxima_segundos`; o EventSource reconecta
+#   sozinho depois de `retry_ms`, liberando a thread nesse intervalo.
+GRUPO_PAINEL = "painel"
+GRUPO_PUBLICO = "publico"
+
+_config = {
+    'max_streams': {GRUPO_PAINEL: 4, GRUPO_PUBLICO: 16},
+    'heartbeat_segundos': 15,
+    'duracao_maxima_segundos': 300,
+    'retry_ms': 5000,
+    'fila_maxima': 100,  # Eventos pendentes por stream; além disso são descartados
+}
+
+_lock = threading.Lock()
+_streams_abertos: Dict[str, int] = {}
+_stats = {'streams_abertos_total': 0, 'recusados': 0, 'eventos_enviados': 0, 'eventos_descartados': 0}
+
+
+def init_sse(max_streams: Optional[Dict[str, int]] = None,
+             heartbeat_segundos: Optional[float] = None,
+             duracao_maxima_segundos: Optional[float] = None):
+    """
+    Ajusta os limites dos streams SSE.
+
+    Args:
+        max_streams: Streams simultâneos por processo em cada grupo
+                     ({GRUPO_PAINEL: n, GRUPO_PUBLICO: n}); mesclado aos padrões.
+        heartbeat_segundos: Intervalo entre comentários de heartbeat.
+        duracao_maxima_segundos: Duração de cada stream antes da reconexão.
+    """
+    if max_streams is not None:
+        _config['max_streams'] = {**_config['max_streams'], **max_streams}
+    if heartbeat_segundos is not None:
+        _config['heartbeat_segundos'] = heartbeat_segundos
+    if duracao_maxima_segundos is not None:
+        _config['duracao_maxima_segundos'] = duracao_maxima_segundos
+    logger.info(f"SSE configurado: {_config}")
+
+
+class _StreamEventos:
+    """Iterável da resposta; `close` (chamado pelo servidor) cancela a assinatura e libera a vaga."""
+
+    def __init__(self, topico: str, filtro: Callable[[Dict[str, Any]], bool], grupo: str):
+        self._topico = topico
+        self._grupo = grupo
+        self._filtro = filtro
+        self._fila = queue.Queue(maxsize=_config['fila_maxima'])
+        self._fim = time.monotonic() + _config['duracao_maxima_segundos']
+        self._inicio_enviado = False
+        self._aberto = True
+        self._cancelar = notificacoes.assinar(topico, self._receber)
+
+    def _receber(self, dados: Dict[str, Any]):
+        # Executado na thread de quem publica: só filtra e enfileira
+        if not self._filtro(dados):
+            return
+        try:
+            self._fila.put_nowait(dados)
+        except queue.Full:
+            _stats['eventos_descartados'] += 1
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        if not self._aberto:
+            raise StopIteration
+        if not self._inicio_enviado:
+            self._inicio_enviado = True
+            return f"retry: {_config['retry_ms']}\n\n".encode()
+
+        restante = self._fim - time.monotonic()
+        if restante <= 0:
+            self.close()
+            raise StopIteration
+        try:
+            dados = self._fila.get(timeout=min(_config['heartbeat_segundos'], restante))
+        except queue.Empty:
+            return b": heartbeat\n\n"
+        _stats['eventos_enviados'] += 1
+        return f"event: {self._topico}\ndata: {json.dumps(dados, default=str)}\n\n".encode()
+
+    def close(self):
+        with _lock:
+            if not self._aberto:
+                return
+            self._aberto = False
+            _streams_abertos[self._grupo] -= 1
+        self._cancelar()
+
+
+def resposta_sse(topico: str, grupo: str,
+                 filtro: Callable[[Dict[str, Any]], bool] = lambda dados: True) -> Response:
+    """
+    Resposta text/event-stream com os eventos de `topico` aceitos por `filtro`,
+    ou 503 com Retry-After se o limite de streams abertos do `grupo` foi atingido.
+    """
+    with _lock:
+        if _streams_abertos.get(grupo, 0) >= _config['max_streams'].get(grupo, 0):
+            _stats['recusados'] += 1
+            recusar = True
+        else:
+            _streams_abertos[grupo] = _streams_abertos.get(grupo, 0) + 1
+            _stats['streams_abertos_total'] += 1
+            recusar = False
+    if recusar:
+        return Response("Limite de conexões de atualização atingido.", status=503,
+                        headers={"Retry-After": "30"})
+
+    return Response(_StreamEventos(topico, filtro, grupo), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def get_sse_stats() -> Dict[str, Any]:
+    return {'streams_abertos': dict(_streams_abertos), 'max_streams': dict(_config['max_streams']), **_stats}
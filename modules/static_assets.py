@@ -0,0 +1,116 @@
+# modules/static_assets.py
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+from typing import Dict, NamedTuple, Optional, Tuple
+from flask import Flask, Response, request
+
+try:
+    import brotli
+except ImportError:  # Dependência opcional: sem ela, só gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Arquivos estáticos (app e blueprints) lidos e pré-comprimidos na
+# inicialização e servidos da memória:
+# - url_for('<blueprint>.static', filename=...) ganha `v=<hash do conteúdo>`;
+# - com `v` igual ao hash atual: Cache-Control immutable por um ano;
+#   sem `v` (ou antigo): no-cache, revalidado pela ETag;
+# - Content-Encoding br/gzip conforme Accept-Encoding, com Vary.
+CACHE_IMUTAVEL = "public, max-age=31536000, immutable"
+TAMANHO_MINIMO_COMPRESSAO = 1024  # Bytes; arquivos menores vão sem compressão
+TIPOS_COMPRIMIVEIS = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+
+class _Asset(NamedTuple):
+    conteudo: bytes
+    gzip: Optional[bytes]
+    brotli: Optional[bytes]
+    mimetype: str
+    versao: str  # Hash do conteúdo; também é a ETag
+
+
+_assets: Dict[Tuple[str, str], _Asset] = {}  # (endpoint, filename) -> asset
+
+
+def _carregar_asset(caminho: str) -> _Asset:
+    with open(caminho, "rb") as f:
+        conteudo = f.read()
+    mimetype = mimetypes.guess_type(caminho)[0] or "application/octet-stream"
+    comprimido_gzip = comprimido_brotli = None
+    if len(conteudo) >= TAMANHO_MINIMO_COMPRESSAO and mimetype.startswith(TIPOS_COMPRIMIVEIS):
+        comprimido_gzip = gzip.compress(conteudo, compresslevel=9, mtime=0)
+        if brotli is not None:
+            comprimido_brotli = brotli.compress(conteudo, quality=11)
+    return _Asset(conteudo, comprimido_gzip, comprimido_brotli, mimetype,
+                  hashlib.sha256(conteudo).hexdigest()[:12])
+
+
+def _servir(endpoint: str, view_original):
+    def servir_asset(filename):
+        asset = _assets.get((endpoint, filename))
+        if asset is None:
+            return view_original(filename=filename)
+
+        if request.if_none_match.contains_weak(asset.versao):
+            resposta = Response(status=304)
+        else:
+            corpo, codificacao = asset.conteudo, None
+            aceitas = request.accept_encodings
+            if asset.brotli is not None and aceitas["br"]:
+                corpo, codificacao = asset.brotli, "br"
+            elif asset.gzip is not None and aceitas["gzip"]:
+                corpo, codificacao = asset.gzip, "gzip"
+            resposta = Response(corpo, mimetype=asset.mimetype)
+            if codificacao:
+                resposta.headers["Content-Encoding"] = codificacao
+
+        resposta.set_etag(asset.versao)
+        resposta.headers["Cache-Control"] = CACHE_IMUTAVEL if request.args.get("v") == asset.versao else "no-cache"
+        if asset.gzip is not None:
+            resposta.vary.add("Accept-Encoding")
+        return resposta
+
+    servir_asset.__name__ = f"{endpoint.replace('.', '_')}_asset"
+    return servir_asset
+
+
+def init_static_assets(app: Flask):
+    """
+    Carrega e pré-comprime os arquivos estáticos do app e de cada blueprint
+    registrado, troca as views `*.static` pela versão em memória e passa a
+    acrescentar `v=<hash>` nas URLs geradas por url_for.
+    """
+    pastas = {"static": app.static_folder}
+    pastas.update({f"{nome}.static": bp.static_folder for nome, bp in app.blueprints.items()})
+
+    total_bytes = total_comprimido = 0
+    for endpoint, pasta in pastas.items():
+        if not pasta or not os.path.isdir(pasta) or endpoint not in app.view_functions:
+            continue
+        for raiz, _, arquivos in os.walk(pasta):
+            for arquivo in arquivos:
+                caminho = os.path.join(raiz, arquivo)
+                filename = os.path.relpath(caminho, pasta).replace(os.sep, "/")
+                try:
+                    asset = _carregar_asset(caminho)
+                except OSError as e:
+                    logger.warning(f"Arquivo estático ignorado ({caminho}): {e}")
+                    continue
+                _assets[(endpoint, filename)] = asset
+                total_bytes += len(asset.conteudo)
+                total_comprimido += len(asset.brotli or asset.gzip or asset.conteudo)
+        app.view_functions[endpoint] = _servir(endpoint, app.view_functions[endpoint])
+
+    @app.url_defaults
+    def _versao_do_asset(endpoint, values):
+        if endpoint in pastas and "filename" in values and "v" not in values:
+            asset = _assets.get((endpoint, values["filename"]))
+            if asset is not None:
+                values["v"] = asset.versao
+
+    logger.info(f"{len(_assets)} arquivos estáticos em memória: {total_bytes} bytes, "
+                f"{total_comprimido} comprimidos ({'brotli' if brotli else 'gzip'}).")
@@ -1,66 +1,268 @@
 import logging
-from typing import Optional
+import threading
+import time
+from types import MappingProxyType
+from typing import Optional, NamedTuple, Mapping, Dict, Any
 import mysql.connector
-from modules.database import get_mysql_connection
+from modules.database import get_mysql_connection, close_connection, ensure_column, ensure_index
+from modules.status_contadores import agendar_reconciliacao
 
 logger = logging.getLogger(__name__)
 
 # Variável para controle de inicialização
 _initialized = False
+_init_lock = threading.Lock()
+_ultima_tentativa_init = 0.0
+INIT_RETRY_SECONDS = 30  # Intervalo mínimo entre tentativas de carga sob demanda
+VERSAO_CHECK_SECONDS = 30  # Intervalo mínimo entre consultas à versão do mapa no banco
+
+
+class _MapaCategorias(NamedTuple):
+    """Retrato imutável do mapeamento código -> categoria; trocado inteiro a cada recarga."""
+    versao: int
+    mapa: Mapping[str, str]
+    carregado_em: float
+    duracao_ms: float
+
+
+# Leitores apenas leem a referência atual (sem lock); recargas publicam um novo retrato
+_mapa = _MapaCategorias(versao=-1, mapa=MappingProxyType({}), carregado_em=0.0, duracao_ms=0.0)
+_proxima_verificacao = 0.0
+_recarga_forcada = False
+_recarga_lock = threading.Lock()
 
 # Dicionário para armazenar o mapeamento de código de ocorrência para descrição da categoria
-CODIGO_PARA_CATEGORIA = {}
+# (mantido por compatibilidade; sempre aponta para o mapa do retrato atual)
+CODIGO_PARA_CATEGORIA = _mapa.mapa
 
-def init_status(conn: mysql.connector.MySQLConnection):
+
+def _garantir_tabela_versao(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS status_mapa_versao (
+            id TINYINT PRIMARY KEY,
+            versao BIGINT NOT NULL DEFAULT 0,
+            atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("INSERT IGNORE INTO status_mapa_versao (id, versao) VALUES (1, 0)")
+
+
+# Mesma regra de `_status_por_categoria`, em SQL, para a coluna materializada
+# nfe_status.categoria_status (usada pelos filtros e contagens do rastro)
+_RECALCULAR_CATEGORIAS_QUERY = """
+    UPDATE nfe_status s
+    LEFT JOIN (
+        SELECT o.CODIGO_SSW, MAX(UPPER(nc.DESCRICAO)) AS categoria
+        FROM ocorrencias o
+        JOIN nfe_categorias nc ON o.categoria_id = nc.id
+        GROUP BY o.CODIGO_SSW
+    ) m ON m.CODIGO_SSW = s.ultimo_evento
+    SET s.categoria_status = CASE
+        WHEN s.ultimo_evento IS NULL OR s.ultimo_evento = '' THEN 'NAO_ENCONTRADO'
+        WHEN m.categoria IN ('ENTREGUE', 'PROBLEMA') THEN m.categoria
+        ELSE 'EM_TRANSITO'
+    END
+    WHERE NOT (s.categoria_status <=> CASE
+        WHEN s.ultimo_evento IS NULL OR s.ultimo_evento = '' THEN 'NAO_ENCONTRADO'
+        WHEN m.categoria IN ('ENTREGUE', 'PROBLEMA') THEN m.categoria
+        ELSE 'EM_TRANSITO'
+    END)
+"""
+
+
+def garantir_coluna_categoria(cursor) -> int:
     """
-    Inicializa o módulo de status carregando as descrições de status do banco de dados.
+    Garante a coluna nfe_status.categoria_status (status de entrega calculado a
+    partir de ultimo_evento) e os índices da listagem paginada do rastro; ao
+    criar a coluna, preenche todas as linhas.
 
-    Args:
-        conn: Uma conexão ativa com o banco de dados MySQL.
+    Returns:
+        Quantidade de NF-es preenchidas (0 se a coluna já existia).
     """
-    global _initialized, CODIGO_PARA_CATEGORIA
+    criada = ensure_column(cursor, "nfe_status", "categoria_status",
+                           "VARCHAR(20) NOT NULL DEFAULT 'NAO_ENCONTRADO'")
+    ensure_index(cursor, "nfe_status", "idx_nfe_status_categoria", "categoria_status, updated_at, chave_nfe")
+    ensure_index(cursor, "nfe_status", "idx_nfe_status_updated", "updated_at, chave_nfe")
+    return recalcular_categorias(cursor) if criada else 0
+
+
+def recalcular_categorias(cursor) -> int:
+    """
+    Recalcula nfe_status.categoria_status no servidor, só nas linhas que mudaram.
+    Chamar na mesma transação de alterações nos vínculos ocorrência -> categoria;
+    se algo mudar, quem chamou deve chamar `agendar_reconciliacao()` depois do
+    commit, para que os contadores do rastro sejam recontados com as novas categorias.
+
+    Returns:
+        Quantidade de NF-es cuja categoria mudou.
+    """
+    inicio = time.monotonic()
+    cursor.execute(_RECALCULAR_CATEGORIAS_QUERY)
+    alteradas = cursor.rowcount
+    logger.info(f"categoria_status recalculada: {alteradas} NF-es alteradas em {time.monotonic() - inicio:.2f}s.")
+    return alteradas
+
+
+def _ler_versao(cursor) -> int:
+    cursor.execute("SELECT versao FROM status_mapa_versao WHERE id = 1")
+    row = cursor.fetchone()
+    return int(row[0]) if row else 0
 
-    if _initialized:
-        return
 
-    CODIGO_PARA_CATEGORIA = {}
+def _carregar_mapa(conn) -> bool:
+    """Lê versão e mapeamento do banco e publica um novo retrato."""
+    global _mapa, CODIGO_PARA_CATEGORIA, _proxima_verificacao
+    inicio = time.monotonic()
     cursor = conn.cursor()
     try:
+        categorias_preenchidas = 0
+        if not _initialized:
+            _garantir_tabela_versao(cursor)
+            categorias_preenchidas = garantir_coluna_categoria(cursor)
+        versao = _ler_versao(cursor)
         # Busca todas as ocorrências com suas categorias
         cursor.execute("""
             SELECT o.CODIGO_SSW, nc.DESCRICAO
             FROM ocorrencias o
             JOIN nfe_categorias nc ON o.categoria_id = nc.id
         """)
-        ocorrencias_categorias = cursor.fetchall()
-        for codigo, descricao in ocorrencias_categorias:
-            CODIGO_PARA_CATEGORIA[codigo] = descricao.upper()
-        logger.info(f"Mapeamento de códigos de ocorrência carregado do banco de dados: {len(CODIGO_PARA_CATEGORIA)} registros.")
-        _initialized = True
+        mapa = {}
+        for codigo, descricao in cursor.fetchall():
+            mapa[codigo] = descricao.upper()
+        conn.commit()
+        if categorias_preenchidas:
+            agendar_reconciliacao()
     except mysql.connector.Error as err:
         logger.error(f"Erro ao carregar mapeamento de status do banco de dados: {err}")
+        return False
     finally:
         cursor.close()
 
-def determinar_status(conn: mysql.connector.MySQLConnection, ultimo_evento: Optional[str]) -> str:
+    duracao_ms = (time.monotonic() - inicio) * 1000
+    _mapa = _MapaCategorias(versao, MappingProxyType(mapa), time.time(), duracao_ms)
+    CODIGO_PARA_CATEGORIA = _mapa.mapa
+    _proxima_verificacao = time.monotonic() + VERSAO_CHECK_SECONDS
+    logger.info(f"Mapeamento de códigos de ocorrência v{versao} carregado do banco de dados: "
+                f"{len(mapa)} registros em {duracao_ms:.1f} ms.")
+    return True
+
+
+def init_status(conn: mysql.connector.MySQLConnection):
     """
-    Determina o status da NF-e com base no último evento e nas categorias do banco de dados.
+    Inicializa o módulo de status carregando as descrições de status do banco de dados.
+
+    Depois da carga inicial, o mapeamento é recarregado sozinho quando a versão
+    em `status_mapa_versao` muda (ver `invalidar_mapa_categorias`).
 
     Args:
         conn: Uma conexão ativa com o banco de dados MySQL.
-        ultimo_evento: O código do último evento da tabela nfe_status.
+    """
+    global _initialized
 
-    Returns:
-        str: Status da NF-e: "ENTREGUE", "PROBLEMA", "EM_TRANSITO" ou "NAO_ENCONTRADO".
+    if _initialized:
+        return
+
+    with _init_lock:
+        if _initialized:
+            return
+        if _carregar_mapa(conn):
+            _initialized = True
+
+
+def _garantir_inicializado() -> bool:
+    """Carrega o mapeamento sob demanda (uma conexão por processo, não por consulta)."""
+    global _ultima_tentativa_init
+    if _initialized:
+        return True
+    with _init_lock:
+        if _initialized or time.monotonic() - _ultima_tentativa_init < INIT_RETRY_SECONDS:
+            return _initialized
+        _ultima_tentativa_init = time.monotonic()
+    conn = get_mysql_connection()
+    if not conn:
+        logger.error("Falha ao obter conexão com o banco de dados para inicializar o módulo de status.")
+        return False
+    try:
+        init_status(conn)
+    finally:
+        close_connection(conn)
+    return _initialized
+
+
+def _verificar_versao_em_segundo_plano():
+    global _proxima_verificacao, _recarga_forcada
+    conn = None
+    try:
+        conn = get_mysql_connection()
+        if not conn:
+            return
+        cursor = conn.cursor()
+        try:
+            versao = _ler_versao(cursor)
+            conn.commit()
+        finally:
+            cursor.close()
+        if versao != _mapa.versao or _recarga_forcada:
+            logger.info(f"Versão do mapeamento de categorias mudou ({_mapa.versao} -> {versao}); recarregando.")
+            _recarga_forcada = False
+            _carregar_mapa(conn)
+    except (mysql.connector.Error, RuntimeError) as err:
+        logger.error(f"Erro ao verificar versão do mapeamento de status: {err}")
+    finally:
+        _proxima_verificacao = time.monotonic() + VERSAO_CHECK_SECONDS
+        if conn:
+            close_connection(conn)
+        _recarga_lock.release()
+
+
+def _agendar_verificacao_versao():
+    """Dispara (no máximo a cada VERSAO_CHECK_SECONDS) a checagem da versão, sem bloquear quem lê."""
+    if time.monotonic() < _proxima_verificacao or not _initialized:
+        return
+    if _recarga_lock.acquire(blocking=False):
+        threading.Thread(target=_verificar_versao_em_segundo_plano, daemon=True,
+                         name="mapa-categorias").start()
+
+
+def invalidar_mapa_categorias(cursor=None):
     """
-    if not _initialized:
-        logger.warning("Módulo de status não foi inicializado. Execute init_status antes de determinar o status.")
-        return "EM_TRANSITO"  # Retorno padrão caso não inicializado
+    Sinaliza que o mapeamento código -> categoria mudou.
+
+    Com `cursor`, incrementa a versão em `status_mapa_versao` na transação de
+    quem chamou (faça o commit junto com a alteração): todos os processos
+    recarregam o mapa em até VERSAO_CHECK_SECONDS. Neste processo a
+    verificação é antecipada para a próxima consulta. Sem `cursor`, apenas
+    este processo recarrega.
+    """
+    global _proxima_verificacao, _recarga_forcada
+    if cursor is None:
+        _recarga_forcada = True
+    else:
+        try:
+            cursor.execute("UPDATE status_mapa_versao SET versao = versao + 1 WHERE id = 1")
+        except mysql.connector.Error as err:
+            # Tabela criada por init_status; sem ela, só este processo é avisado
+            logger.warning(f"Não foi possível incrementar a versão do mapeamento de categorias: {err}")
+            _recarga_forcada = True
+    _proxima_verificacao = 0.0
+
+
+def get_mapa_status() -> Dict[str, Any]:
+    """Versão, tamanho e tempo da última carga do mapeamento em memória."""
+    atual = _mapa
+    return {
+        'versao': atual.versao,
+        'tamanho': len(atual.mapa),
+        'duracao_ultima_carga_ms': round(atual.duracao_ms, 1),
+        'carregado_em': atual.carregado_em,
+    }
 
+
+def _status_por_categoria(ultimo_evento: Optional[str]) -> str:
     if not ultimo_evento:
         return "NAO_ENCONTRADO"
 
-    categoria = CODIGO_PARA_CATEGORIA.get(ultimo_evento)
+    categoria = _mapa.mapa.get(ultimo_evento)
 
     if categoria == "ENTREGUE":
         return "ENTREGUE"
@@ -71,6 +273,44 @@ def determinar_status(conn: mysql.connector.MySQLConnection, ultimo_evento: Opti
     else:
         return "EM_TRANSITO"
 
+def resolver_status(ultimo_evento: Optional[str]) -> str:
+    """
+    Determina o status da NF-e a partir do código do último evento, usando só
+    o mapeamento em memória (sem conexão por chamada; seguro entre threads).
+
+    Se o módulo ainda não foi inicializado no processo, carrega o mapeamento
+    uma vez pelo pool de conexões.
+
+    Returns:
+        str: Status da NF-e: "ENTREGUE", "PROBLEMA", "EM_TRANSITO" ou "NAO_ENCONTRADO".
+    """
+    if not _garantir_inicializado():
+        logger.warning("Módulo de status não inicializado; usando EM_TRANSITO.")
+        return "EM_TRANSITO"
+    _agendar_verificacao_versao()
+    return _status_por_categoria(ultimo_evento)
+
+def determinar_status(conn: mysql.connector.MySQLConnection, ultimo_evento: Optional[str]) -> str:
+    """
+    Determina o status da NF-e com base no último evento e nas categorias do banco de dados.
+
+    A conexão não é usada: o mapeamento já está em memória. Prefira
+    `resolver_status`, que dispensa a conexão.
+
+    Args:
+        conn: Uma conexão ativa com o banco de dados MySQL.
+        ultimo_evento: O código do último evento da tabela nfe_status.
+
+    Returns:
+        str: Status da NF-e: "ENTREGUE", "PROBLEMA", "EM_TRANSITO" ou "NAO_ENCONTRADO".
+    """
+    if not _initialized:
+        logger.warning("Módulo de status não foi inicializado. Execute init_status antes de determinar o status.")
+        return "EM_TRANSITO"  # Retorno padrão caso não inicializado
+
+    _agendar_verificacao_versao()
+    return _status_por_categoria(ultimo_evento)
+
 # Função para inicializar o módulo (deve ser chamada na inicialização da aplicação)
 def inicializar_status_app():
     conn = get_mysql_connection()
@@ -0,0 +1,307 @@
+# modules/status_contadores.py
+import atexit
+import logging
+import os
+import threading
+import time
+from types import MappingProxyType
+from typing import Optional, NamedTuple, Mapping, Dict, Any
+import mysql.connector
+from modules.database import get_mysql_connection, close_connection
+
+logger = logging.getLogger(__name__)
+
+# Totais de nfe_status por (categoria_status, transportadora), mantidos na
+# tabela nfe_status_contadores:
+# - deltas aplicados na mesma transação que muda a categoria de uma NF-e
+#   (`aplicar_delta`, chamado por `_update_nfe_status`/`insert_default_status`);
+# - reconciliação periódica contra um GROUP BY em nfe_status, que corrige
+#   qualquer desvio (cargas em massa, falhas, edições manuais);
+# - leitura pelo rastro através de um retrato em memória com TTL curto.
+CATEGORIAS = ('ENTREGUE', 'EM_TRANSITO', 'PROBLEMA', 'NAO_ENCONTRADO')
+
+_config = {
+    'ttl_segundos': 5,  # Validade do retrato em memória lido por get_contadores
+    'reconciliacao_segundos': 900,  # Intervalo entre reconciliações completas
+    'atraso_reconciliacao_segundos': 2,  # Espera após agendar_reconciliacao (agrupa pedidos próximos)
+}
+
+_CONTAGEM_QUERY = """
+    SELECT categoria_status, COALESCE(transportadora, ''), COUNT(*)
+    FROM nfe_status
+    WHERE NUM_NF IS NOT NULL AND NUM_NF != ''
+    GROUP BY categoria_status, COALESCE(transportadora, '')
+"""
+
+_DELTA_QUERY = """
+    INSERT INTO nfe_status_contadores (categoria_status, transportadora, total)
+    VALUES {valores}
+    ON DUPLICATE KEY UPDATE total = total + VALUES(total)
+"""
+
+
+class _Retrato(NamedTuple):
+    """Contagens prontas para a resposta de /rastro/api/status."""
+    por_categoria: Mapping[str, int]
+    por_transportadora: Mapping[str, Mapping[str, int]]
+    lido_em: float
+    origem: str  # 'contadores' ou 'contagem' (tabela ainda vazia)
+
+
+_retrato: Optional[_Retrato] = None
+_retrato_lock = threading.Lock()
+_reconciliar_agora = threading.Event()
+_reconciliacao_lock = threading.Lock()
+# PID do processo em que a thread de reconciliação roda: um filho criado por
+# fork herda as variáveis, mas não a thread.
+_reconciliador_pid: Optional[int] = None
+_stats = {'deltas': 0, 'deltas_com_erro': 0, 'leituras': 0, 'leituras_contagem': 0,
+          'reconciliacoes': 0, 'linhas_corrigidas': 0}
+
+
+def garantir_tabela_contadores(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS nfe_status_contadores (
+            categoria_status VARCHAR(20) NOT NULL,
+            transportadora VARCHAR(255) NOT NULL DEFAULT '',
+            total INT NOT NULL DEFAULT 0,
+            atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (categoria_status, transportadora)
+        )
+    """)
+
+
+def aplicar_delta(cursor, transportadora: Optional[str], categoria_anterior: Optional[str], categoria_nova: Optional[str]):
+    """
+    Move uma NF-e de `categoria_anterior` para `categoria_nova` nos contadores,
+    na transação de quem chamou. Use `categoria_anterior=None` para uma NF-e
+    nova. Falhas são apenas registradas: a reconciliação corrige o total.
+    """
+    if categoria_anterior == categoria_nova:
+        return
+    transportadora = transportadora or ''
+    linhas = []
+    if categoria_anterior:
+        linhas.append((categoria_anterior, transportadora, -1))
+    if categoria_nova:
+        linhas.append((categoria_nova, transportadora, 1))
+    try:
+        cursor.execute(
+            _DELTA_QUERY.format(valores=", ".join(["(%s, %s, %s)"] * len(linhas))),
+            [valor for linha in linhas for valor in linha],
+        )
+        _stats['deltas'] += 1
+    except mysql.connector.Error as err:
+        _stats['deltas_com_erro'] += 1
+        logger.warning(f"Falha ao atualizar contadores de status ({categoria_anterior} -> {categoria_nova}): {err}")
+
+
+def _contar(cursor) -> Dict[tuple, int]:
+    cursor.execute(_CONTAGEM_QUERY)
+    return {(categoria, transportadora): total for categoria, transportadora, total in cursor.fetchall()}
+
+
+def _ler_tabela(cursor) -> Dict[tuple, int]:
+    cursor.execute("SELECT categoria_status, transportadora, total FROM nfe_status_contadores")
+    return {(categoria, transportadora): total for categoria, transportadora, total in cursor.fetchall()}
+
+
+def reconciliar_contadores(conn) -> int:
+    """
+    Recalcula os totais a partir de nfe_status e corrige só as linhas que
+    divergem (sem bloquear nfe_status durante a contagem).
+
+    A contagem e a leitura dos contadores são feitas no mesmo retrato
+    (transação REPEATABLE READ com snapshot consistente) e a correção é
+    gravada como delta (`total = total + (real - lido)`): os `aplicar_delta`
+    confirmados durante a contagem não aparecem em nenhum dos dois lados e
+    continuam somados ao total.
+
+    Returns:
+        Quantidade de linhas de nfe_status_contadores corrigidas.
+    """
+    inicio = time.monotonic()
+    cursor = conn.cursor()
+    try:
+        if conn.in_transaction:
+            conn.commit()
+        conn.start_transaction(consistent_snapshot=True, isolation_level='REPEATABLE READ')
+        reais = _contar(cursor)
+        gravados = _ler_tabela(cursor)
+        divergentes = [
+            (categoria, transportadora, reais.get((categoria, transportadora), 0) - gravados.get((categoria, transportadora), 0))
+            for categoria, transportadora in set(reais) | set(gravados)
+            if reais.get((categoria, transportadora), 0) != gravados.get((categoria, transportadora))
+        ]
+        if divergentes:
+            cursor.executemany(_DELTA_QUERY.format(valores="(%s, %s, %s)"), divergentes)
+        cursor.execute("DELETE FROM nfe_status_contadores WHERE total = 0")
+        conn.commit()
+    finally:
+        cursor.close()
+
+    _stats['reconciliacoes'] += 1
+    _stats['linhas_corrigidas'] += len(divergentes)
+    if gravados and divergentes:
+        logger.warning(f"Contadores de status reconciliados: {len(divergentes)} linhas corrigidas "
+                       f"em {time.monotonic() - inicio:.2f}s.")
+    else:
+        logger.info(f"Contadores de status reconciliados em {time.monotonic() - inicio:.2f}s "
+                    f"({len(divergentes)} linhas gravadas).")
+    invalidar_retrato()
+    return len(divergentes)
+
+
+def _montar_retrato(contagens: Dict[tuple, int], origem: str) -> _Retrato:
+    por_categoria = dict.fromkeys(CATEGORIAS, 0)
+    por_transportadora: Dict[str, Dict[str, int]] = {}
+    for (categoria, transportadora), total in contagens.items():
+        por_categoria[categoria] = por_categoria.get(categoria, 0) + total
+        contagem = por_transportadora.setdefault(transportadora, dict.fromkeys(CATEGORIAS, 0))
+        contagem[categoria] = contagem.get(categoria, 0) + total
+    return _Retrato(
+        por_categoria=MappingProxyType(por_categoria),
+        por_transportadora=MappingProxyType({t: MappingProxyType(c) for t, c in por_transportadora.items()}),
+        lido_em=time.monotonic(),
+        origem=origem,
+    )
+
+
+def _ler_retrato() -> _Retrato:
+    conn = get_mysql_connection()
+    if not conn:
+        raise RuntimeError("Falha na conexão com o MySQL")
+    try:
+        cursor = conn.cursor()
+        try:
+            try:
+                contagens = _ler_tabela(cursor)
+            except mysql.connector.Error as err:
+                logger.warning(f"Tabela nfe_status_contadores indisponível, contando em nfe_status: {err}")
+                contagens = {}
+            if contagens:
+                _stats['leituras'] += 1
+                return _montar_retrato(contagens, 'contadores')
+            # Contadores frios (tabela ainda não reconciliada): conta direto, com o mesmo TTL
+            _stats['leituras_contagem'] += 1
+            return _montar_retrato(_contar(cursor), 'contagem')
+        finally:
+            cursor.close()
+    finally:
+        close_connection(conn)
+
+
+def get_contadores(transportadora: Optional[str] = None) -> Dict[str, int]:
+    """
+    Totais por status de entrega ({'ENTREGUE': n, ..., 'TOTAL': n}), opcionalmente
+    de uma transportadora. Servido da memória; o banco é lido no máximo uma vez
+    a cada `ttl_segundos` por processo. Se a leitura falhar, devolve o último
+    retrato disponível.
+    """
+    global _retrato
+    retrato = _retrato
+    if retrato is None or time.monotonic() - retrato.lido_em >= _config['ttl_segundos']:
+        with _retrato_lock:
+            retrato = _retrato
+            if retrato is None or time.monotonic() - retrato.lido_em >= _config['ttl_segundos']:
+                try:
+                    retrato = _retrato = _ler_retrato()
+                except (mysql.connector.Error, RuntimeError) as err:
+                    if retrato is None:
+                        raise
+                    logger.warning(f"Usando contadores de status em memória após falha na leitura: {err}")
+
+    if transportadora is None:
+        contagem = dict(retrato.por_categoria)
+    else:
+        contagem = dict(retrato.por_transportadora.get(transportadora, dict.fromkeys(CATEGORIAS, 0)))
+    contagem['TOTAL'] = sum(contagem.values())
+    return contagem
+
+
+def invalidar_retrato():
+    """Faz a próxima chamada a `get_contadores` neste processo ler o banco."""
+    global _retrato
+    _retrato = None
+
+
+def agendar_reconciliacao():
+    """
+    Pede uma reconciliação antecipada (após cargas em massa ou recálculo de
+    categorias). Se a thread de reconciliação ainda não roda neste processo
+    (script de importação, processo do agendador), ela é iniciada aqui.
+    """
+    _reconciliar_agora.set()
+    _iniciar_reconciliador()
+
+
+def get_contadores_stats() -> Dict[str, Any]:
+    retrato = _retrato
+    return {
+        **_stats,
+        'origem_retrato': retrato.origem if retrato else None,
+        'idade_retrato_segundos': round(time.monotonic() - retrato.lido_em, 1) if retrato else None,
+    }
+
+
+def _executar_reconciliacao():
+    with _reconciliacao_lock:
+        _reconciliar_agora.clear()
+        conn = None
+        try:
+            conn = get_mysql_connection()
+            if conn:
+                reconciliar_contadores(conn)
+        except (mysql.connector.Error, RuntimeError) as err:
+            logger.error(f"Erro ao reconciliar contadores de status: {err}")
+        finally:
+            if conn:
+                close_connection(conn)
+
+
+def _reconciliar_periodicamente():
+    while True:
+        antecipada = _reconciliar_agora.wait(timeout=_config['reconciliacao_segundos'])
+        if antecipada:
+            time.sleep(_config['atraso_reconciliacao_segundos'])
+        _executar_reconciliacao()
+
+
+def _reconciliar_na_saida():
+    """Executa, antes de o processo terminar, a reconciliação pedida e ainda pendente."""
+    if _reconciliar_agora.is_set():
+        _executar_reconciliacao()
+    else:
+        with _reconciliacao_lock:  # Aguarda a reconciliação em andamento na thread
+            pass
+
+
+def _iniciar_reconciliador():
+    global _reconciliador_pid
+    with _retrato_lock:
+        if _reconciliador_pid == os.getpid():
+            return
+        _reconciliador_pid = os.getpid()
+    atexit.register(_reconciliar_na_saida)
+    threading.Thread(target=_reconciliar_periodicamente, daemon=True, name="contadores-status").start()
+
+
+def init_status_contadores(conn, ttl_segundos: Optional[float] = None,
+                           reconciliacao_segundos: Optional[float] = None):
+    """
+    Garante a tabela de contadores, reconcilia uma vez (aquecendo a tabela) e
+    inicia a reconciliação periódica em uma thread deste processo.
+    """
+    if ttl_segundos is not None:
+        _config['ttl_segundos'] = ttl_segundos
+    if reconciliacao_segundos is not None:
+        _config['reconciliacao_segundos'] = reconciliacao_segundos
+
+    try:
+        with conn.cursor() as cursor:
+            garantir_tabela_contadores(cursor)
+        reconciliar_contadores(conn)
+    except mysql.connector.Error as err:
+        logger.error(f"Erro ao inicializar contadores de status: {err}")
+
+    _iniciar_reconciliador()
@@ -1,13 +1,14 @@
 # modules/tasks.py
 import logging
-from typing import Optional
+from typing import Optional, Dict, Any, List, Tuple
 import mysql.connector
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from multiprocessing import Process
 from modules.database import get_mysql_connection, close_connection
-from modules.tracking import fetch_tracking_data
-from modules.status import determinar_status, init_status
-from modules import nfe_tracking_logger
+from modules.tracking import fetch_tracking_data, fetch_many, init_tracking, get_tracking_stats, ApiIndisponivelError
+from modules.status import resolver_status
+from modules import nfe_tracking_logger, notificacoes
 import time
 import schedule
 import base64
@@ -19,27 +20,73 @@ logger = logging.getLogger(__name__)
 _config = {
     'max_retries': 3,
     'default_status': 'EM_TRANSITO',
-    'log_all_events': True
+    'log_all_events': True,
+    'fetch_workers': 8,  # Consultas simultâneas à API de rastreamento
+    'fetch_mode': 'threads',  # 'threads' ou 'async' (aiohttp, ver tracking.fetch_many)
+    'async_batch_size': 200,  # NF-es por rodada de fetch_many no modo 'async'
+    'event_batch_size': 500,  # Eventos acumulados (de várias NF-es) por INSERT em nfe_logs
+    'event_batch_ms': 500,  # Tempo máximo de um evento no buffer antes da gravação
 }
 
+# Marca "dados da API ainda não buscados" em processar_nfe (None significa falha na busca)
+_NAO_BUSCADO = object()
+
+# Marca d'água de NF-e já consultada cujo último evento não tem data_hora legível
+# (ou que ainda não tem eventos): nfe_status.ultimo_evento_data_hora NULL fica
+# reservado para "nunca consultada com sucesso".
+MARCA_SEM_DATA = datetime(1970, 1, 1)
+
 def init_tasks(max_retries: Optional[int] = None,
-              log_all_events: Optional[bool] = None):
+              log_all_events: Optional[bool] = None,
+              fetch_workers: Optional[int] = None,
+              max_requests_per_second: Optional[float] = None,
+              fetch_mode: Optional[str] = None,
+              event_batch_size: Optional[int] = None,
+              event_batch_ms: Optional[int] = None):
     """
     Inicializa o módulo de tasks com configurações personalizadas
+
+    Args:
+        max_retries: Número máximo de tentativas.
+        log_all_events: Se todos os eventos devem ser registrados.
+        fetch_workers: Número de threads consultando a API de rastreamento em paralelo.
+        max_requests_per_second: Limite global de consultas por segundo à API
+                                 (token bucket de `modules.tracking`).
+        fetch_mode: 'threads' (padrão) ou 'async'. No modo 'async' as consultas
+                    usam o cliente aiohttp de `tracking.fetch_many`, com a
+                    concorrência limitada pelas conexões por host do cliente.
+        event_batch_size: Eventos gravados por INSERT em nfe_logs, somando várias
+                          NF-es (1 = um INSERT por NF-e).
+        event_batch_ms: Tempo máximo, em ms, que um evento aguarda no buffer.
     """
     if max_retries is not None:
         _config['max_retries'] = max_retries
     if log_all_events is not None:
-        _config['max_retries'] = max_retries
+        _config['log_all_events'] = log_all_events
+    if fetch_workers is not None:
+        _config['fetch_workers'] = fetch_workers
+        # Uma conexão keep-alive por thread de consulta
+        init_tracking(pool_maxsize=fetch_workers)
+    if max_requests_per_second is not None:
+        init_tracking(rate_limit_per_second=max_requests_per_second)
+    if fetch_mode is not None:
+        _config['fetch_mode'] = fetch_mode
+    if event_batch_size is not None:
+        _config['event_batch_size'] = event_batch_size
+    if event_batch_ms is not None:
+        _config['event_batch_ms'] = event_batch_ms
     logger.info(f"Módulo de tasks inicializado com configuração: {_config}")
 
 def _gerar_token_base64():
     """Gera um token único e o codifica em base64."""
     return base64.urlsafe_b64encode(uuid.uuid4().bytes).decode('ascii').rstrip('=')
 
-def gerar_e_salvar_token_nfe(cursor, num_nf: str):
+def gerar_e_salvar_token_nfe(cursor, num_nf: str, alteracoes: Optional[List[Tuple[str, Dict[str, Any]]]] = None):
     """
     Gera um token base64 para a NF e o salva no banco de dados.
+
+    O token entra em `alteracoes` para ser publicado (`notificacoes.TOKEN_CRIADO`)
+    depois do commit de quem chamou; sem a lista, a publicação é imediata.
     """
     try:
         token = _gerar_token_base64()
@@ -48,6 +95,7 @@ def gerar_e_salvar_token_nfe(cursor, num_nf: str):
             (num_nf, token)
         )
         logger.info(f"Token gerado e salvo para a NF {num_nf}: {token}")
+        _registrar_evento(alteracoes, notificacoes.TOKEN_CRIADO, {'token': token, 'NUM_NF': num_nf})
         return True
     except mysql.connector.IntegrityError:
         logger.info(f"Token já existe para a NF {num_nf}. Ignorando.")
@@ -56,15 +104,85 @@ def gerar_e_salvar_token_nfe(cursor, num_nf: str):
         logger.error(f"Erro ao gerar e salvar token para a NF {num_nf}: {e}")
         return False
 
-def processar_nfe(cursor, chave_nfe: str, num_nf: str, transportadora: str, cidade: str, uf: str, dt_saida: str) -> bool:
+def _data_hora_evento(evento: Dict[str, Any]) -> Optional[datetime]:
+    """Converte o data_hora do evento da API; None se ausente ou em formato desconhecido."""
+    valor = (evento.get("data_hora") or "").strip()
+    if not valor:
+        return None
+    try:
+        return datetime.fromisoformat(valor.replace("Z", "+00:00")).replace(tzinfo=None)
+    except ValueError:
+        pass
+    for formato in ("%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M"):
+        try:
+            return datetime.strptime(valor, formato)
+        except ValueError:
+            continue
+    return None
+
+def _marca_evento(evento: Dict[str, Any]) -> datetime:
+    """data_hora do evento como gravada na marca d'água (DATETIME do MySQL, sem microssegundos)."""
+    data_hora = _data_hora_evento(evento)
+    return data_hora.replace(microsecond=0) if data_hora else MARCA_SEM_DATA
+
+def _eventos_novos(items: List[Dict[str, Any]], ultimo_data_hora: Optional[datetime],
+                   ultimo_codigo: Optional[str]) -> List[Dict[str, Any]]:
+    """
+    Eventos da resposta da API posteriores ao último evento já gravado.
+
+    Os eventos vêm em ordem cronológica: se o último evento gravado
+    (data_hora + código) está na resposta, os novos são os seguintes a ele;
+    senão, os com data_hora posterior à dele.
+    """
+    if ultimo_data_hora is None:
+        return list(items)
+    ultimo_data_hora = ultimo_data_hora.replace(microsecond=0)
+    for i in range(len(items) - 1, -1, -1):
+        if _marca_evento(items[i]) == ultimo_data_hora and \
+                nfe_tracking_logger.codigo_do_evento(items[i]) == ultimo_codigo:
+            return items[i + 1:]
+    novos = []
+    for evento in items:
+        data_hora = _marca_evento(evento)
+        if data_hora == MARCA_SEM_DATA or data_hora > ultimo_data_hora:
+            novos.append(evento)
+    return novos
+
+def _ler_estado_nfe(cursor, chave_nfe: str) -> Tuple:
+    cursor.execute("""
+        SELECT status, ultimo_evento_data_hora, ultimo_evento_codigo
+        FROM nfe_status WHERE chave_nfe = %s
+    """, (chave_nfe,))
+    row = cursor.fetchone()
+    return tuple(row) if row else (None, None, None)
+
+def processar_nfe(cursor, chave_nfe: str, num_nf: str, transportadora: str, cidade: str, uf: str, dt_saida: str,
+                  dados_api: Optional[Dict[str, Any]] = _NAO_BUSCADO,
+                  eventos_buffer: Optional[nfe_tracking_logger.EventoBuffer] = None,
+                  estado_atual: Optional[Tuple] = None,
+                  alteracoes: Optional[List[Tuple[str, Dict[str, Any]]]] = None) -> bool:
     """
     Processa NF-e alimentando as tabelas do banco de dados.
-    Na primeira consulta bem-sucedida, salva todos os eventos.
-    Em consultas subsequentes, ignora se o status for ENTREGUE.
+    Na primeira consulta bem-sucedida, salva todos os eventos e gera o token.
+    Nas seguintes, grava só os eventos posteriores ao último já gravado
+    (colunas `ultimo_evento_data_hora`/`ultimo_evento_codigo` de nfe_status);
+    sem eventos novos nem mudança de status, só `last_processed_at` é atualizado.
+
+    Se `dados_api` for informado (resposta já buscada pelo motor de consultas
+    paralelas), a API não é consultada novamente. Com `eventos_buffer`, os
+    eventos entram no lote compartilhado entre NF-es; sem ele, os eventos da
+    NF-e são gravados em um único INSERT. `estado_atual` é a tupla
+    (status, ultimo_evento_data_hora, ultimo_evento_codigo) já lida de
+    nfe_status; se omitida, é consultada.
+
+    Quando eventos ou status são gravados, a NF-e entra em `alteracoes` para
+    ser publicada (`notificacoes.NFE_ATUALIZADA`) depois do commit, assim como
+    o token criado na primeira consulta (`notificacoes.TOKEN_CRIADO`); sem a
+    lista, a publicação é imediata.
     """
-    conn = None
     try:
-        dados_api = fetch_tracking_data(chave_nfe)
+        if dados_api is _NAO_BUSCADO:
+            dados_api = fetch_tracking_data(chave_nfe)
 
         if not dados_api or dados_api.get("status") != "SUCESSO":
             logger.warning(f"NF-e {num_nf} não encontrada na API")
@@ -74,6 +192,8 @@ def processar_nfe(cursor, chave_nfe: str, num_nf: str, transportadora: str, cida
                 WHERE chave_nfe = %s
             """, (chave_nfe,))
             nfe_tracking_logger._update_last_processed(cursor, chave_nfe)
+            if not estado_atual or estado_atual[0] != "NAO_ENCONTRADO":
+                _registrar_alteracao(alteracoes, chave_nfe, num_nf, "NAO_ENCONTRADO")
             return True
 
         items = dados_api["dados"]["items"]
@@ -81,15 +201,7 @@ def processar_nfe(cursor, chave_nfe: str, num_nf: str, transportadora: str, cida
         codigo_ocorrencia = ultimo_evento_api.get("codigo_ocorrencia") if ultimo_evento_api else None
         tipo_ocorrencia = ultimo_evento_api.get("ocorrencia", "").strip() if ultimo_evento_api else None
 
-        conn = get_mysql_connection()
-        if not conn:
-            logger.error("Falha ao obter conexão com o banco de dados para determinar o status.")
-            status = _config['default_status']
-        else:
-            init_status(conn)
-            status = determinar_status(conn, codigo_ocorrencia)
-            close_connection(conn)
-            conn = None
+        status = resolver_status(codigo_ocorrencia)
 
         ultimo_codigo_ocorrencia_api = dados_api.get("ultimo_codigo_ocorrencia")
         ultimo_codigo_ocorrencia_salvar = ultimo_codigo_ocorrencia_api
@@ -100,41 +212,65 @@ def processar_nfe(cursor, chave_nfe: str, num_nf: str, transportadora: str, cida
             ultimo_codigo_ocorrencia_salvar = '01'
             logger.info(f"NF-e {num_nf}: Forçando último código de ocorrência para '01'.")
 
-        # Check if events have been logged before
-        cursor.execute("SELECT COUNT(*) FROM nfe_logs WHERE chave_nfe = %s", (chave_nfe,))
-        eventos_ja_logados = cursor.fetchone()[0]
+        status_atual, ultimo_data_hora, ultimo_codigo = estado_atual or _ler_estado_nfe(cursor, chave_nfe)
 
-        if not eventos_ja_logados:
-            # First time logging events
+        if ultimo_data_hora is None:
+            # Primeira consulta com eventos
             logger.info(f"NF-e {num_nf}: Primeira consulta bem-sucedida. Logando todos os eventos.")
-            for evento in items:
-                nfe_tracking_logger.insert_evento(cursor, chave_nfe, num_nf, evento, status, transportadora, cidade, uf)
+            eventos = items
             # Chamando a função para gerar e salvar o token
-            gerar_e_salvar_token_nfe(cursor, num_nf)
+            gerar_e_salvar_token_nfe(cursor, num_nf, alteracoes)
         else:
-            # Subsequent checks
-            if status == 'ENTREGUE':
-                logger.info(f"NF-e {num_nf}: Status ENTREGUE em consulta subsequente. Ignorando eventos.")
-                cursor.execute("SELECT status FROM nfe_status WHERE chave_nfe = %s", (chave_nfe,))
-                current_status = cursor.fetchone()[0]
-                if current_status != 'ENTREGUE':
-                    nfe_tracking_logger._update_nfe_status(cursor, chave_nfe, status, ultimo_codigo_ocorrencia_salvar, tipo_ocorrencia)
-                    logger.info(f"NF-e {num_nf}: Atualizando status para ENTREGUE.")
+            eventos = _eventos_novos(items, ultimo_data_hora, ultimo_codigo)
+            if not eventos and status == status_atual:
+                logger.info(f"NF-e {num_nf}: Nenhum evento novo desde {ultimo_data_hora}.")
+                nfe_tracking_logger._update_last_processed(cursor, chave_nfe)
                 return True
-            else:
-                logger.info(f"NF-e {num_nf}: Consulta subsequente. Logando apenas o último evento.")
-                nfe_tracking_logger.insert_evento(cursor, chave_nfe, num_nf, items[-1], status, transportadora, cidade, uf)
+            logger.info(f"NF-e {num_nf}: Consulta subsequente. Logando {len(eventos)} evento(s) novo(s).")
 
-        nfe_tracking_logger._update_nfe_status(cursor, chave_nfe, status, ultimo_codigo_ocorrencia_salvar, tipo_ocorrencia)
+        # Marca d'água: último evento da resposta; sem eventos, MARCA_SEM_DATA registra que a
+        # primeira consulta já aconteceu (senão toda passagem repetiria a carga inicial e o token).
+        # Gravada antes dos eventos: um evento recusado pelo banco recua a marca para antes dele.
+        if ultimo_evento_api:
+            marca_data_hora = _marca_evento(ultimo_evento_api)
+            marca_codigo = nfe_tracking_logger.codigo_do_evento(ultimo_evento_api)
+        else:
+            marca_data_hora = ultimo_data_hora or MARCA_SEM_DATA
+            marca_codigo = None
+        nfe_tracking_logger._update_nfe_status(
+            cursor, chave_nfe, status, ultimo_codigo_ocorrencia_salvar, tipo_ocorrencia,
+            marca_data_hora, marca_codigo,
+        )
+        _gravar_eventos(cursor, eventos_buffer, chave_nfe, num_nf, eventos, status, transportadora, cidade, uf)
+        _registrar_alteracao(alteracoes, chave_nfe, num_nf, status)
         logger.info(f"NF-e {num_nf} processada com sucesso. Status: {status}, Último Evento: {ultimo_codigo_ocorrencia_salvar}")
         return True
 
     except Exception as e:
         logger.error(f"Erro ao processar NF-e {num_nf}: {str(e)}", exc_info=True)
         return False
-    finally:
-        if conn:
-            close_connection(conn)
+
+def _registrar_evento(alteracoes, topico, dados):
+    if alteracoes is None:
+        notificacoes.publicar(topico, dados)
+    else:
+        alteracoes.append((topico, dados))
+
+def _registrar_alteracao(alteracoes, chave_nfe, num_nf, status):
+    _registrar_evento(alteracoes, notificacoes.NFE_ATUALIZADA,
+                      {'chave_nfe': chave_nfe, 'NUM_NF': num_nf, 'status': status})
+
+def _publicar_alteracoes(alteracoes):
+    """Publica os eventos (NF-es alteradas, tokens criados) já confirmados no banco e esvazia a lista."""
+    for topico, dados in alteracoes:
+        notificacoes.publicar(topico, dados)
+    alteracoes.clear()
+
+def _gravar_eventos(cursor, eventos_buffer, chave_nfe, num_nf, eventos, status, transportadora, cidade, uf):
+    if eventos_buffer is not None:
+        eventos_buffer.adicionar(chave_nfe, num_nf, eventos, status, transportadora, cidade, uf)
+    else:
+        nfe_tracking_logger.insert_eventos_bulk(cursor, chave_nfe, num_nf, eventos, status, transportadora, cidade, uf)
 
 def _should_process_with_current_system(conn, transportadora_descricao):
     local_cursor = conn.cursor(buffered=True)
@@ -149,6 +285,106 @@ def _should_process_with_current_system(conn, transportadora_descricao):
     finally:
         local_cursor.close()
 
+def _buscar_dados_rastreamento(chave_nfe: str) -> Optional[Dict[str, Any]]:
+    """
+    Etapa de busca (executada nas threads do pool). O limite de taxa e o
+    circuit breaker ficam em `fetch_tracking_data`; se a API estiver
+    indisponível, levanta `ApiIndisponivelError`.
+    """
+    return fetch_tracking_data(chave_nfe, raise_on_unavailable=True)
+
+def _processar_nfes(conn, nfes: List[Tuple], rotulo: str):
+    """
+    Motor de processamento de um lote de NF-es.
+
+    As consultas à API são feitas em paralelo (ver `_buscar_em_paralelo`) e as
+    respostas voltam para esta thread, que é a única a escrever no banco.
+    Os eventos de várias NF-es são gravados em lote (`EventoBuffer`) e o
+    commit acontece sempre que o buffer está vazio, para que status e eventos
+    de uma NF-e sejam confirmados juntos.
+
+    NF-es que a API não respondeu (circuito aberto, timeout) não são gravadas:
+    `last_processed_at` fica inalterado e elas voltam na próxima passagem.
+
+    Args:
+        conn: Conexão MySQL usada pela etapa de escrita.
+        nfes: Tuplas (chave_nfe, NUM_NF, transportadora, cidade, uf, dt_saida,
+              status, ultimo_evento_data_hora, ultimo_evento_codigo).
+        rotulo: Status das NF-es do lote, usado nos logs.
+    """
+    sistema_por_transportadora = {}
+    elegiveis = []
+    for nfe in nfes:
+        transportadora = nfe[2]
+        if transportadora not in sistema_por_transportadora:
+            sistema_por_transportadora[transportadora] = _should_process_with_current_system(conn, transportadora)
+        if sistema_por_transportadora[transportadora]:
+            elegiveis.append(nfe)
+        else:
+            logger.info(f"Ignorando NF-e {nfe[1]} ({rotulo}) - Transportadora '{transportadora}' usa outro sistema.")
+
+    if not elegiveis:
+        return
+
+    inicio = time.monotonic()
+    processadas = 0
+    alteracoes = []
+    with conn.cursor() as cursor:
+        buffer = nfe_tracking_logger.EventoBuffer(cursor, _config['event_batch_size'], _config['event_batch_ms'])
+        for nfe, dados_api in _buscar_em_paralelo(elegiveis, rotulo):
+            chave_nfe, num_nf, transportadora, cidade, uf, dt_saida = nfe[:6]
+            logger.info(f"Processando NF-e {num_nf} ({rotulo}) - Transportadora '{transportadora}'.")
+            processar_nfe(cursor, chave_nfe, num_nf, transportadora, cidade, uf, str(dt_saida),
+                          dados_api=dados_api, eventos_buffer=buffer, estado_atual=tuple(nfe[6:9]),
+                          alteracoes=alteracoes)
+            buffer.flush_se_vencido()
+            if not buffer.pendentes:
+                conn.commit()
+                _publicar_alteracoes(alteracoes)
+            processadas += 1
+        buffer.flush()
+        conn.commit()
+        _publicar_alteracoes(alteracoes)
+    adiadas = len(elegiveis) - processadas
+    if adiadas:
+        logger.warning(f"{adiadas} NF-es ({rotulo}) adiadas para a próxima passagem: API de rastreamento indisponível.")
+    logger.info(f"{processadas} NF-es ({rotulo}) processadas em {time.monotonic() - inicio:.1f}s; "
+                f"{buffer.gravados} eventos gravados em {buffer.lotes} lote(s). "
+                f"Cliente HTTP: {get_tracking_stats()}")
+
+def _buscar_em_paralelo(nfes: List[Tuple], rotulo: str):
+    """
+    Gera pares (nfe, dados_api) à medida que as consultas terminam; NF-es que
+    a API não respondeu são omitidas.
+
+    Modo 'threads': `fetch_workers` threads com limite global de taxa.
+    Modo 'async': rodadas de `async_batch_size` consultas via `fetch_many`.
+    """
+    if _config['fetch_mode'] == 'async':
+        logger.info(f"Consultando {len(nfes)} NF-es ({rotulo}) com o cliente assíncrono.")
+        tamanho = _config['async_batch_size']
+        for i in range(0, len(nfes), tamanho):
+            bloco = nfes[i:i + tamanho]
+            respostas = fetch_many((nfe[0] for nfe in bloco), skip_unavailable=True)
+            for nfe in bloco:
+                if nfe[0] in respostas:
+                    yield nfe, respostas[nfe[0]]
+        return
+
+    logger.info(f"Consultando {len(nfes)} NF-es ({rotulo}) com {_config['fetch_workers']} threads.")
+    with ThreadPoolExecutor(max_workers=_config['fetch_workers'], thread_name_prefix="rastreio") as executor:
+        futures = {executor.submit(_buscar_dados_rastreamento, nfe[0]): nfe for nfe in nfes}
+        for future in as_completed(futures):
+            nfe = futures[future]
+            try:
+                dados_api = future.result()
+            except ApiIndisponivelError:
+                continue
+            except Exception as e:
+                logger.error(f"Erro ao consultar NF-e {nfe[1]} ({rotulo}): {str(e)}")
+                continue
+            yield nfe, dados_api
+
 def process_pending_nfes():
     """Processa NF-es com status PENDENTE."""
     logger.info("Verificando e processando NF-es com status PENDENTE.")
@@ -159,19 +395,13 @@ def process_pending_nfes():
     try:
         with conn.cursor() as cursor:
             cursor.execute("""
-                SELECT chave_nfe, NUM_NF, transportadora, cidade, uf, dt_saida
+                SELECT chave_nfe, NUM_NF, transportadora, cidade, uf, dt_saida,
+                       status, ultimo_evento_data_hora, ultimo_evento_codigo
                 FROM nfe_status
                 WHERE status = 'PENDENTE'
             """)
             pending_nfes = cursor.fetchall()
-            for nfe in pending_nfes:
-                chave_nfe, num_nf, transportadora, cidade, uf, dt_saida_str = nfe
-                if _should_process_with_current_system(conn, transportadora):
-                    logger.info(f"Processando NF-e {num_nf} (PENDENTE) - Transportadora '{transportadora}'.")
-                    processar_nfe(cursor, chave_nfe, num_nf, transportadora, cidade, uf, str(dt_saida_str))
-                    conn.commit()
-                else:
-                    logger.info(f"Ignorando NF-e {num_nf} (PENDENTE) - Transportadora '{transportadora}' usa outro sistema.")
+        _processar_nfes(conn, pending_nfes, 'PENDENTE')
     finally:
         close_connection(conn)
     logger.info("Verificação e processamento de NF-es com status PENDENTE concluído.")
@@ -187,19 +417,13 @@ def process_transit_nfes():
         with conn.cursor() as cursor:
             now = datetime.now()
             cursor.execute("""
-                SELECT chave_nfe, NUM_NF, transportadora, cidade, uf, dt_saida, last_processed_at
+                SELECT chave_nfe, NUM_NF, transportadora, cidade, uf, dt_saida,
+                       status, ultimo_evento_data_hora, ultimo_evento_codigo
                 FROM nfe_status
                 WHERE status = 'EM_TRANSITO' AND (last_processed_at IS NULL OR last_processed_at < %s)
             """, (now - timedelta(hours=3),))
             transit_nfes = cursor.fetchall()
-            for nfe in transit_nfes:
-                chave_nfe, num_nf, transportadora, cidade, uf, dt_saida_str, last_processed_at = nfe
-                if _should_process_with_current_system(conn, transportadora):
-                    logger.info(f"Processando NF-e {num_nf} (EM_TRANSITO) - Transportadora '{transportadora}'.")
-                    processar_nfe(cursor, chave_nfe, num_nf, transportadora, cidade, uf, str(dt_saida_str))
-                    conn.commit()
-                else:
-                    logger.info(f"Ignorando NF-e {num_nf} (EM_TRANSITO) - Transportadora '{transportadora}' usa outro sistema.")
+        _processar_nfes(conn, transit_nfes, 'EM_TRANSITO')
     finally:
         close_connection(conn)
     logger.info("Verificação e processamento de NF-es com status EM_TRANSITO concluído.")
@@ -215,25 +439,26 @@ def process_not_found_nfes():
         with conn.cursor() as cursor:
             now = datetime.now()
             cursor.execute("""
-                SELECT chave_nfe, NUM_NF, transportadora, cidade, uf, dt_saida, last_processed_at
+                SELECT chave_nfe, NUM_NF, transportadora, cidade, uf, dt_saida,
+                       status, ultimo_evento_data_hora, ultimo_evento_codigo
                 FROM nfe_status
                 WHERE status = 'NAO_ENCONTRADO' AND (last_processed_at IS NULL OR last_processed_at < %s)
             """, (now - timedelta(hours=10),))
             not_found_nfes = cursor.fetchall()
-            for nfe in not_found_nfes:
-                chave_nfe, num_nf, transportadora, cidade, uf, dt_saida_str, last_processed_at = nfe
-                if _should_process_with_current_system(conn, transportadora):
-                    logger.info(f"Processando NF-e {num_nf} (NAO_ENCONTRADO) - Transportadora '{transportadora}'.")
-                    processar_nfe(cursor, chave_nfe, num_nf, transportadora, cidade, uf, str(dt_saida_str))
-                    conn.commit()
-                else:
-                    logger.info(f"Ignorando NF-e {num_nf} (NAO_ENCONTRADO) - Transportadora '{transportadora}' usa outro sistema.")
+        _processar_nfes(conn, not_found_nfes, 'NAO_ENCONTRADO')
     finally:
         close_connection(conn)
     logger.info("Verificação e processamento de NF-es com status NAO_ENCONTRADO concluído.")
 
-def run_scheduler():
-    """Executa o agendador de tarefas."""
+def run_scheduler(ponte_notificacoes=None):
+    """
+    Executa o agendador de tarefas.
+
+    Args:
+        ponte_notificacoes: Fila criada por `notificacoes.criar_ponte` no processo
+                            principal; os eventos publicados aqui são repassados a ele.
+    """
+    notificacoes.usar_ponte(ponte_notificacoes)
     schedule.every(11).minutes.do(process_pending_nfes)
     schedule.every(5).hours.do(process_transit_nfes)
     schedule.every(10).hours.do(process_not_found_nfes)
@@ -248,7 +473,7 @@ def start_background_process():
     process_pending_nfes()
     logger.info("Verificação inicial de NF-es PENDENTES concluída.")
 
-    process = Process(target=run_scheduler, daemon=True)
+    process = Process(target=run_scheduler, args=(notificacoes.criar_ponte(),), daemon=True)
     process.start()
     logger.info("Agendador de tarefas iniciado em background.")
 
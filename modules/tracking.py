@@ -1,37 +1,407 @@
 # modules/tracking.py
+import asyncio
 import logging
+import os
+import threading
+import time
 import requests
-from typing import Optional, Dict, Any
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Optional, Dict, Any, Iterable
 from modules.json_parser import parse_json
+from modules.tracking_cache import TrackingCache
+
+try:
+    import aiohttp
+except ImportError:  # Dependência opcional: necessária apenas para a API assíncrona
+    aiohttp = None
 
 logger = logging.getLogger(__name__)
 
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+_stats = {'requisicoes': 0, 'falhas': 0}
+_cache = None
+
 # Configurações padrão
 _config = {
     'api_url': "https://ssw.inf.br/api/trackingdanfe",
     'timeout': 10,
-    'headers': {"Content-Type": "application/json"}
+    'headers': {"Content-Type": "application/json"},
+    # Sessão HTTP síncrona (keep-alive + retry)
+    'pool_connections': 4,  # Quantidade de hosts com pool próprio
+    'pool_maxsize': 8,  # Conexões mantidas por host; acompanhar tasks 'fetch_workers'
+    'max_retries': 3,
+    'backoff_factor': 0.5,  # Espera entre tentativas: 0.5s, 1s, 2s...
+    'retry_status': (429, 500, 502, 503, 504),
+    # Cliente assíncrono (fetch_tracking_data_async / fetch_many)
+    'async_limit': 20,  # Conexões simultâneas no total
+    'async_limit_per_host': 10,  # Conexões simultâneas por host
+    'async_connect_timeout': 5,
+    'async_keepalive_timeout': 30,
+    # Cache de respostas por chave NF-e (TTL em segundos conforme o status de entrega)
+    'cache_max_entries': 5000,
+    'cache_ttl': {
+        'ENTREGUE': 24 * 3600,
+        'NAO_ENCONTRADO': 1800,
+        'EM_TRANSITO': 300,
+    },
+    'cache_ttl_default': 600,
+    'cache_sqlite_path': None,  # Ex.: 'tracking_cache.sqlite' para persistir entre reinícios
+    # Limite global de consultas (token bucket) e circuit breaker
+    'rate_limit_per_second': 5.0,  # 0 = sem limite
+    'rate_limit_burst': 5,  # Consultas que podem sair de imediato após um período ocioso
+    'breaker_failure_threshold': 5,  # Falhas consecutivas que abrem o circuito
+    'breaker_recovery_timeout': 60,  # Segundos com o circuito aberto antes de testar a API
+    'breaker_half_open_calls': 1,  # Consultas de teste simultâneas no estado meio-aberto
 }
 
+
+class ApiIndisponivelError(Exception):
+    """A API de rastreamento não respondeu (circuito aberto, timeout, erro de conexão ou HTTP 5xx/429)."""
+
+
+class _TokenBucket:
+    """
+    Token bucket compartilhado pelas threads (e corrotinas) do processo.
+
+    Cada consulta reserva um token; se o balde estiver vazio, a reserva fica
+    negativa e quem chamou espera o tempo de reposição correspondente.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = None
+        self._atualizado = time.monotonic()
+        self._stats = {'consultas': 0, 'esperas': 0, 'tempo_espera_total': 0.0}
+
+    def reservar(self) -> float:
+        """Reserva um token e retorna quantos segundos aguardar antes de usá-lo."""
+        taxa = _config['rate_limit_per_second']
+        if not taxa or taxa <= 0:
+            return 0.0
+        capacidade = max(_config['rate_limit_burst'], 1)
+        with self._lock:
+            agora = time.monotonic()
+            if self._tokens is None:
+                self._tokens = float(capacidade)
+            self._tokens = min(capacidade, self._tokens + (agora - self._atualizado) * taxa)
+            self._atualizado = agora
+            self._tokens -= 1
+            espera = -self._tokens / taxa if self._tokens < 0 else 0.0
+            self._stats['consultas'] += 1
+            if espera > 0:
+                self._stats['esperas'] += 1
+                self._stats['tempo_espera_total'] += espera
+            return espera
+
+    def aguardar(self):
+        espera = self.reservar()
+        if espera > 0:
+            time.sleep(espera)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            tokens = self._tokens
+        stats['tempo_espera_total'] = round(stats['tempo_espera_total'], 2)
+        stats['tokens_disponiveis'] = round(max(tokens, 0.0), 2) if tokens is not None else None
+        # Fração das consultas que precisaram esperar por um token
+        stats['saturacao'] = round(stats['esperas'] / stats['consultas'], 3) if stats['consultas'] else 0.0
+        stats['limite_por_segundo'] = _config['rate_limit_per_second']
+        return stats
+
+
+class _CircuitBreaker:
+    """
+    Circuit breaker da API de rastreamento.
+
+    - fechado: consultas liberadas; `breaker_failure_threshold` falhas seguidas abrem o circuito.
+    - aberto: consultas recusadas de imediato por `breaker_recovery_timeout` segundos.
+    - meio_aberto: até `breaker_half_open_calls` consultas de teste; sucesso fecha o
+      circuito, falha o abre novamente.
+    """
+
+    FECHADO = 'fechado'
+    ABERTO = 'aberto'
+    MEIO_ABERTO = 'meio_aberto'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._estado = self.FECHADO
+        self._falhas_seguidas = 0
+        self._aberto_em = 0.0
+        self._testes_em_andamento = 0
+        self._stats = {'aberturas': 0, 'recusadas': 0}
+
+    def permitir(self) -> bool:
+        with self._lock:
+            if self._estado == self.ABERTO:
+                if time.monotonic() - self._aberto_em < _config['breaker_recovery_timeout']:
+                    self._stats['recusadas'] += 1
+                    return False
+                self._estado = self.MEIO_ABERTO
+                self._testes_em_andamento = 0
+                logger.info("Circuito da API de rastreamento meio-aberto: testando disponibilidade.")
+            if self._estado == self.MEIO_ABERTO:
+                if self._testes_em_andamento >= _config['breaker_half_open_calls']:
+                    self._stats['recusadas'] += 1
+                    return False
+                self._testes_em_andamento += 1
+            return True
+
+    def registrar_sucesso(self):
+        with self._lock:
+            if self._estado != self.FECHADO:
+                logger.info("API de rastreamento respondeu; circuito fechado.")
+            self._estado = self.FECHADO
+            self._falhas_seguidas = 0
+            self._testes_em_andamento = 0
+
+    def liberar_teste(self):
+        """Devolve a vaga de teste de uma consulta que terminou sem registrar sucesso nem falha."""
+        with self._lock:
+            if self._estado == self.MEIO_ABERTO and self._testes_em_andamento > 0:
+                self._testes_em_andamento -= 1
+
+    def registrar_falha(self):
+        with self._lock:
+            self._falhas_seguidas += 1
+            if self._estado == self.MEIO_ABERTO or (
+                    self._estado == self.FECHADO and self._falhas_seguidas >= _config['breaker_failure_threshold']):
+                self._estado = self.ABERTO
+                self._aberto_em = time.monotonic()
+                self._testes_em_andamento = 0
+                self._stats['aberturas'] += 1
+                logger.warning(f"Circuito da API de rastreamento aberto após {self._falhas_seguidas} falha(s) "
+                               f"seguida(s); novas consultas suspensas por {_config['breaker_recovery_timeout']}s.")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({'estado': self._estado, 'falhas_seguidas': self._falhas_seguidas})
+            if self._estado == self.ABERTO:
+                restante = _config['breaker_recovery_timeout'] - (time.monotonic() - self._aberto_em)
+                stats['reabre_em'] = round(max(restante, 0.0), 1)
+        return stats
+
+
+_limitador = _TokenBucket()
+_circuito = _CircuitBreaker()
+
 def init_tracking(api_url: Optional[str] = None,
                     timeout: Optional[int] = None,
-                    headers: Optional[Dict[str, str]] = None):
-    """Configura o módulo para uso com JSON."""
+                    headers: Optional[Dict[str, str]] = None,
+                    async_limit: Optional[int] = None,
+                    async_limit_per_host: Optional[int] = None,
+                    async_keepalive_timeout: Optional[int] = None,
+                    pool_maxsize: Optional[int] = None,
+                    max_retries: Optional[int] = None,
+                    backoff_factor: Optional[float] = None,
+                    cache_max_entries: Optional[int] = None,
+                    cache_ttl: Optional[Dict[str, float]] = None,
+                    cache_ttl_default: Optional[float] = None,
+                    cache_sqlite_path: Optional[str] = None,
+                    rate_limit_per_second: Optional[float] = None,
+                    rate_limit_burst: Optional[int] = None,
+                    breaker_failure_threshold: Optional[int] = None,
+                    breaker_recovery_timeout: Optional[float] = None):
+    """
+    Configura o módulo para uso com JSON.
+
+    Alterações em `headers`, `pool_maxsize`, `max_retries` ou `backoff_factor`
+    recriam a sessão HTTP compartilhada na próxima consulta; só os parâmetros
+    `cache_*` recriam o cache de respostas (as demais chamadas o preservam).
+    `cache_ttl` é mesclado aos TTLs padrão (um TTL 0 desativa o cache do status).
+    """
+    global _cache
     if api_url:
         _config['api_url'] = api_url
     if timeout:
         _config['timeout'] = timeout
     if headers:
         _config['headers'] = headers
+    if async_limit:
+        _config['async_limit'] = async_limit
+    if async_limit_per_host:
+        _config['async_limit_per_host'] = async_limit_per_host
+    if async_keepalive_timeout:
+        _config['async_keepalive_timeout'] = async_keepalive_timeout
+    if pool_maxsize:
+        _config['pool_maxsize'] = pool_maxsize
+    if max_retries is not None:
+        _config['max_retries'] = max_retries
+    if backoff_factor is not None:
+        _config['backoff_factor'] = backoff_factor
+    if cache_max_entries:
+        _config['cache_max_entries'] = cache_max_entries
+    if cache_ttl:
+        _config['cache_ttl'] = {**_config['cache_ttl'], **cache_ttl}
+    if cache_ttl_default is not None:
+        _config['cache_ttl_default'] = cache_ttl_default
+    if cache_sqlite_path:
+        _config['cache_sqlite_path'] = cache_sqlite_path
+    if rate_limit_per_second is not None:
+        _config['rate_limit_per_second'] = rate_limit_per_second
+    if rate_limit_burst:
+        _config['rate_limit_burst'] = rate_limit_burst
+    if breaker_failure_threshold:
+        _config['breaker_failure_threshold'] = breaker_failure_threshold
+    if breaker_recovery_timeout:
+        _config['breaker_recovery_timeout'] = breaker_recovery_timeout
 
+    close_session()
+    parametros_cache = (cache_max_entries, cache_ttl, cache_ttl_default, cache_sqlite_path)
+    if any(parametro is not None for parametro in parametros_cache):
+        # Só descarta o cache aquecido (e o SQLite associado) se a configuração dele mudou
+        with _session_lock:
+            _cache = None
     logger.info("Tracking module initialized with config: %s", _config)
 
-def fetch_tracking_data(chave_nfe: str) -> Optional[Dict[str, Any]]:
+def _create_session() -> requests.Session:
+    # POST não é repetido por padrão pelo urllib3; a consulta de rastreio é idempotente
+    retry = Retry(
+        total=_config['max_retries'],
+        # Timeout de leitura não é repetido: a requisição pode já ter sido
+        # processada pelo servidor e o ciclo do agendador tentará de novo
+        read=0,
+        backoff_factor=_config['backoff_factor'],
+        status_forcelist=_config['retry_status'],
+        allowed_methods=frozenset({"POST"}),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=_config['pool_connections'],
+        pool_maxsize=_config['pool_maxsize'],
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(_config['headers'])
+    return session
+
+def _get_session() -> requests.Session:
+    """Retorna a sessão HTTP compartilhada (uma por processo)."""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            _session = _create_session()
+            _session_pid = os.getpid()
+        return _session
+
+def close_session():
+    """Fecha a sessão HTTP compartilhada; a próxima consulta cria uma nova."""
+    global _session
+    with _session_lock:
+        session, _session = _session, None
+        pid = _session_pid
+    if session is not None and pid == os.getpid():
+        session.close()
+
+def _get_cache() -> TrackingCache:
+    """Retorna o cache de respostas compartilhado, criando-o na primeira consulta."""
+    global _cache
+    with _session_lock:
+        if _cache is None:
+            _cache = TrackingCache(
+                max_entries=_config['cache_max_entries'],
+                ttls=_config['cache_ttl'],
+                default_ttl=_config['cache_ttl_default'],
+                sqlite_path=_config['cache_sqlite_path'],
+            )
+        return _cache
+
+def _status_cache(resultado: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Status usado para escolher o TTL; None indica resposta que não deve ir para o cache."""
+    if not resultado:
+        return None
+    if resultado.get('status') == 'SUCESSO':
+        return resultado.get('status_entrega')
+    if resultado.get('status') == 'NAO_ENCONTRADO':
+        return 'NAO_ENCONTRADO'
+    return None  # ERRO_PROCESSAMENTO e similares são consultados novamente
+
+def _guardar_no_cache(chave_nfe: str, resultado: Optional[Dict[str, Any]]):
+    status = _status_cache(resultado)
+    if status is not None:
+        _get_cache().set(chave_nfe, resultado, status)
+
+def invalidate_tracking_cache(chave_nfe: Optional[str] = None):
+    """Remove uma chave do cache de respostas (ou todas, se omitida)."""
+    if chave_nfe:
+        _get_cache().invalidate(chave_nfe)
+    else:
+        _get_cache().clear()
+
+def get_tracking_stats() -> Dict[str, Any]:
+    """
+    Contadores do cliente HTTP síncrono, do cache de respostas, do limite de
+    taxa e do circuit breaker.
+
+    `conexoes_abertas` é o total de conexões TCP/TLS criadas; a diferença para
+    `requisicoes_http` (que inclui as novas tentativas) são as requisições que
+    reaproveitaram uma conexão keep-alive. `cache` traz acertos, falhas e
+    ocupação do cache de respostas; `limitador` a saturação do token bucket e
+    `circuito` o estado do circuit breaker.
+    """
+    with _session_lock:
+        session = _session if _session_pid == os.getpid() else None
+        stats = dict(_stats)
+    conexoes = requisicoes_http = 0
+    if session is not None:
+        adapter = session.get_adapter(_config['api_url'])
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                conexoes += pool.num_connections
+                requisicoes_http += pool.num_requests
+    stats.update({
+        'conexoes_abertas': conexoes,
+        'requisicoes_http': requisicoes_http,
+        'conexoes_reutilizadas': max(requisicoes_http - conexoes, 0),
+        'cache': _get_cache().stats(),
+        'limitador': _limitador.stats(),
+        'circuito': _circuito.stats(),
+    })
+    return stats
+
+def _processar_resposta(json_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Converte o JSON da API no formato de `parse_json`, com o último código de ocorrência."""
+    # Usa o json_parser para processar a resposta
+    parsed_data = parse_json(json_data)
+    logger.debug("API response parsed: %s", parsed_data)
+
+    # Extrai o codigo_ocorrencia do último evento
+    ultimo_codigo_ocorrencia = parsed_data['dados']['items'][-1].get("codigo_ocorrencia") if parsed_data.get('dados') and parsed_data['dados'].get('items') else None
+    parsed_data['ultimo_codigo_ocorrencia'] = ultimo_codigo_ocorrencia
+
+    return parsed_data
+
+def _indisponivel(chave_nfe: str, raise_on_unavailable: bool, motivo: str) -> None:
+    if raise_on_unavailable:
+        raise ApiIndisponivelError(f"NF-e {chave_nfe}: {motivo}")
+    return None
+
+def _erro_de_disponibilidade(status_http: Optional[int]) -> bool:
+    """Erros HTTP 4xx indicam que a API respondeu; só 5xx/429 contam para o circuito."""
+    return status_http is None or status_http >= 500 or status_http == 429
+
+def fetch_tracking_data(chave_nfe: str, use_cache: bool = True,
+                        raise_on_unavailable: bool = False) -> Optional[Dict[str, Any]]:
     """
     Busca dados de rastreamento via API (JSON).
 
     Args:
         chave_nfe: Chave de acesso da NF-e (44 caracteres)
+        use_cache: Se False, ignora a resposta em cache e consulta a API
+                   (o resultado ainda atualiza o cache).
+        raise_on_unavailable: Se True, levanta `ApiIndisponivelError` quando a API
+                   não responde (circuito aberto, timeout, conexão, HTTP 5xx/429)
+                   em vez de retornar None, para que quem chamou possa adiar a NF-e.
 
     Returns:
         Dicionário com a resposta da API ou None em caso de falha.
@@ -40,34 +410,192 @@ def fetch_tracking_data(chave_nfe: str) -> Optional[Dict[str, Any]]:
         logger.error("Chave NF-e inválida: %s", chave_nfe)
         return None
 
+    if use_cache:
+        em_cache = _get_cache().get(chave_nfe)
+        if em_cache is not None:
+            return em_cache
+
+    if not _circuito.permitir():
+        logger.warning("API de rastreamento indisponível (circuito aberto); NF-e %s não consultada", chave_nfe)
+        return _indisponivel(chave_nfe, raise_on_unavailable, "circuito aberto")
+
     payload = {"chave_nfe": chave_nfe}
+    registrada = False  # Sucesso/falha informado ao circuito; senão a vaga de teste é devolvida
 
     try:
-        response = requests.post(
+        _limitador.aguardar()
+        with _session_lock:
+            _stats['requisicoes'] += 1
+
+        response = _get_session().post(
             _config['api_url'],
             json=payload,
-            headers=_config['headers'],
             timeout=_config['timeout']
         )
         response.raise_for_status()
-        json_data = response.json()
+        _circuito.registrar_sucesso()
+        registrada = True
+        resultado = _processar_resposta(response.json())
+        _guardar_no_cache(chave_nfe, resultado)
+        return resultado
+
+    except requests.exceptions.RequestException as e:
+        with _session_lock:
+            _stats['falhas'] += 1
+        logger.error("Falha na requisição: %s", str(e))
+        status_http = e.response.status_code if e.response is not None else None
+        registrada = True
+        if not _erro_de_disponibilidade(status_http):
+            _circuito.registrar_sucesso()
+            return None
+        _circuito.registrar_falha()
+        return _indisponivel(chave_nfe, raise_on_unavailable, str(e))
+    except Exception as e:
+        logger.error("Erro inesperado ao processar resposta: %s", str(e))
+        return None
+    finally:
+        if not registrada:
+            _circuito.liberar_teste()
 
-        # Usa o json_parser para processar a resposta
-        parsed_data = parse_json(json_data)
-        logger.debug("API response parsed: %s", parsed_data)
+def create_async_session() -> "aiohttp.ClientSession":
+    """
+    Cria uma sessão aiohttp com pool de conexões compartilhado e keep-alive.
 
-        # Extrai o codigo_ocorrencia do último evento
-        ultimo_codigo_ocorrencia = parsed_data['dados']['items'][-1].get("codigo_ocorrencia") if parsed_data.get('dados') and parsed_data['dados'].get('items') else None
-        parsed_data['ultimo_codigo_ocorrencia'] = ultimo_codigo_ocorrencia
+    A sessão deve ser reutilizada para várias consultas e fechada ao final
+    (`async with create_async_session() as session:`).
+    """
+    if aiohttp is None:
+        raise RuntimeError("O pacote 'aiohttp' é necessário para a API assíncrona de rastreamento")
+    connector = aiohttp.TCPConnector(
+        limit=_config['async_limit'],
+        limit_per_host=_config['async_limit_per_host'],
+        keepalive_timeout=_config['async_keepalive_timeout'],
+        ttl_dns_cache=300,
+    )
+    timeout = aiohttp.ClientTimeout(total=_config['timeout'], connect=_config['async_connect_timeout'])
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, headers=_config['headers'])
 
-        return parsed_data
+async def fetch_tracking_data_async(chave_nfe: str,
+                                    session: Optional["aiohttp.ClientSession"] = None,
+                                    use_cache: bool = True,
+                                    raise_on_unavailable: bool = False,
+                                    semaforo: Optional[asyncio.Semaphore] = None) -> Optional[Dict[str, Any]]:
+    """
+    Versão assíncrona de `fetch_tracking_data`.
 
-    except requests.exceptions.RequestException as e:
-        logger.error("Falha na requisição: %s", str(e))
+    Args:
+        chave_nfe: Chave de acesso da NF-e (44 caracteres)
+        session: Sessão criada por `create_async_session()`. Se omitida, uma
+                 sessão temporária é criada só para esta consulta.
+        use_cache: Se False, ignora a resposta em cache e consulta a API.
+        raise_on_unavailable: Ver `fetch_tracking_data`.
+        semaforo: Limita as consultas em andamento; o circuito só é consultado
+                  depois de obter a vaga, para que as falhas das consultas
+                  anteriores já o tenham aberto.
+
+    Returns:
+        Dicionário com a resposta da API (mesmo formato de `fetch_tracking_data`)
+        ou None em caso de falha.
+    """
+    if not chave_nfe or len(chave_nfe) != 44:
+        logger.error("Chave NF-e inválida: %s", chave_nfe)
         return None
+
+    if use_cache:
+        em_cache = _get_cache().get(chave_nfe)
+        if em_cache is not None:
+            return em_cache
+
+    if semaforo is None:
+        return await _consultar_async(chave_nfe, session, raise_on_unavailable)
+    async with semaforo:
+        return await _consultar_async(chave_nfe, session, raise_on_unavailable)
+
+async def _consultar_async(chave_nfe: str, session: Optional["aiohttp.ClientSession"],
+                           raise_on_unavailable: bool) -> Optional[Dict[str, Any]]:
+    if not _circuito.permitir():
+        logger.warning("API de rastreamento indisponível (circuito aberto); NF-e %s não consultada", chave_nfe)
+        return _indisponivel(chave_nfe, raise_on_unavailable, "circuito aberto")
+
+    registrada = False  # Sucesso/falha informado ao circuito; senão a vaga de teste é devolvida
+    sessao_propria = session is None
+
+    try:
+        espera = _limitador.reservar()
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+        if sessao_propria:
+            session = create_async_session()
+
+        with _session_lock:
+            _stats['requisicoes'] += 1
+
+        async with session.post(_config['api_url'], json={"chave_nfe": chave_nfe}) as response:
+            response.raise_for_status()
+            _circuito.registrar_sucesso()
+            registrada = True
+            json_data = await response.json(content_type=None)
+        resultado = _processar_resposta(json_data)
+        _guardar_no_cache(chave_nfe, resultado)
+        return resultado
+
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        with _session_lock:
+            _stats['falhas'] += 1
+        logger.error("Falha na requisição: %s", str(e) or type(e).__name__)
+        status_http = e.status if isinstance(e, aiohttp.ClientResponseError) else None
+        registrada = True
+        if not _erro_de_disponibilidade(status_http):
+            _circuito.registrar_sucesso()
+            return None
+        _circuito.registrar_falha()
+        return _indisponivel(chave_nfe, raise_on_unavailable, str(e) or type(e).__name__)
     except Exception as e:
         logger.error("Erro inesperado ao processar resposta: %s", str(e))
         return None
+    finally:
+        if not registrada:
+            _circuito.liberar_teste()
+        if sessao_propria and session is not None:
+            await session.close()
+
+async def fetch_many_async(chaves: Iterable[str],
+                           skip_unavailable: bool = False) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Consulta várias NF-es concorrentemente usando uma única sessão (no máximo
+    `async_limit` consultas em andamento, `async_limit_per_host` por host).
+    Com a API fora do ar, só as primeiras consultas esperam o timeout: as
+    seguintes encontram o circuito já aberto.
+
+    Args:
+        chaves: Chaves de acesso das NF-es.
+        skip_unavailable: Se True, as chaves que a API não respondeu (ver
+                          `ApiIndisponivelError`) ficam fora do resultado.
+
+    Returns:
+        Dicionário chave_nfe -> resposta (ou None em caso de falha).
+    """
+    chaves = list(dict.fromkeys(chaves))
+    semaforo = asyncio.Semaphore(_config['async_limit'])
+    async with create_async_session() as session:
+        resultados = await asyncio.gather(
+            *(fetch_tracking_data_async(chave, session, raise_on_unavailable=skip_unavailable, semaforo=semaforo)
+              for chave in chaves),
+            return_exceptions=True,
+        )
+    respostas = {}
+    for chave, resultado in zip(chaves, resultados):
+        if isinstance(resultado, ApiIndisponivelError):
+            continue
+        if isinstance(resultado, BaseException):
+            raise resultado
+        respostas[chave] = resultado
+    return respostas
+
+def fetch_many(chaves: Iterable[str], skip_unavailable: bool = False) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Versão síncrona de `fetch_many_async`, para uso fora de um event loop."""
+    return asyncio.run(fetch_many_async(chaves, skip_unavailable))
 
 if __name__ == "__main__":
     """Modo interativo para testar o módulo isoladamente."""
@@ -0,0 +1,160 @@
+# modules/tracking_cache.py
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+
+class TrackingCache:
+    """
+    Cache das respostas da API de rastreamento, indexado pela chave da NF-e.
+
+    - O TTL de cada entrada depende do status de entrega da resposta
+      (ex.: longo para ENTREGUE, curto para EM_TRANSITO).
+    - No máximo `max_entries` entradas em memória, com descarte LRU.
+    - Opcionalmente persistido em SQLite (`sqlite_path`) para sobreviver a
+      reinícios; a memória continua sendo consultada primeiro.
+    - Contadores de acertos/falhas disponíveis em `stats()`.
+    """
+
+    def __init__(self, max_entries: int, ttls: Dict[str, float], default_ttl: float,
+                 sqlite_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttls = dict(ttls)
+        self.default_ttl = default_ttl
+        self.sqlite_path = sqlite_path
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # chave -> (expira_em, dados); mais recente no fim
+        self._db = None
+        self._db_pid = None
+        self._gravacoes_desde_limpeza = 0
+        self._stats = {'acertos': 0, 'acertos_disco': 0, 'falhas': 0, 'expiradas': 0, 'descartes_lru': 0}
+
+    def get(self, chave: str) -> Optional[Dict[str, Any]]:
+        """Retorna uma cópia da resposta em cache, ou None se ausente/expirada."""
+        agora = time.time()
+        with self._lock:
+            entrada = self._entries.get(chave)
+            if entrada is not None:
+                expira_em, dados = entrada
+                if expira_em > agora:
+                    self._entries.move_to_end(chave)
+                    self._stats['acertos'] += 1
+                    return copy.deepcopy(dados)
+                del self._entries[chave]
+                self._stats['expiradas'] += 1
+
+            entrada = self._db_get(chave, agora)
+            if entrada is not None:
+                self._store(chave, *entrada)
+                self._stats['acertos_disco'] += 1
+                return copy.deepcopy(entrada[1])
+
+            self._stats['falhas'] += 1
+            return None
+
+    def set(self, chave: str, dados: Dict[str, Any], status: Optional[str]):
+        """Armazena a resposta com o TTL correspondente ao status de entrega."""
+        ttl = self.ttls.get(status, self.default_ttl)
+        if ttl <= 0:
+            return
+        expira_em = time.time() + ttl
+        dados = copy.deepcopy(dados)
+        with self._lock:
+            self._store(chave, expira_em, dados)
+            self._db_set(chave, expira_em, dados)
+
+    def invalidate(self, chave: str):
+        with self._lock:
+            self._entries.pop(chave, None)
+            db = self._get_db()
+            if db is not None:
+                db.execute("DELETE FROM tracking_cache WHERE chave = ?", (chave,))
+                db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            db = self._get_db()
+            if db is not None:
+                db.execute("DELETE FROM tracking_cache")
+                db.commit()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            consultas = self._stats['acertos'] + self._stats['acertos_disco'] + self._stats['falhas']
+            return {
+                'entradas': len(self._entries),
+                'max_entradas': self.max_entries,
+                'taxa_acerto': round((self._stats['acertos'] + self._stats['acertos_disco']) / consultas, 3) if consultas else 0.0,
+                **self._stats,
+            }
+
+    def _store(self, chave: str, expira_em: float, dados: Dict[str, Any]):
+        # Chamado com o lock adquirido
+        self._entries[chave] = (expira_em, dados)
+        self._entries.move_to_end(chave)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats['descartes_lru'] += 1
+
+    def _get_db(self) -> Optional[sqlite3.Connection]:
+        # Chamado com o lock adquirido; uma conexão SQLite por processo
+        if not self.sqlite_path:
+            return None
+        if self._db is None or self._db_pid != os.getpid():
+            try:
+                self._db = sqlite3.connect(self.sqlite_path, check_same_thread=False)
+                self._db.execute("""
+                    CREATE TABLE IF NOT EXISTS tracking_cache (
+                        chave TEXT PRIMARY KEY,
+                        expira_em REAL NOT NULL,
+                        dados TEXT NOT NULL
+                    )
+                """)
+                self._db.commit()
+                self._db_pid = os.getpid()
+            except sqlite3.Error as e:
+                logger.error(f"Cache de rastreamento em disco desativado ({self.sqlite_path}): {e}")
+                self.sqlite_path = None
+                self._db = None
+        return self._db
+
+    def _db_get(self, chave: str, agora: float):
+        db = self._get_db()
+        if db is None:
+            return None
+        try:
+            row = db.execute(
+                "SELECT expira_em, dados FROM tracking_cache WHERE chave = ? AND expira_em > ?",
+                (chave, agora),
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Erro ao ler cache de rastreamento em disco: {e}")
+            return None
+        return (row[0], json.loads(row[1])) if row else None
+
+    def _db_set(self, chave: str, expira_em: float, dados: Dict[str, Any]):
+        db = self._get_db()
+        if db is None:
+            return
+        try:
+            db.execute(
+                "INSERT OR REPLACE INTO tracking_cache (chave, expira_em, dados) VALUES (?, ?, ?)",
+                (chave, expira_em, json.dumps(dados)),
+            )
+            self._gravacoes_desde_limpeza += 1
+            if self._gravacoes_desde_limpeza >= 500:
+                db.execute("DELETE FROM tracking_cache WHERE expira_em <= ?", (time.time(),))
+                self._gravacoes_desde_limpeza = 0
+            db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Erro ao gravar cache de rastreamento em disco: {e}")
@@ -1,7 +1,14 @@
+import base64
+import json
+import time
+from datetime import datetime, timedelta
 from flask import Blueprint, render_template, request, jsonify
 from modules.database import get_mysql_connection
+from modules.status_contadores import get_contadores
+from modules.http_cache import gerar_etag, nao_modificado, com_validadores, resposta_304
+from modules.sse import resposta_sse, GRUPO_PAINEL
+from modules import notificacoes
 from modules.logger_config import logger
-from modules import status
 import mysql.connector
 
 rastro_blueprint = Blueprint('rastro', __name__, template_folder='templates', static_folder='static')
@@ -11,12 +18,104 @@ def index():
     return render_template("index.html")
 
 
+STATUS_VALIDOS = ('ENTREGUE', 'PROBLEMA', 'EM_TRANSITO', 'NAO_ENCONTRADO')
+ARQUIVOS_PAGE_SIZE = 100  # Itens por página padrão em /rastro/api/arquivos
+ARQUIVOS_MAX_PAGE_SIZE = 500
+
+
+def _codificar_cursor(updated_at, chave_nfe) -> str:
+    """Cursor opaco com a posição (updated_at, chave_nfe) do último item da página; updated_at pode ser NULL."""
+    bruto = json.dumps([updated_at.isoformat() if updated_at else None, chave_nfe])
+    return base64.urlsafe_b64encode(bruto.encode()).decode().rstrip("=")
+
+
+def _decodificar_cursor(cursor: str):
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        updated_at, chave_nfe = json.loads(bruto)
+        return (datetime.fromisoformat(updated_at) if updated_at is not None else None), str(chave_nfe)
+    except (ValueError, TypeError):
+        raise ValueError("Cursor inválido")
+
+
+def _parse_data(valor: str, nome: str):
+    try:
+        return datetime.strptime(valor, "%Y-%m-%d").date()
+    except ValueError:
+        raise ValueError(f"Parâmetro '{nome}' deve estar no formato AAAA-MM-DD")
+
+
+def _buscar_pagina(cursor, condicoes, params, limite):
+    # O status de entrega já está materializado em categoria_status
+    cursor.execute(f"""
+        SELECT
+            chave_nfe,
+            NUM_NF,
+            transportadora,
+            cidade,
+            uf,
+            ultimo_evento,
+            categoria_status AS status,
+            updated_at
+        FROM nfe_status
+        WHERE {" AND ".join(condicoes)}
+        ORDER BY updated_at DESC, chave_nfe DESC
+        LIMIT %s
+    """, (*params, limite))
+    return cursor.fetchall()
+
+
 @rastro_blueprint.route("/rastro/api/arquivos", methods=["GET"])
 def api_arquivos():
-    # ... (seu código atual para api_arquivos - manter inalterado)
+    """
+    Lista as NF-es em páginas, da atualização mais recente para a mais antiga.
+
+    Parâmetros (query string, todos opcionais):
+        status: ENTREGUE, PROBLEMA, EM_TRANSITO ou NAO_ENCONTRADO.
+        transportadora, uf: filtros exatos.
+        data_inicio, data_fim: intervalo de dt_saida (AAAA-MM-DD, inclusivo).
+        limit: itens por página (padrão ARQUIVOS_PAGE_SIZE, máximo ARQUIVOS_MAX_PAGE_SIZE).
+        cursor: valor de `next_cursor` da página anterior.
+
+    Retorna {"items": [...], "next_cursor": str | null}. A paginação é por
+    chave (updated_at, chave_nfe): cada página custa o mesmo, qualquer que
+    seja o tamanho do histórico. NF-es sem updated_at vêm depois das demais.
+    """
+    conn = None
     try:
         # Obter parâmetro de filtro da query string
         status_filter = request.args.get('status', '').upper()
+        if status_filter and status_filter not in STATUS_VALIDOS:
+            return jsonify({"items": [], "next_cursor": None}) # Retorna vazio se o filtro de status for inválido
+
+        try:
+            limite = min(max(int(request.args.get('limit', ARQUIVOS_PAGE_SIZE)), 1), ARQUIVOS_MAX_PAGE_SIZE)
+        except ValueError:
+            return jsonify({"error": "Parâmetro 'limit' deve ser um número inteiro"}), 400
+
+        condicoes = ["NUM_NF IS NOT NULL", "NUM_NF != ''"]
+        params = []
+        if status_filter:
+            condicoes.append("categoria_status = %s")
+            params.append(status_filter)
+        transportadora = request.args.get('transportadora', '').strip()
+        if transportadora:
+            condicoes.append("transportadora = %s")
+            params.append(transportadora)
+        uf = request.args.get('uf', '').strip().upper()
+        if uf:
+            condicoes.append("uf = %s")
+            params.append(uf)
+        try:
+            if request.args.get('data_inicio'):
+                condicoes.append("dt_saida >= %s")
+                params.append(_parse_data(request.args['data_inicio'], 'data_inicio'))
+            if request.args.get('data_fim'):
+                condicoes.append("dt_saida < %s")
+                params.append(_parse_data(request.args['data_fim'], 'data_fim') + timedelta(days=1))
+            posicao = _decodificar_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         conn = get_mysql_connection()
         if not conn:
@@ -24,50 +123,38 @@ def api_arquivos():
 
         cursor_nfe_status = conn.cursor(dictionary=True)
 
-        # Consulta base para obter as NFs, incluindo a coluna ultimo_evento
-        query_nfes = """
-            SELECT
-                NUM_NF,
-                transportadora,
-                cidade,
-                uf,
-                ultimo_evento
-            FROM nfe_status
-            WHERE NUM_NF IS NOT NULL
-            AND NUM_NF != ''
-            ORDER BY updated_at DESC
-        """
-        cursor_nfe_status.execute(query_nfes)
-        nfes_data = cursor_nfe_status.fetchall()
-
-        nfes_com_status_determinado = []
-
-        for nfe in nfes_data:
-            ultimo_evento = nfe.get('ultimo_evento')
-
-            # Determinar o status usando o módulo status
-            status_determinado = status.determinar_status(conn, ultimo_evento)
-
-            # Adicionar o status determinado ao dicionário da NF
-            nfe['status'] = status_determinado
-            nfes_com_status_determinado.append(nfe)
-
+        # Ordem: updated_at DESC, chave_nfe DESC, com as linhas de updated_at NULL
+        # no fim (ORDER BY updated_at IS NULL, ...). São duas varreduras pelo
+        # índice (updated_at, chave_nfe): primeiro as datadas, depois as NULL.
+        inicio = time.monotonic()
+        nfes = []
+        if posicao is None or posicao[0] is not None:
+            condicoes_datadas = condicoes + ["updated_at IS NOT NULL"]
+            params_datadas = list(params)
+            if posicao is not None:
+                condicoes_datadas.append("(updated_at < %s OR (updated_at = %s AND chave_nfe < %s))")
+                params_datadas.extend([posicao[0], posicao[0], posicao[1]])
+            nfes = _buscar_pagina(cursor_nfe_status, condicoes_datadas, params_datadas, limite + 1)
+        if len(nfes) <= limite:
+            condicoes_nulas = condicoes + ["updated_at IS NULL"]
+            params_nulas = list(params)
+            if posicao is not None and posicao[0] is None:
+                condicoes_nulas.append("chave_nfe < %s")
+                params_nulas.append(posicao[1])
+            nfes += _buscar_pagina(cursor_nfe_status, condicoes_nulas, params_nulas, limite + 1 - len(nfes))
+        duracao_ms = (time.monotonic() - inicio) * 1000
         conn.close()
 
-        # Filtrar as NFs com base no parâmetro de status (agora no status determinado)
-        nfes_filtradas = []
-        if status_filter in ['ENTREGUE', 'PROBLEMA', 'EM_TRANSITO', 'NAO_ENCONTRADO']:
-            for nfe in nfes_com_status_determinado:
-                if nfe['status'] == status_filter:
-                    nfes_filtradas.append(nfe)
-        elif not status_filter:
-            nfes_filtradas = nfes_com_status_determinado
-        else:
-            return jsonify([]) # Retorna vazio se o filtro de status for inválido
+        next_cursor = None
+        if len(nfes) > limite:
+            nfes = nfes[:limite]
+            next_cursor = _codificar_cursor(nfes[-1]['updated_at'], nfes[-1]['chave_nfe'])
+        for nfe in nfes:
+            del nfe['chave_nfe'], nfe['updated_at']
 
-        logger.info(f"NFs encontradas após determinação de status: {len(nfes_filtradas)}")
+        logger.info(f"NFs encontradas após determinação de status: {len(nfes)} ({duracao_ms:.1f} ms)")
 
-        return jsonify(nfes_filtradas)
+        return jsonify({"items": nfes, "next_cursor": next_cursor})
 
     except Exception as e:
         logger.error(f"Erro ao buscar arquivos: {str(e)}")
@@ -76,11 +163,28 @@ def api_arquivos():
         if conn and conn.is_connected():
             conn.close()
 
-@rastro_blueprint.route("/rastro/api/dados", methods=["POST"])
+# Versão do histórico de uma NF para a ETag de /rastro/api/dados: a última
+# atualização em nfe_status, lida pelo índice (NUM_NF, updated_at). Toda
+# escrita em nfe_logs atualiza updated_at na mesma transação (agendador em
+# nfe_tracking_logger._update_nfe_status, edições em /status via
+# status._tocar_nfes_dos_logs).
+_VERSAO_DADOS_QUERY = "SELECT MAX(updated_at) FROM nfe_status WHERE NUM_NF = %s"
+
+
+@rastro_blueprint.route("/rastro/api/dados", methods=["GET", "POST"])
 def api_dados():
+    """
+    Histórico e dados da NF `filename` (query string no GET, JSON no POST).
+    O GET aceita If-None-Match/If-Modified-Since: a versão (última atualização
+    da NF em nfe_status, ver _VERSAO_DADOS_QUERY) é lida antes das consultas
+    e, sem mudança, a resposta é 304.
+    """
     conn = None
     try:
-        num_nf = request.json.get("filename")
+        if request.method == "GET":
+            num_nf = request.args.get("filename")
+        else:
+            num_nf = request.json.get("filename")
         if not num_nf:
             return jsonify({"error": "Número da NF não fornecido"}), 400
 
@@ -88,6 +192,13 @@ def api_dados():
         if not conn:
             return jsonify({"error": "Falha na conexão com o MySQL"}), 500
 
+        with conn.cursor() as cursor_versao:
+            cursor_versao.execute(_VERSAO_DADOS_QUERY, (num_nf,))
+            ultima_atualizacao = cursor_versao.fetchone()[0]
+        etag = gerar_etag('dados', num_nf, ultima_atualizacao)
+        if nao_modificado(etag, ultima_atualizacao):
+            return resposta_304(etag, ultima_atualizacao)
+
         response_data = {}
 
         # Buscar histórico de rastreamento da tabela nfe_logs
@@ -134,7 +245,7 @@ def api_dados():
         conn.close()
 
         logger.info(f"Dados de rastreamento e informações da NF {num_nf} buscados com sucesso.")
-        return jsonify(response_data)
+        return com_validadores(jsonify(response_data), etag, ultima_atualizacao)
 
     except mysql.connector.Error as db_error:
         logger.error(f"Erro de banco de dados ao buscar dados: {db_error}")
@@ -154,40 +265,26 @@ def api_dados():
 
 @rastro_blueprint.route("/rastro/api/status", methods=["GET"])
 def api_status():
-    conn = None
+    """
+    Totais por status de entrega, servidos dos contadores em memória
+    (ver modules.status_contadores). `?transportadora=` restringe a uma
+    transportadora. A ETag é derivada dos próprios totais.
+    """
     try:
-        conn = get_mysql_connection()
-        if not conn:
-            return jsonify({"error": "Falha na conexão com o MySQL"}), 500
-
-        cursor_nfe_status = conn.cursor(dictionary=True)
-
-        # Buscar todos os registros de nfe_status para obter o ultimo_evento
-        cursor_nfe_status.execute("SELECT NUM_NF, ultimo_evento FROM nfe_status WHERE NUM_NF IS NOT NULL AND NUM_NF != ''")
-        nfe_status_data = cursor_nfe_status.fetchall()
-
-        status_counts = {
-            'ENTREGUE': 0,
-            'EM_TRANSITO': 0,
-            'PROBLEMA': 0,
-            'NAO_ENCONTRADO': 0,
-            'TOTAL': 0
-        }
-
-        for item in nfe_status_data:
-            ultimo_evento = item.get('ultimo_evento')
-
-            # Determinar o status usando o módulo status
-            status_determinado = status.determinar_status(conn, ultimo_evento)
-            status_counts[status_determinado] += 1
-            status_counts['TOTAL'] += 1
-
-        conn.close()
-        return jsonify(status_counts)
-
+        contagem = get_contadores(request.args.get('transportadora') or None)
+        etag = gerar_etag('status', sorted(contagem.items()))
+        if nao_modificado(etag):
+            return resposta_304(etag)
+        return com_validadores(jsonify(contagem), etag)
     except Exception as e:
         logger.error(f"Erro ao buscar status: {str(e)}")
         return jsonify({"error": "Erro ao buscar status"}), 500
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
\ No newline at end of file
+
+
+@rastro_blueprint.route("/rastro/api/eventos", methods=["GET"])
+def api_eventos():
+    """
+    Stream SSE do painel: um evento `nfe_atualizada` ({chave_nfe, NUM_NF, status})
+    a cada NF-e com eventos ou status gravados pelo agendador.
+    """
+    return resposta_sse(notificacoes.NFE_ATUALIZADA, GRUPO_PAINEL)
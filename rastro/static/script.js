@@ -28,6 +28,15 @@ const STATUS_CONFIG = {
   }
 };
 
+// Estado da listagem paginada: filtro de status aplicado no servidor e
+// cursor da próxima página (null quando não há mais páginas)
+const PAGINACAO = {
+  status: '',
+  cursor: null,
+  itens: [],
+  carregando: false
+};
+
 const STATUS_INFO = {
   ENTREGUE: {
     text: "Entregue",
@@ -56,38 +65,77 @@ const STATUS_INFO = {
 // ==============================================
 
 /**
- * Carrega a lista de arquivos XML da API
+ * Carrega uma página da lista de NF-es da API. Com `reiniciar`, descarta as
+ * páginas já carregadas e recomeça do início com o filtro de status atual.
  */
-async function carregarArquivos() {
+async function carregarArquivos(reiniciar = true) {
+  if (PAGINACAO.carregando) return;
+  PAGINACAO.carregando = true;
+  if (reiniciar) {
+    PAGINACAO.cursor = null;
+    PAGINACAO.itens = [];
+  }
+
   try {
-    const response = await fetch(RASTRO_CONFIG.urls.getArquivos);
+    const params = new URLSearchParams();
+    if (PAGINACAO.status) params.set('status', PAGINACAO.status);
+    if (PAGINACAO.cursor) params.set('cursor', PAGINACAO.cursor);
+
+    const response = await fetch(`${RASTRO_CONFIG.urls.getArquivos}?${params}`);
     if (!response.ok) {
       throw new Error(`HTTP error! status: ${response.status}`);
     }
 
     const data = await response.json();
-    if (!data || data.length === 0) {
+    PAGINACAO.itens = PAGINACAO.itens.concat(data.items || []);
+    PAGINACAO.cursor = data.next_cursor || null;
+
+    if (PAGINACAO.itens.length === 0) {
       mostrarMensagemSemDados();
-      return;
+    } else {
+      renderizarArquivos(PAGINACAO.itens, reiniciar);
     }
-
-    const statusData = calcularStatusData(data);
-    renderizarArquivos(data, statusData);
+    atualizarBotaoCarregarMais();
 
   } catch (error) {
     console.error("Erro ao carregar arquivos:", error);
     mostrarErroCarregamento(error);
+  } finally {
+    PAGINACAO.carregando = false;
   }
 }
 
 /**
- * Renderiza a lista de arquivos e os cards de status
+ * Renderiza a lista de arquivos, respeitando a busca digitada
  */
-function renderizarArquivos(files, statusData) {
-  renderizarStatusCards(statusData);
-  renderizarListaArquivos(files);
-  configurarEventListeners();
-  selecionarItensPadrao();
+function renderizarArquivos(files, selecionarPrimeiro) {
+  const searchTerm = document.getElementById('searchNfe').value.toLowerCase();
+  if (searchTerm) {
+    filtrarArquivos(files, searchTerm);
+  } else {
+    renderizarListaArquivos(files);
+  }
+
+  if (selecionarPrimeiro) {
+    const firstFileItem = document.querySelector('.file-item');
+    if (firstFileItem) firstFileItem.click();
+  }
+}
+
+/**
+ * Mostra o botão "Carregar mais" enquanto houver próxima página
+ */
+function atualizarBotaoCarregarMais() {
+  let botao = document.getElementById('carregarMaisBtn');
+  if (!botao) {
+    botao = document.createElement('button');
+    botao.id = 'carregarMaisBtn';
+    botao.className = 'retry-btn';
+    botao.innerHTML = '<i class="fas fa-chevron-down"></i> Carregar mais';
+    botao.addEventListener('click', () => carregarArquivos(false));
+    document.getElementById('fileList').after(botao);
+  }
+  botao.style.display = PAGINACAO.cursor ? '' : 'none';
 }
 
 /**
@@ -101,11 +149,9 @@ async function buscarDados(numNf) {
   const minLoadTime = 800;
 
   try {
-    const response = await fetch(RASTRO_CONFIG.urls.getDados, {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ filename: numNf })
-    });
+    // GET para o navegador revalidar com If-None-Match (304 se a NF não mudou)
+    const params = new URLSearchParams({ filename: numNf });
+    const response = await fetch(`${RASTRO_CONFIG.urls.getDados}?${params}`);
 
     const data = await response.json();
 
@@ -150,6 +196,60 @@ async function carregarStatusCardsIniciais() {
   }
 }
 
+/**
+ * Recebe por SSE as NF-es gravadas pelo agendador: atualiza os contadores,
+ * o status do item na lista e, se for a NF aberta, o rastreamento
+ */
+function iniciarAtualizacoesTempoReal() {
+  if (!window.EventSource || !RASTRO_CONFIG.urls.eventos) return;
+
+  const eventos = new EventSource(RASTRO_CONFIG.urls.eventos);
+  let contagemPendente = null;
+
+  eventos.addEventListener('nfe_atualizada', (e) => {
+    const nfe = JSON.parse(e.data);
+
+    // Uma passada do agendador grava várias NF-es: uma única atualização dos cards
+    clearTimeout(contagemPendente);
+    contagemPendente = setTimeout(atualizarContagensCards, 1000);
+
+    const item = PAGINACAO.itens.find(file => String(file.NUM_NF) === String(nfe.NUM_NF));
+    if (item) {
+      item.status = nfe.status;
+      atualizarItemArquivo(nfe.NUM_NF, nfe.status);
+    }
+
+    const ativo = document.querySelector('.file-item.active .file-num');
+    if (ativo && ativo.textContent === String(nfe.NUM_NF)) {
+      buscarDados(nfe.NUM_NF);
+    }
+  });
+
+  eventos.onerror = () => {
+    // Recusado pelo limite de streams do servidor (503): tenta de novo mais tarde
+    if (eventos.readyState === EventSource.CLOSED) {
+      setTimeout(iniciarAtualizacoesTempoReal, 30000);
+    }
+  };
+}
+
+/**
+ * Atualiza só os números dos cards, sem perder o card selecionado
+ */
+async function atualizarContagensCards() {
+  try {
+    const response = await fetch(RASTRO_CONFIG.urls.getStatus);
+    if (!response.ok) return;
+    const data = await response.json();
+    Object.entries(data).forEach(([status, total]) => {
+      const count = document.querySelector(`.status-card[data-status="${status}"] .status-card-count`);
+      if (count) count.textContent = total;
+    });
+  } catch (error) {
+    console.error("Erro ao atualizar status:", error);
+  }
+}
+
 // ==============================================
 // FUNÇÕES DE RENDERIZAÇÃO (ATUALIZADAS)
 // ==============================================
@@ -232,6 +332,19 @@ function renderizarListaArquivos(files) {
   });
 }
 
+/**
+ * Atualiza o status de uma NF já renderizada na lista
+ */
+function atualizarItemArquivo(numNf, status) {
+  document.querySelectorAll('.file-item').forEach(item => {
+    if (item.querySelector('.file-num').textContent !== String(numNf)) return;
+    item.dataset.status = status;
+    const statusElement = item.querySelector('.file-status');
+    statusElement.textContent = STATUS_INFO[status]?.text || status;
+    statusElement.className = `file-status status-${status.toLowerCase().replace('_', '')}`;
+  });
+}
+
 /**
  * Renderiza os dados de rastreamento usando templates
  */
@@ -410,19 +523,6 @@ function mostrarErroCarregamento(error) {
     </div>`;
 }
 
-function calcularStatusData(files) {
-  const entregue = files.filter(item => item.status === 'ENTREGUE').length;
-  const emTransito = files.filter(item => item.status === 'EM_TRANSITO').length;
-  const problema = files.filter(item => item.status === 'PROBLEMA').length;
-
-  return {
-    ENTREGUE: entregue,
-    EM_TRANSITO: emTransito,
-    PROBLEMA: problema,
-    TOTAL: entregue + emTransito   // Só soma ENTREGUE + EM_TRANSITO
-  };
-}
-
 function calcularTemposTransporte(items) {
   const primeiroEvento = items[items.length - 1];
   const eventoEntrega = items.find(e => e.ocorrencia.toLowerCase().includes("entregue"));
@@ -490,9 +590,10 @@ function configurarEventosCardsStatus() {
     card.classList.add('active');
     card.setAttribute('aria-current', 'true');
 
+    // O filtro de status é aplicado no servidor; recomeça a paginação
     const status = card.getAttribute('data-status');
-    const searchTerm = document.getElementById('searchNfe').value.toLowerCase();
-    filtrarArquivos(window.currentFiles, searchTerm, status === 'TOTAL' ? '' : status);
+    PAGINACAO.status = status === 'TOTAL' ? '' : status;
+    carregarArquivos();
   });
 }
 
@@ -514,9 +615,9 @@ function configurarEventosItensArquivo() {
 
 function configurarInputBusca() {
   document.getElementById('searchNfe').addEventListener('input', (e) => {
+    // A busca filtra as páginas já carregadas; o status já veio filtrado do servidor
     const searchTerm = e.target.value.toLowerCase();
-    const activeStatus = document.querySelector('.status-card.active')?.getAttribute('data-status') || '';
-    filtrarArquivos(window.currentFiles, searchTerm, activeStatus === 'TOTAL' ? '' : activeStatus);
+    filtrarArquivos(PAGINACAO.itens, searchTerm);
   });
 }
 
@@ -544,8 +645,6 @@ function filtrarArquivos(files, searchTerm = "", status = "") {
         return item.outerHTML;
       }).join('')
     : criarMensagemVazia("Nenhum documento encontrado", "fa-folder-open");
-
-  configurarEventosItensArquivo();
 }
 
 // ==============================================
@@ -553,15 +652,19 @@ function filtrarArquivos(files, searchTerm = "", status = "") {
 // ==============================================
 
 function selecionarItensPadrao() {
+  // O clique no card carrega a primeira página já filtrada e seleciona o primeiro item
   const emTransitoCard = document.querySelector('.status-card[data-status="EM_TRANSITO"]') ||
     document.querySelector('.status-card');
-  if (emTransitoCard) emTransitoCard.click();
-
-  const firstFileItem = document.querySelector('.file-item');
-  if (firstFileItem) firstFileItem.click();
+  if (emTransitoCard) {
+    emTransitoCard.click();
+  } else {
+    carregarArquivos();
+  }
 }
 
-document.addEventListener("DOMContentLoaded", function() {
-  carregarArquivos();
-  carregarStatusCardsIniciais(); // Carrega os status iniciais
+document.addEventListener("DOMContentLoaded", async function() {
+  configurarEventListeners();
+  await carregarStatusCardsIniciais(); // Carrega os status iniciais
+  selecionarItensPadrao();
+  iniciarAtualizacoesTempoReal();
 });
\ No newline at end of file
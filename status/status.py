@@ -1,10 +1,56 @@
 from flask import Blueprint, render_template, request, jsonify
 from modules.database import get_mysql_connection
 from modules.logger_config import logger
+from modules.nfe_tracking_logger import invalidar_indice_ocorrencias
+from modules.status import invalidar_mapa_categorias, recalcular_categorias
+from modules.status_contadores import agendar_reconciliacao
+from modules import notificacoes
 import mysql.connector
 
 status_blueprint = Blueprint('status', __name__, template_folder='templates', static_folder='static')
 
+# Acima deste número de NF-es afetadas por uma edição de nfe_logs, publica-se
+# uma única OCORRENCIAS_ALTERADAS em vez de um NFE_ATUALIZADA por NF-e
+LIMITE_NOTIFICACOES_POR_NFE = 200
+
+_NFES_DOS_LOGS_QUERY = """
+    SELECT DISTINCT l.chave_nfe, l.NUM_NF, s.status
+    FROM nfe_logs l
+    LEFT JOIN nfe_status s ON s.chave_nfe = l.chave_nfe
+    WHERE {filtro}
+"""
+
+
+# Avança nfe_status.updated_at (versão usada nas ETags de /rastro/api/dados e
+# /api/acesso) das NF-es cujos eventos serão editados. Sempre anda ao menos um
+# segundo, para que duas edições no mesmo segundo não repitam a versão.
+_TOCAR_NFES_DOS_LOGS_QUERY = """
+    UPDATE nfe_status s
+    JOIN nfe_logs l ON l.chave_nfe = s.chave_nfe
+    SET s.updated_at = COALESCE(GREATEST(NOW(), s.updated_at + INTERVAL 1 SECOND), NOW())
+    WHERE {filtro}
+"""
+
+
+def _tocar_nfes_dos_logs(cursor, filtro, parametros):
+    """Atualiza a versão (updated_at) das NF-es dos eventos que atendem ao filtro; chamar antes de editá-los."""
+    cursor.execute(_TOCAR_NFES_DOS_LOGS_QUERY.format(filtro=filtro), parametros)
+
+
+def _nfes_dos_logs(cursor, filtro, parametros):
+    """NF-es (chave_nfe, NUM_NF, status) dos eventos de nfe_logs que atendem ao filtro."""
+    cursor.execute(_NFES_DOS_LOGS_QUERY.format(filtro=filtro), parametros)
+    return [{'chave_nfe': chave, 'NUM_NF': num_nf, 'status': status} for chave, num_nf, status in cursor.fetchall()]
+
+
+def _publicar_nfes_alteradas(nfes):
+    """Avisa (depois do commit) que a página de rastreio das NF-es mudou."""
+    if len(nfes) > LIMITE_NOTIFICACOES_POR_NFE:
+        notificacoes.publicar(notificacoes.OCORRENCIAS_ALTERADAS, {})
+        return
+    for dados in nfes:
+        notificacoes.publicar(notificacoes.NFE_ATUALIZADA, dados)
+
 @status_blueprint.route("/")
 def status():
     return render_template("ocorrencias.html")
@@ -74,8 +120,10 @@ def adicionar_ocorrencia():
         cursor = conn.cursor()
         query = "INSERT INTO ocorrencias (CODIGO_SSW, DESCRICAO, ATIVO) VALUES (%s, %s, %s)" # Removendo TIPO e PROCESSO
         cursor.execute(query, (codigo_ssw, descricao, 1))
+        invalidar_indice_ocorrencias(cursor)
         conn.commit()
         conn.close()
+        notificacoes.publicar(notificacoes.OCORRENCIAS_ALTERADAS, {})
 
         logger.info(f"Ocorrência com CODIGO_SSW {codigo_ssw} adicionada com sucesso.")
         return jsonify({"message": "Ocorrência adicionada com sucesso."}), 201
@@ -142,8 +190,10 @@ def editar_ocorrencia(codigo_ssw):
         cursor = conn.cursor()
         query = "UPDATE ocorrencias SET DESCRICAO = %s WHERE CODIGO_SSW = %s" # Removendo TIPO e PROCESSO
         cursor.execute(query, (descricao, codigo_ssw))
+        invalidar_indice_ocorrencias(cursor)
         conn.commit()
         conn.close()
+        notificacoes.publicar(notificacoes.OCORRENCIAS_ALTERADAS, {})
 
         logger.info(f"Ocorrência com CODIGO_SSW {codigo_ssw} editada com sucesso.")
         return jsonify({"message": "Ocorrência editada com sucesso."}), 200
@@ -171,7 +221,7 @@ def api_ocorrencias_pendentes():
             return jsonify({"error": "Falha na conexão com o MySQL"}), 500
 
         cursor = conn.cursor(dictionary=True)
-        query = "SELECT DISTINCT tipo_ocorrencia, MIN(id) as id FROM nfe_logs WHERE codigo_ocorrencia = '999' GROUP BY tipo_ocorrencia"
+        query = "SELECT tipo_ocorrencia, MIN(id) as id, COUNT(*) as total FROM nfe_logs WHERE codigo_ocorrencia = '999' GROUP BY tipo_ocorrencia ORDER BY total DESC"
         cursor.execute(query)
         ocorrencias_pendentes = cursor.fetchall()
         conn.close()
@@ -211,6 +261,9 @@ def atribuir_codigo_ocorrencia_pendente(id):
 
         cursor = conn.cursor()
 
+        nfes = _nfes_dos_logs(cursor, "l.id = %s AND l.codigo_ocorrencia = '999'", (id,))
+        _tocar_nfes_dos_logs(cursor, "l.id = %s AND l.codigo_ocorrencia = '999'", (id,))
+
         # Atualiza o codigo_ocorrencia na tabela nfe_logs
         cursor.execute(
             "UPDATE nfe_logs SET codigo_ocorrencia = %s WHERE id = %s AND codigo_ocorrencia = '999'",
@@ -227,7 +280,9 @@ def atribuir_codigo_ocorrencia_pendente(id):
             "INSERT INTO ocorrencias (CODIGO_SSW, DESCRICAO) VALUES (%s, %s)" # Removendo TIPO e PROCESSO
         )
         cursor.execute(insert_ocorrencias_query, (novo_codigo, descricao_ocorrencia))
+        invalidar_indice_ocorrencias(cursor)
         conn.commit()
+        _publicar_nfes_alteradas(nfes)
 
         logger.info(
             f"Código '{novo_codigo}' atribuído à ocorrência pendente (ID: {id}) na tabela nfe_logs e inserido na tabela ocorrencias."
@@ -257,6 +312,69 @@ def atribuir_codigo_ocorrencia_pendente(id):
         if conn and conn.is_connected():
             conn.close()
 
+@status_blueprint.route("/api/ocorrencias/pendentes/atribuir-codigo", methods=["PUT"])
+def atribuir_codigo_ocorrencias_pendentes_em_lote():
+    """Atribui o código a todos os eventos '999' com o mesmo tipo_ocorrencia."""
+    conn = None
+    try:
+        data = request.json
+        novo_codigo = data.get("novo_codigo")
+        tipo_ocorrencia = data.get("tipo_ocorrencia")
+
+        if not all([novo_codigo, tipo_ocorrencia]):
+            return jsonify({"error": "Os campos 'novo_codigo' e 'tipo_ocorrencia' são obrigatórios"}), 400
+
+        conn = get_mysql_connection()
+        if not conn:
+            return jsonify({"error": "Falha na conexão com o MySQL"}), 500
+
+        cursor = conn.cursor()
+        nfes = _nfes_dos_logs(cursor, "l.codigo_ocorrencia = '999' AND l.tipo_ocorrencia = %s", (tipo_ocorrencia,))
+        _tocar_nfes_dos_logs(cursor, "l.codigo_ocorrencia = '999' AND l.tipo_ocorrencia = %s", (tipo_ocorrencia,))
+        cursor.execute(
+            "UPDATE nfe_logs SET codigo_ocorrencia = %s WHERE codigo_ocorrencia = '999' AND tipo_ocorrencia = %s",
+            (novo_codigo, tipo_ocorrencia),
+        )
+        atualizados = cursor.rowcount
+
+        # Cadastra a descrição para que os próximos eventos já recebam o código
+        cursor.execute(
+            "SELECT 1 FROM ocorrencias WHERE CODIGO_SSW = %s AND DESCRICAO = %s LIMIT 1",
+            (novo_codigo, tipo_ocorrencia),
+        )
+        if cursor.fetchone() is None:
+            cursor.execute(
+                "INSERT INTO ocorrencias (CODIGO_SSW, DESCRICAO) VALUES (%s, %s)",
+                (novo_codigo, tipo_ocorrencia),
+            )
+            invalidar_indice_ocorrencias(cursor)
+        conn.commit()
+        _publicar_nfes_alteradas(nfes)
+
+        logger.info(
+            f"Código '{novo_codigo}' atribuído a {atualizados} eventos pendentes com tipo_ocorrencia '{tipo_ocorrencia}'."
+        )
+        return jsonify(
+            {
+                "message": f"Código '{novo_codigo}' atribuído a {atualizados} eventos.",
+                "atualizados": atualizados,
+            }
+        ), 200
+
+    except mysql.connector.Error as db_error:
+        logger.error(f"Erro de banco de dados ao atribuir código em lote: {db_error}")
+        if conn:
+            conn.rollback()
+        return jsonify({"error": "Erro ao atribuir código no banco de dados", "details": str(db_error)}), 500
+    except Exception as e:
+        logger.error(f"Erro inesperado ao atribuir código em lote: {e}")
+        if conn:
+            conn.rollback()
+        return jsonify({"error": "Erro interno ao atribuir código", "details": str(e)}), 500
+    finally:
+        if conn and conn.is_connected():
+            conn.close()
+
 @status_blueprint.route("/api/ocorrencias/pendentes/<int:id>/remover", methods=["DELETE"])
 def remover_ocorrencia_pendente(id):
     conn = None
@@ -266,8 +384,11 @@ def remover_ocorrencia_pendente(id):
             return jsonify({"error": "Falha na conexão com o MySQL"}), 500
 
         cursor = conn.cursor()
+        nfes = _nfes_dos_logs(cursor, "l.id = %s AND l.codigo_ocorrencia = '999'", (id,))
+        _tocar_nfes_dos_logs(cursor, "l.id = %s AND l.codigo_ocorrencia = '999'", (id,))
         cursor.execute("DELETE FROM nfe_logs WHERE id = %s AND codigo_ocorrencia = '999'", (id,))
         conn.commit()
+        _publicar_nfes_alteradas(nfes)
 
         if cursor.rowcount > 0:
             logger.info(f"Ocorrência pendente com ID {id} removida com sucesso.")
@@ -356,8 +477,13 @@ def vincular_codigo_categoria():
             insert_query = "INSERT INTO nfe_categorias (DESCRICAO, transportadora_id) VALUES (%s, %s)" # created_at e updated_at serão automáticos
             cursor.execute(insert_query, (descricao_categoria, transportadora_id))
 
+        invalidar_mapa_categorias(cursor)
+        alteradas = recalcular_categorias(cursor)
         conn.commit()
+        if alteradas:
+            agendar_reconciliacao()  # Só depois do commit: a recontagem precisa ver as novas categorias
         conn.close()
+        notificacoes.publicar(notificacoes.OCORRENCIAS_ALTERADAS, {})
 
         logger.info(f"Código '{codigo_ssw}' vinculado à descrição '{descricao_categoria}' para transportadora {transportadora_id}.")
         return jsonify({"message": f"Código '{codigo_ssw}' vinculado à descrição '{descricao_categoria}' com sucesso."}), 200
@@ -393,6 +519,7 @@ def criar_categoria():
         cursor = conn.cursor()
         query = "INSERT INTO nfe_categorias (DESCRICAO) VALUES (%s)" # created_at e updated_at serão automáticos
         cursor.execute(query, (descricao,))
+        invalidar_mapa_categorias(cursor)
         conn.commit()
         conn.close()
 
@@ -462,14 +589,21 @@ def vincular_ocorrencias():
         cursor = conn.cursor()
         query = "UPDATE ocorrencias SET categoria_id = %s WHERE CODIGO_SSW = %s"
 
+        vinculadas = 0
         for codigo_ssw in ocorrencias:
             cursor.execute(query, (categoria_id, codigo_ssw))
+            vinculadas += cursor.rowcount
 
+        invalidar_mapa_categorias(cursor)
+        alteradas = recalcular_categorias(cursor)
         conn.commit()
+        if alteradas:
+            agendar_reconciliacao()  # Só depois do commit: a recontagem precisa ver as novas categorias
         conn.close()
+        notificacoes.publicar(notificacoes.OCORRENCIAS_ALTERADAS, {})
 
-        logger.info(f"Vinculadas {cursor.rowcount} ocorrências à categoria ID {categoria_id}.")
-        return jsonify({"message": f"{cursor.rowcount} ocorrências vinculadas com sucesso à categoria ID {categoria_id}."}), 200
+        logger.info(f"Vinculadas {vinculadas} ocorrências à categoria ID {categoria_id}.")
+        return jsonify({"message": f"{vinculadas} ocorrências vinculadas com sucesso à categoria ID {categoria_id}."}), 200
 
     except mysql.connector.Error as db_error:
         logger.error(f"Erro de banco de dados ao vincular ocorrências: {db_error}")
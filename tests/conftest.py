@@ -0,0 +1,7 @@
+# tests/conftest.py
+import os
+import sys
+
+# Os módulos são importados a partir da raiz do projeto (modules.*, rastro.*),
+# como em app.py
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
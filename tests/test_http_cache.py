@@ -0,0 +1,43 @@
+# tests/test_http_cache.py
+from datetime import datetime
+
+from flask import Flask
+
+from modules.http_cache import gerar_etag, nao_modificado
+
+app = Flask(__name__)
+
+
+def test_gerar_etag_deterministica_e_sensivel_as_partes():
+    assert gerar_etag('dados', '123', datetime(2025, 1, 1)) == gerar_etag('dados', '123', datetime(2025, 1, 1))
+    assert gerar_etag('dados', '123', datetime(2025, 1, 1)) != gerar_etag('dados', '123', datetime(2025, 1, 2))
+    assert gerar_etag('dados', '123') != gerar_etag('acesso', '123')
+
+
+def test_nao_modificado_por_if_none_match():
+    etag = gerar_etag('dados', '123')
+    with app.test_request_context(headers={'If-None-Match': f'"{etag}"'}):
+        assert nao_modificado(etag)
+    with app.test_request_context(headers={'If-None-Match': f'W/"{etag}"'}):
+        assert nao_modificado(etag)
+    with app.test_request_context(headers={'If-None-Match': '"outra"'}):
+        assert not nao_modificado(etag)
+
+
+def test_if_none_match_tem_precedencia_sobre_if_modified_since():
+    headers = {'If-None-Match': '"outra"', 'If-Modified-Since': 'Wed, 01 Jan 2025 12:00:00 GMT'}
+    with app.test_request_context(headers=headers):
+        assert not nao_modificado(gerar_etag('x'), datetime(2025, 1, 1, 11, 0))
+
+
+def test_nao_modificado_por_if_modified_since():
+    headers = {'If-Modified-Since': 'Wed, 01 Jan 2025 12:00:00 GMT'}
+    with app.test_request_context(headers=headers):
+        assert nao_modificado('etag', datetime(2025, 1, 1, 12, 0, 0, 500000))  # Microssegundos ignorados
+        assert not nao_modificado('etag', datetime(2025, 1, 1, 12, 0, 1))
+        assert not nao_modificado('etag', None)
+
+
+def test_sem_cabecalhos_condicionais():
+    with app.test_request_context():
+        assert not nao_modificado('etag', datetime(2025, 1, 1))
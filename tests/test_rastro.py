@@ -0,0 +1,23 @@
+# tests/test_rastro.py
+from datetime import datetime
+
+import pytest
+
+from rastro.rastro import _codificar_cursor, _decodificar_cursor
+
+
+@pytest.mark.parametrize("updated_at", [datetime(2025, 3, 4, 5, 6, 7), datetime(2025, 3, 4, 5, 6, 7, 890), None])
+def test_cursor_ida_e_volta(updated_at):
+    cursor = _codificar_cursor(updated_at, "35250112345678000190550010000012341000012345")
+    assert "=" not in cursor
+    assert _decodificar_cursor(cursor) == (updated_at, "35250112345678000190550010000012341000012345")
+
+
+def test_cursor_converte_chave_para_texto():
+    assert _decodificar_cursor(_codificar_cursor(None, 123)) == (None, "123")
+
+
+@pytest.mark.parametrize("cursor", ["", "nao-e-base64!", _codificar_cursor(None, "x")[:-3], "WzFd"])
+def test_cursor_invalido(cursor):
+    with pytest.raises(ValueError):
+        _decodificar_cursor(cursor)
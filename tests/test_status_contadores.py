@@ -0,0 +1,108 @@
+# tests/test_status_contadores.py
+import mysql.connector
+import pytest
+
+from modules import status_contadores
+
+
+class CursorFalso:
+    """Cursor que registra os comandos e devolve resultados pré-definidos por consulta."""
+
+    def __init__(self, resultados=None, erro=None):
+        self.resultados = resultados or {}
+        self.erro = erro
+        self.executados = []
+        self.executemany_chamadas = []
+        self._ultimo = []
+
+    def execute(self, query, params=None):
+        if self.erro:
+            raise self.erro
+        self.executados.append((query, params))
+        self._ultimo = next((linhas for trecho, linhas in self.resultados.items() if trecho in query), [])
+
+    def executemany(self, query, seq_params):
+        self.executemany_chamadas.append((query, list(seq_params)))
+
+    def fetchall(self):
+        return list(self._ultimo)
+
+    def close(self):
+        pass
+
+
+class ConexaoFalsa:
+    def __init__(self, cursor, in_transaction=False):
+        self._cursor = cursor
+        self.in_transaction = in_transaction
+        self.transacoes = []
+        self.commits = 0
+
+    def cursor(self):
+        return self._cursor
+
+    def start_transaction(self, **opcoes):
+        self.transacoes.append(opcoes)
+
+    def commit(self):
+        self.commits += 1
+        self.in_transaction = False
+
+
+def test_aplicar_delta_sem_mudanca_de_categoria():
+    cursor = CursorFalso()
+    status_contadores.aplicar_delta(cursor, "TRP", "EM_TRANSITO", "EM_TRANSITO")
+    assert cursor.executados == []
+
+
+def test_aplicar_delta_nfe_nova():
+    cursor = CursorFalso()
+    status_contadores.aplicar_delta(cursor, None, None, "NAO_ENCONTRADO")
+    (query, params), = cursor.executados
+    assert query.count("(%s, %s, %s)") == 1
+    assert params == ["NAO_ENCONTRADO", "", 1]
+
+
+def test_aplicar_delta_move_entre_categorias():
+    cursor = CursorFalso()
+    status_contadores.aplicar_delta(cursor, "TRP", "EM_TRANSITO", "ENTREGUE")
+    (query, params), = cursor.executados
+    assert "ON DUPLICATE KEY UPDATE total = total + VALUES(total)" in query
+    assert params == ["EM_TRANSITO", "TRP", -1, "ENTREGUE", "TRP", 1]
+
+
+def test_aplicar_delta_falha_nao_propaga():
+    antes = status_contadores.get_contadores_stats()['deltas_com_erro']
+    cursor = CursorFalso(erro=mysql.connector.Error("falha"))
+    status_contadores.aplicar_delta(cursor, "TRP", None, "ENTREGUE")
+    assert status_contadores.get_contadores_stats()['deltas_com_erro'] == antes + 1
+
+
+def test_reconciliar_grava_so_a_diferenca():
+    reais = [("ENTREGUE", "A", 10), ("EM_TRANSITO", "A", 4), ("PROBLEMA", "B", 2)]
+    gravados = [("ENTREGUE", "A", 7), ("EM_TRANSITO", "A", 4), ("NAO_ENCONTRADO", "B", 3)]
+    cursor = CursorFalso({"GROUP BY": reais, "FROM nfe_status_contadores": gravados})
+    conn = ConexaoFalsa(cursor, in_transaction=True)
+
+    corrigidas = status_contadores.reconciliar_contadores(conn)
+
+    assert corrigidas == 3
+    assert conn.transacoes == [{'consistent_snapshot': True, 'isolation_level': 'REPEATABLE READ'}]
+    assert conn.commits == 2  # Transação anterior encerrada antes do retrato, e a da reconciliação
+    (query, deltas), = cursor.executemany_chamadas
+    assert "total = total + VALUES(total)" in query
+    assert sorted(deltas) == sorted([("ENTREGUE", "A", 3), ("PROBLEMA", "B", 2), ("NAO_ENCONTRADO", "B", -3)])
+    assert any("DELETE FROM nfe_status_contadores WHERE total = 0" in q for q, _ in cursor.executados)
+
+
+def test_reconciliar_sem_divergencias():
+    linhas = [("ENTREGUE", "A", 10)]
+    cursor = CursorFalso({"GROUP BY": linhas, "FROM nfe_status_contadores": linhas})
+    assert status_contadores.reconciliar_contadores(ConexaoFalsa(cursor)) == 0
+    assert cursor.executemany_chamadas == []
+
+
+@pytest.fixture(autouse=True)
+def _sem_retrato():
+    yield
+    status_contadores.invalidar_retrato()
@@ -0,0 +1,49 @@
+# tests/test_tasks.py
+from datetime import datetime
+
+from modules.tasks import _eventos_novos, MARCA_SEM_DATA
+
+
+def _evento(data_hora, codigo):
+    return {'data_hora': data_hora, 'codigo_ocorrencia': codigo, 'ocorrencia': f"OCORRENCIA {codigo}"}
+
+
+ITEMS = [
+    _evento("2025-01-01T08:00:00", "80"),
+    _evento("2025-01-01T12:30:00.250", "82"),
+    _evento("2025-01-02T09:00:00", "03"),
+    _evento("2025-01-03T10:00:00", "01"),
+]
+
+
+def test_primeira_consulta_devolve_todos():
+    assert _eventos_novos(ITEMS, None, None) == ITEMS
+
+
+def test_eventos_depois_do_ultimo_gravado():
+    assert _eventos_novos(ITEMS, datetime(2025, 1, 2, 9, 0), "03") == ITEMS[3:]
+
+
+def test_marca_sem_microssegundos_encontra_o_evento():
+    # O DATETIME do MySQL guarda a marca sem os microssegundos do evento
+    assert _eventos_novos(ITEMS, datetime(2025, 1, 1, 12, 30), "82") == ITEMS[2:]
+    assert _eventos_novos(ITEMS, datetime(2025, 1, 1, 12, 30, 0, 250000), "82") == ITEMS[2:]
+
+
+def test_ultimo_evento_gravado_e_o_mais_recente():
+    assert _eventos_novos(ITEMS, datetime(2025, 1, 3, 10, 0), "01") == []
+
+
+def test_sem_o_ultimo_na_resposta_usa_data_hora():
+    # Código diferente no mesmo instante: não casa, valem só os posteriores
+    assert _eventos_novos(ITEMS, datetime(2025, 1, 1, 12, 30), "99") == ITEMS[2:]
+
+
+def test_eventos_sem_data_sempre_novos():
+    items = ITEMS + [_evento("", "05"), _evento("data invalida", "06")]
+    novos = _eventos_novos(items, datetime(2025, 1, 5), "xx")
+    assert novos == items[4:]
+
+
+def test_marca_sem_data_reenvia_eventos_datados():
+    assert _eventos_novos(ITEMS, MARCA_SEM_DATA, None) == ITEMS
@@ -0,0 +1,64 @@
+# tests/test_tracking.py
+import pytest
+
+from modules import tracking
+from modules.tracking import _TokenBucket
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 500.0
+
+    def __call__(self):
+        return self.agora
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    relogio = Relogio()
+    monkeypatch.setattr(tracking.time, "monotonic", relogio)
+    return relogio
+
+
+@pytest.fixture
+def limite(monkeypatch):
+    monkeypatch.setitem(tracking._config, 'rate_limit_per_second', 2.0)
+    monkeypatch.setitem(tracking._config, 'rate_limit_burst', 3)
+
+
+def test_rajada_inicial_sem_espera(relogio, limite):
+    balde = _TokenBucket()
+    assert [balde.reservar() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert balde.stats()['esperas'] == 0
+
+
+def test_espera_cresce_com_o_balde_vazio(relogio, limite):
+    balde = _TokenBucket()
+    for _ in range(3):
+        balde.reservar()
+    assert balde.reservar() == pytest.approx(0.5)
+    assert balde.reservar() == pytest.approx(1.0)
+    stats = balde.stats()
+    assert stats['esperas'] == 2
+    assert stats['tempo_espera_total'] == pytest.approx(1.5)
+    assert stats['saturacao'] == pytest.approx(0.4)
+
+
+def test_reposicao_limitada_a_capacidade(relogio, limite):
+    balde = _TokenBucket()
+    for _ in range(3):
+        balde.reservar()
+    relogio.agora += 1.0  # Repõe 2 tokens
+    assert balde.reservar() == 0.0
+    assert balde.reservar() == 0.0
+    assert balde.reservar() == pytest.approx(0.5)
+    relogio.agora += 60  # Ocioso: no máximo `rate_limit_burst` tokens
+    assert balde.stats()['tokens_disponiveis'] == 0.0  # Só atualizado na próxima reserva
+    assert [balde.reservar() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert balde.reservar() == pytest.approx(0.5)
+
+
+def test_sem_limite(relogio, monkeypatch):
+    monkeypatch.setitem(tracking._config, 'rate_limit_per_second', 0)
+    balde = _TokenBucket()
+    assert all(balde.reservar() == 0.0 for _ in range(100))
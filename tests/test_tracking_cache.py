@@ -0,0 +1,71 @@
+# tests/test_tracking_cache.py
+import pytest
+
+from modules import tracking_cache
+from modules.tracking_cache import TrackingCache
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 1000.0
+
+    def __call__(self):
+        return self.agora
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    relogio = Relogio()
+    monkeypatch.setattr(tracking_cache.time, "time", relogio)
+    return relogio
+
+
+def test_ttl_por_status(relogio):
+    cache = TrackingCache(10, {'ENTREGUE': 100, 'EM_TRANSITO': 10}, 30)
+    cache.set('entregue', {'v': 1}, 'ENTREGUE')
+    cache.set('transito', {'v': 2}, 'EM_TRANSITO')
+    cache.set('outro', {'v': 3}, None)
+
+    relogio.agora += 20
+    assert cache.get('transito') is None
+    assert cache.get('outro') == {'v': 3}
+    relogio.agora += 20
+    assert cache.get('outro') is None
+    assert cache.get('entregue') == {'v': 1}
+    assert cache.stats()['expiradas'] == 2
+
+
+def test_ttl_zero_nao_armazena(relogio):
+    cache = TrackingCache(10, {'NAO_ENCONTRADO': 0}, 30)
+    cache.set('chave', {'v': 1}, 'NAO_ENCONTRADO')
+    assert cache.get('chave') is None
+
+
+def test_descarte_lru(relogio):
+    cache = TrackingCache(2, {}, 60)
+    cache.set('a', {'v': 'a'}, None)
+    cache.set('b', {'v': 'b'}, None)
+    assert cache.get('a') == {'v': 'a'}  # 'a' passa a ser a mais recente
+    cache.set('c', {'v': 'c'}, None)
+    assert cache.get('b') is None
+    assert cache.get('a') == {'v': 'a'}
+    assert cache.get('c') == {'v': 'c'}
+    assert cache.stats()['descartes_lru'] == 1
+
+
+def test_get_devolve_copia(relogio):
+    cache = TrackingCache(2, {}, 60)
+    cache.set('a', {'itens': [1]}, None)
+    cache.get('a')['itens'].append(2)
+    assert cache.get('a') == {'itens': [1]}
+
+
+def test_invalidate_e_clear(relogio):
+    cache = TrackingCache(10, {}, 60)
+    cache.set('a', {'v': 1}, None)
+    cache.set('b', {'v': 2}, None)
+    cache.invalidate('a')
+    assert cache.get('a') is None
+    assert cache.get('b') == {'v': 2}
+    cache.clear()
+    assert cache.get('b') is None